@@ -22,53 +22,68 @@
 import aws_cdk as cdk
 from cdk_nag import AwsSolutionsChecks, NagSuppressions
 
-from constants import PRIMARY_REGION, SECONDARY_REGION, ACCOUNT_ID
+from constants import PRIMARY_REGION, SECONDARY_REGIONS, ACCOUNT_ID, FAILBACK_REPLICATION, DEPLOYMENT_NAME_SUFFIX
 from sagemaker_domain_dr.sagemaker_domain_dr_stack import SagemakerDomainDrStack
 from ecs_dr_recovery.ecs_dr_recovery_stack import ECSTaskStack
 
 DISASTER_RECOVERY = True
 
+ECS_STACK_SUPPRESSIONS = [
+    {"id": "AwsSolutions-ECS4", "reason": "CloudWatch Container Insights not required"},
+    {"id": "AwsSolutions-IAM4", "reason": "allow managed policies"},
+    {"id": "AwsSolutions-IAM5", "reason": "wildcard required"},
+    {"id": "AwsSolutions-L1", "reason": "use specific lambda runtime"},
+    {"id": "AwsSolutions-SF1", "reason": "not all events require logging"},
+    {"id": "AwsSolutions-SF2", "reason": "X-Ray not required"}
+]
+DOMAIN_STACK_SUPPRESSIONS = [
+    {"id": "AwsSolutions-ECS4", "reason": "CloudWatch Container Insights not required"},
+    {"id": "AwsSolutions-IAM4", "reason": "allow managed policies"},
+    {"id": "AwsSolutions-IAM5", "reason": "wildcard required"},
+    {"id": "AwsSolutions-L1", "reason": "use specific lambda runtime"}
+]
+
 app = cdk.App()
 
 env_primary_region = cdk.Environment(account=ACCOUNT_ID, region=PRIMARY_REGION)
 domain_primary_stack = SagemakerDomainDrStack(
-    app, "SagemakerDomainPrimaryStack-NewStudio", env=env_primary_region
+    app, f"SagemakerDomainPrimaryStack-NewStudio{DEPLOYMENT_NAME_SUFFIX}",
+    replica_region=SECONDARY_REGIONS[0],
+    env=env_primary_region
 )
+domain_stacks = [domain_primary_stack]
+ecs_stacks = []
 
 if DISASTER_RECOVERY:
-    env_secondary_region = cdk.Environment(account=ACCOUNT_ID, region=SECONDARY_REGION)
-    domain_secondary_stack = SagemakerDomainDrStack(
-        app, "SagemakerDomainSecondaryStack-NewStudio", env=env_secondary_region
-    )
-    ecs_stack = ECSTaskStack(app, "ECSTaskStack-NewStudio", env=env_secondary_region)
+    # primary -> first secondary region -> next secondary region ...; the last one replicates back for failback
+    for index, secondary_region in enumerate(SECONDARY_REGIONS):
+        # the first secondary region keeps the stack names of a single region deployment
+        stack_suffix = DEPLOYMENT_NAME_SUFFIX + (f"-{secondary_region}" if index else "")
+        next_region = SECONDARY_REGIONS[index + 1] if index + 1 < len(SECONDARY_REGIONS) else None
+        env_secondary_region = cdk.Environment(account=ACCOUNT_ID, region=secondary_region)
+        domain_secondary_stack = SagemakerDomainDrStack(
+            app, f"SagemakerDomainSecondaryStack-NewStudio{stack_suffix}",
+            replica_region=next_region or (PRIMARY_REGION if FAILBACK_REPLICATION else None),
+            env=env_secondary_region
+        )
+        ecs_stack = ECSTaskStack(
+            app, f"ECSTaskStack-NewStudio{stack_suffix}",
+            source_region=SECONDARY_REGIONS[index - 1] if index else PRIMARY_REGION,
+            env=env_secondary_region
+        )
+        domain_stacks.append(domain_secondary_stack)
+        ecs_stacks.append(ecs_stack)
+    if FAILBACK_REPLICATION:
+        ecs_failback_stack = ECSTaskStack(
+            app, f"ECSFailbackTaskStack-NewStudio{DEPLOYMENT_NAME_SUFFIX}", failback=True,
+            source_region=SECONDARY_REGIONS[-1], env=env_primary_region
+        )
+        ecs_stacks.append(ecs_failback_stack)
 
 cdk.Aspects.of(app).add(AwsSolutionsChecks())
-NagSuppressions.add_stack_suppressions(
-    domain_primary_stack,
-    [
-        {"id": "AwsSolutions-IAM4", "reason": 'allow managed policies'},
-        {"id": "AwsSolutions-IAM5", "reason": 'wildcard required'},
-        {"id": "AwsSolutions-L1", "reason": 'use specific lambda runtime'}
-    ]
-)
-NagSuppressions.add_stack_suppressions(
-    domain_secondary_stack,
-    [
-        {"id": "AwsSolutions-IAM4", "reason": "allow managed policies"},
-        {"id": "AwsSolutions-IAM5", "reason": "wildcard required"},
-        {"id": "AwsSolutions-L1", "reason": "use specific lambda runtime"}
-    ]
-)
-NagSuppressions.add_stack_suppressions(
-    ecs_stack,
-    [
-        {"id": "AwsSolutions-ECS4", "reason": "CloudWatch Container Insights not required"},
-        {"id": "AwsSolutions-IAM4", "reason": "allow managed policies"},
-        {"id": "AwsSolutions-IAM5", "reason": "wildcard required"},
-        {"id": "AwsSolutions-L1", "reason": "use specific lambda runtime"},
-        {"id": "AwsSolutions-SF1", "reason": "not all events require logging"},
-        {"id": "AwsSolutions-SF2", "reason": "X-Ray not required"}
-    ]
-)
+for domain_stack in domain_stacks:
+    NagSuppressions.add_stack_suppressions(domain_stack, DOMAIN_STACK_SUPPRESSIONS, apply_to_nested_stacks=True)
+for ecs_stack in ecs_stacks:
+    NagSuppressions.add_stack_suppressions(ecs_stack, ECS_STACK_SUPPRESSIONS)
 
 app.synth()
@@ -0,0 +1,752 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+# End-to-end DR drill: interprets the recovery step function built by recovery_state_machine_definition(),
+# invokes the real network Lambda against stateful fake EFS/EC2 APIs, runs the recovery container's main()
+# against local directories standing in for the replica and the secondary custom EFS, then runs restore.sh
+# for every space. AWS and NFS latencies are simulated on a virtual clock, local work adds its measured time.
+# Each scenario reports the RTO, from starting the step function until the last space restore finished, and
+# the critical path through it:
+#   python benchmarks/dr_drill.py
+#   python benchmarks/dr_drill.py --scenario baseline prehydrate --set nfs_op_ms=5 mount_target_seconds=150
+# Run it from the repository root with rsync installed, like the recovery container.
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.join(os.getcwd(), "ecs_image"))
+
+from lambda_harness import NETWORK_LAMBDA, lambda_context, load_lambda  # noqa: E402
+from constants import (  # noqa: E402
+    BACKGROUND_SYNC_MAX_MIBPS,
+    BACKGROUND_SYNC_MAX_FILES_PER_SECOND,
+    BACKGROUND_SYNC_LATENCY_BACKOFF_MS,
+    SSM_PARAMETER_PREFIX,
+)
+from ecs_dr_recovery.recovery_state_machine import (  # noqa: E402
+    recovery_state_machine_definition,
+    throughput_restore_state_machine_definition,
+)
+
+CONTAINER_MAIN = "ecs_image/main.py"
+RESTORE_SCRIPT = "sagemaker_domain_dr/lifecycle_config_script/restore.sh"
+CLUSTER_ARN = "arn:aws:ecs:us-east-2:111111111111:cluster/SagemakerDomainDrTaskCluster"
+NETWORK_FUNCTION_ARN = "arn:aws:lambda:us-east-2:111111111111:function:ConfigEfsReplicaNetwork"
+THROUGHPUT_RESTORE_ARN = "arn:aws:states:us-east-2:111111111111:stateMachine:EfsThroughputRestore"
+# EFS refuses a throughput mode change or a provisioned decrease this soon after the previous change
+THROUGHPUT_CHANGE_INTERVAL_SECONDS = 24 * 60 * 60
+DEFAULT_SETTINGS = {
+    # data set of each domain: users with files in their EFS directory, and space backups
+    "domains": 1,
+    "users": 10,
+    "files_per_user": 500,
+    "spaces_per_user": 1,
+    "space_files": 2000,
+    "file_bytes": 4096,
+    # control plane
+    "api_latency_ms": 60,
+    # share of AWS API calls throttled, retried by botocore or the state machine's Retry
+    "throttle_rate": 0.0,
+    "az_count": 3,
+    "mount_target_seconds": 90,
+    "throughput_update_seconds": 5,
+    "lambda_cold_start_seconds": 1.0,
+    # Fargate provisioning and image pull
+    "task_start_seconds": 50,
+    # data plane: latency of one NFS metadata operation and file system throughput per throughput mode
+    "nfs_op_ms": 1.5,
+    "bursting_mibps": 100,
+    "elastic_mibps": 1000,
+    # until users open their spaces in the secondary domain
+    "space_start_seconds": 90,
+}
+# NFS operations rsync makes per copied file: create, write, set attributes, close
+COPY_OPS_PER_FILE = 4
+SCENARIOS = {
+    "baseline": {},
+    "prehydrate": {"input": {"prehydrate": "true"}},
+    "throughput_boost": {"input": {"boost_throughput": "elastic"}},
+    "mirror": {"input": {"mirror": "true"}},
+    # still within the network Lambda's 180s wait per mount target
+    "slow_mount_targets": {"settings": {"mount_target_seconds": 140}},
+    "throttled_control_plane": {"settings": {"throttle_rate": 0.3}},
+    "high_nfs_latency": {"settings": {"nfs_op_ms": 6}},
+    "two_domains": {"settings": {"domains": 2}},
+}
+PATH_TOKEN = re.compile(r"\.([A-Za-z_][\w-]*)|\[(\d+)\]|\[\?\(@\.(\w+) == ([^)]+)\)\]")
+INTRINSIC = re.compile(r"States\.(\w+)\((.*)\)$")
+_module_ids = itertools.count()
+
+
+class StateError(Exception):
+    def __init__(self, error, cause=""):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+
+def read_path(path, data, context):
+    """JSONPath subset the recovery state machine uses, raises KeyError/IndexError/TypeError when absent."""
+    value, rest = (context, path[2:]) if path.startswith("$$") else (data, path[1:])
+    position = 0
+    while position < len(rest):
+        match = PATH_TOKEN.match(rest, position)
+        if match is None:
+            raise NotImplementedError(f"JSONPath {path}")
+        name, index, field, literal = match.groups()
+        if name is not None:
+            value = value[name]
+        elif index is not None:
+            value = value[int(index)]
+        else:
+            value = [item for item in value if item.get(field) == json.loads(literal)]
+        position = match.end()
+    return value
+
+
+def evaluate(expression, data, context):
+    match = INTRINSIC.match(expression)
+    if match is None:
+        try:
+            return read_path(expression, data, context)
+        except (KeyError, IndexError, TypeError):
+            raise StateError("States.Runtime", f"path {expression} not found")
+    function, raw_args = match.groups()
+    args = [
+        evaluate(arg, data, context) if arg.startswith("$") else json.loads(arg)
+        for arg in (arg.strip() for arg in raw_args.split(","))
+    ]
+    if function == "JsonMerge":
+        if args[2]:
+            raise NotImplementedError("States.JsonMerge deep merge")
+        return {**args[0], **args[1]}
+    if function == "JsonToString":
+        return json.dumps(args[0], separators=(",", ":"))
+    raise NotImplementedError(f"States.{function}")
+
+
+def apply_parameters(template, data, context):
+    if isinstance(template, dict):
+        return {
+            key[:-2] if key.endswith(".$") else key:
+                evaluate(value, data, context) if key.endswith(".$") else apply_parameters(value, data, context)
+            for key, value in template.items()
+        }
+    if isinstance(template, list):
+        return [apply_parameters(value, data, context) for value in template]
+    return template
+
+
+def set_result_path(data, path, result):
+    if path is None:
+        return data
+    if path == "$":
+        return result
+    names = path[2:].split(".")
+    output = dict(data)
+    node = output
+    for name in names[:-1]:
+        node[name] = dict(node.get(name, {}))
+        node = node[name]
+    node[names[-1]] = result
+    return output
+
+
+def choice_matches(rule, data):
+    if "And" in rule:
+        return all(choice_matches(sub_rule, data) for sub_rule in rule["And"])
+    if "Or" in rule:
+        return any(choice_matches(sub_rule, data) for sub_rule in rule["Or"])
+    if "Not" in rule:
+        return not choice_matches(rule["Not"], data)
+    try:
+        value = read_path(rule["Variable"], data, {})
+        present = True
+    except (KeyError, IndexError, TypeError):
+        value, present = None, False
+    if "IsPresent" in rule:
+        return present == rule["IsPresent"]
+    if not present:
+        raise StateError("States.Runtime", f"choice variable {rule['Variable']} not found")
+    if "StringEquals" in rule:
+        return value == rule["StringEquals"]
+    if "StringEqualsPath" in rule:
+        return value == read_path(rule["StringEqualsPath"], data, {})
+    if "BooleanEquals" in rule:
+        return value is rule["BooleanEquals"]
+    raise NotImplementedError(f"choice rule {rule}")
+
+
+def error_matches(error_equals, error):
+    return "States.ALL" in error_equals or error in error_equals or (
+        "States.TaskFailed" in error_equals and error != "States.Timeout"
+    )
+
+
+def check_definition(machine):
+    # every transition names an existing state, before anything runs
+    states = machine["States"]
+    targets = [machine["StartAt"]]
+    for name, state in states.items():
+        targets += [state[key] for key in ("Next", "Default") if key in state]
+        targets += [rule["Next"] for rule in state.get("Choices", [])]
+        targets += [catcher["Next"] for catcher in state.get("Catch", [])]
+        if state["Type"] == "Map":
+            check_definition(state["ItemProcessor"])
+        elif "Next" not in state and not state.get("End") and state["Type"] not in ("Choice", "Fail", "Succeed"):
+            raise ValueError(f"state {name} has neither Next nor End")
+    missing = sorted(set(targets) - set(states))
+    if missing:
+        raise ValueError(f"transitions to undefined states {missing}")
+
+
+def tree_stats(path):
+    # (files, bytes) below path, dot entries skipped like the sync
+    files = size = 0
+    for directory, directory_names, file_names in os.walk(path):
+        directory_names[:] = [name for name in directory_names if not name.startswith(".")]
+        for file_name in file_names:
+            if not file_name.startswith("."):
+                files += 1
+                size += os.lstat(os.path.join(directory, file_name)).st_size
+    return files, size
+
+
+def make_domain(base_dir, index, settings):
+    """Local replica with users and space backups, an empty secondary custom EFS and the users.yaml index."""
+    name = f"{SSM_PARAMETER_PREFIX}{index or ''}"
+    source_dir = os.path.join(base_dir, f"replica{index}")
+    target_dir = os.path.join(base_dir, f"secondary{index}")
+    os.makedirs(target_dir)
+    users = {}
+    spaces = {}
+    for user_index in range(settings["users"]):
+        user_name = f"user{user_index:04d}"
+        for file_index in range(settings["files_per_user"]):
+            write_file(source_dir, f"{user_name}/dir{file_index // 100}/file{file_index}", settings["file_bytes"])
+        user_spaces = [f"{user_name}-space{space_index}" for space_index in range(settings["spaces_per_user"])]
+        for space in user_spaces:
+            spaces[space] = user_name
+            for file_index in range(settings["space_files"]):
+                relative_path = f"space_ebs_backup/{space}/dir{file_index // 100}/file{file_index}"
+                write_file(source_dir, relative_path, settings["file_bytes"])
+        users[user_name] = {"uid": os.getuid(), "gid": os.getgid(), "spaces": user_spaces}
+    return {
+        "name": name,
+        "source_efs_id": f"fs-0a{index:015x}",
+        "target_efs_id": f"fs-0b{index:015x}",
+        "domain_id": f"d-drill{index}",
+        "default_security_group_id": f"sg-0d{index:015x}",
+        "task_definition_arn": f"arn:aws:ecs:us-east-2:111111111111:task-definition/SagemakerDomainRecovery{index}:1",
+        # the stack only passes the users index to the container of this repository's domain
+        "prehydrate": name == SSM_PARAMETER_PREFIX,
+        "source_dir": source_dir,
+        "target_dir": target_dir,
+        "users_index": {
+            "users": users,
+            "uids": {str(os.getuid()): next(iter(users), None)},
+            "spaces": spaces,
+            "ownership": {"uids": {}, "gids": {}},
+        } if name == SSM_PARAMETER_PREFIX else None,
+    }
+
+
+def write_file(root, relative_path, size):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+
+
+class MountTargetConflict(Exception):
+    pass
+
+
+class FakeEfs:
+    """Stateful EFS control plane: mount targets become available mount_target_seconds after creation."""
+
+    def __init__(self, drill):
+        self.drill = drill
+        self.exceptions = types.SimpleNamespace(MountTargetConflict=MountTargetConflict)
+        self.mount_targets = {}
+        self.file_systems = {}
+        # file system id -> drill clock of its last throughput change
+        self.throughput_changed_at = {}
+
+    def add_file_system(self, file_system_id, with_mount_targets):
+        self.file_systems[file_system_id] = {"ThroughputMode": "bursting"}
+        self.mount_targets[file_system_id] = [
+            {
+                "MountTargetId": f"fsmt-{file_system_id[-4:]}{index:04x}",
+                "FileSystemId": file_system_id,
+                "SubnetId": f"subnet-{index:08x}",
+                "AvailabilityZoneName": f"us-east-2{chr(ord('a') + index)}",
+                "VpcId": "vpc-0d000001",
+                "available_at": 0,
+            }
+            for index in range(self.drill.settings["az_count"])
+        ] if with_mount_targets else []
+
+    def describe_mount_targets(self, FileSystemId=None, MountTargetId=None):
+        self.drill.api_call("efs.DescribeMountTargets")
+        if FileSystemId is not None:
+            mount_targets = self.mount_targets[FileSystemId]
+        else:
+            mount_targets = [
+                mount_target for mount_targets in self.mount_targets.values() for mount_target in mount_targets
+                if mount_target["MountTargetId"] == MountTargetId
+            ]
+        return {"MountTargets": [self.describe(mount_target) for mount_target in mount_targets]}
+
+    def describe(self, mount_target):
+        description = {key: value for key, value in mount_target.items() if key != "available_at"}
+        description["LifeCycleState"] = "available" if self.drill.clock >= mount_target["available_at"] else "creating"
+        return description
+
+    def describe_mount_target_security_groups(self, MountTargetId):
+        self.drill.api_call("efs.DescribeMountTargetSecurityGroups")
+        return {"SecurityGroups": ["sg-0d000001"]}
+
+    def create_mount_target(self, FileSystemId, SubnetId, SecurityGroups):
+        self.drill.api_call("efs.CreateMountTarget")
+        if any(mount_target["SubnetId"] == SubnetId for mount_target in self.mount_targets[FileSystemId]):
+            raise MountTargetConflict(SubnetId)
+        target = next(
+            mount_target for mount_targets in self.mount_targets.values() for mount_target in mount_targets
+            if mount_target["SubnetId"] == SubnetId
+        )
+        mount_target = dict(
+            target,
+            MountTargetId=f"fsmt-{FileSystemId[-4:]}{SubnetId[-4:]}",
+            FileSystemId=FileSystemId,
+            available_at=self.drill.clock + self.drill.settings["mount_target_seconds"],
+        )
+        self.mount_targets[FileSystemId].append(mount_target)
+        return self.describe(mount_target)
+
+    def throughput_mibps(self, file_system_id):
+        file_system = self.file_systems[file_system_id]
+        if file_system["ThroughputMode"] == "provisioned":
+            return file_system["ProvisionedThroughputInMibps"]
+        return self.drill.settings[f"{file_system['ThroughputMode']}_mibps"]
+
+
+class FakeEc2:
+    def __init__(self, drill):
+        self.drill = drill
+
+    def describe_security_groups(self, GroupNames):
+        self.drill.api_call("ec2.DescribeSecurityGroups")
+        return {"SecurityGroups": [{"GroupId": f"sg-0d{index:015x}"} for index in range(len(GroupNames))]}
+
+
+class Drill:
+    """Virtual clock, fake AWS services and local file systems of one scenario run."""
+
+    def __init__(self, settings, seed, base_dir):
+        self.settings = settings
+        self.random = random.Random(seed)
+        self.clock = 0.0
+        self.api_calls = 0
+        self.throttles = 0
+        self.efs = FakeEfs(self)
+        self.ec2 = FakeEc2(self)
+        self.network_lambda = None
+        # inputs of the throughput restore executions the recovery started
+        self.started_restores = []
+        self.domains = [make_domain(base_dir, index, settings) for index in range(settings["domains"])]
+        for domain in self.domains:
+            self.efs.add_file_system(domain["source_efs_id"], with_mount_targets=False)
+            self.efs.add_file_system(domain["target_efs_id"], with_mount_targets=True)
+
+    def api_call(self, operation):
+        # botocore adaptive retries: full jitter backoff on throttling, at most 8 attempts
+        self.api_calls += 1
+        self.clock += self.settings["api_latency_ms"] / 1000
+        for attempt in range(1, 8):
+            if self.random.random() >= self.settings["throttle_rate"]:
+                return
+            self.throttles += 1
+            self.clock += self.random.random() * min(20, 2 ** attempt) + self.settings["api_latency_ms"] / 1000
+        raise StateError("ThrottlingException", f"{operation} throttled 8 times")
+
+    def sleep(self, seconds):
+        self.clock += seconds
+
+    def throttled(self, error):
+        # control-plane calls made by Step Functions itself, retried by the state's Retry
+        if self.random.random() < self.settings["throttle_rate"]:
+            self.throttles += 1
+            raise StateError(error, "Rate exceeded")
+
+    def run_states(self, machine, data, context):
+        """Run a state machine or Map iteration from self.clock, returns (output, critical path entries)."""
+        path = []
+        name = machine["StartAt"]
+        while True:
+            state = machine["States"][name]
+            started_at = self.clock
+            detail = ""
+            next_name = state.get("Next")
+            if state["Type"] == "Pass":
+                result = apply_parameters(state["Parameters"], data, context) if "Parameters" in state \
+                    else state.get("Result", data)
+                data = set_result_path(data, state.get("ResultPath", "$"), result)
+            elif state["Type"] == "Choice":
+                next_name = next(
+                    (rule["Next"] for rule in state["Choices"] if choice_matches(rule, data)), state.get("Default")
+                )
+                if next_name is None:
+                    raise StateError("States.NoChoiceMatched", name)
+            elif state["Type"] == "Task":
+                data, next_name, detail = self.run_task(state, data, context)
+            elif state["Type"] == "Map":
+                data, map_path = self.run_map(state, data, context)
+                path += map_path
+            elif state["Type"] == "Wait":
+                self.clock += state["Seconds"]
+            elif state["Type"] == "Fail":
+                raise StateError(state["Error"], state.get("Cause", ""))
+            elif state["Type"] == "Succeed":
+                return data, path
+            else:
+                raise NotImplementedError(f"state type {state['Type']}")
+            if state["Type"] != "Map":
+                path.append((name, self.clock - started_at, detail))
+            if state.get("End"):
+                return data, path
+            name = next_name
+
+    def run_map(self, state, data, context):
+        # iterations take the earliest free of MaxConcurrency slots, the one ending last is on the critical path
+        started_at = self.clock
+        items = evaluate(state["ItemsPath"], data, context)
+        slots = [started_at] * (state.get("MaxConcurrency") or len(items) or 1)
+        results = []
+        critical = (started_at, [])
+        for index, item in enumerate(items):
+            slot = slots.index(min(slots))
+            self.clock = slots[slot]
+            item_context = dict(context, Map={"Item": {"Index": index, "Value": item}})
+            item_input = apply_parameters(state["ItemSelector"], data, item_context) if "ItemSelector" in state \
+                else item
+            item_started_at = self.clock
+            result, item_path = self.run_states(state["ItemProcessor"], item_input, item_context)
+            results.append(result)
+            slots[slot] = self.clock
+            label = item.get("name", index) if isinstance(item, dict) else index
+            item_path = [(f"{state_name} [{label}]", seconds, detail) for state_name, seconds, detail in item_path]
+            if item_started_at > started_at:
+                item_path.insert(0, (f"waiting for a Map slot [{label}]", item_started_at - started_at, ""))
+            if self.clock >= critical[0]:
+                critical = (self.clock, item_path)
+        self.clock = max(slots)
+        return set_result_path(data, state.get("ResultPath", "$"), results), critical[1]
+
+    def run_task(self, state, data, context):
+        parameters = apply_parameters(state.get("Parameters", {}), data, context)
+        attempts = {}
+        while True:
+            try:
+                result, detail = self.call_resource(state["Resource"], parameters)
+                break
+            except StateError as error:
+                retrier = next(
+                    (index for index, retrier in enumerate(state.get("Retry", []))
+                     if error_matches(retrier["ErrorEquals"], error.error)),
+                    None
+                )
+                if retrier is not None and attempts.get(retrier, 0) < state["Retry"][retrier].get("MaxAttempts", 3):
+                    self.clock += self.retry_delay(state["Retry"][retrier], attempts.get(retrier, 0))
+                    attempts[retrier] = attempts.get(retrier, 0) + 1
+                    continue
+                catcher = next(
+                    (catcher for catcher in state.get("Catch", [])
+                     if error_matches(catcher["ErrorEquals"], error.error)),
+                    None
+                )
+                if catcher is None:
+                    raise
+                output = set_result_path(
+                    data, catcher.get("ResultPath", "$"), {"Error": error.error, "Cause": error.cause}
+                )
+                return output, catcher["Next"], f"caught {error.error}: {error.cause}"
+        if "ResultSelector" in state:
+            result = apply_parameters(state["ResultSelector"], result, context)
+        return set_result_path(data, state.get("ResultPath", "$"), result), state.get("Next"), detail
+
+    def retry_delay(self, retrier, attempt):
+        delay = retrier.get("IntervalSeconds", 1) * retrier.get("BackoffRate", 2.0) ** attempt
+        delay = min(delay, retrier.get("MaxDelaySeconds", math.inf))
+        return self.random.random() * delay if retrier.get("JitterStrategy") == "FULL" else delay
+
+    def call_resource(self, resource, parameters):
+        if resource == "arn:aws:states:::lambda:invoke":
+            self.throttled("Lambda.TooManyRequestsException")
+            return {"Payload": self.invoke_network_lambda(parameters["Payload"])}, ""
+        if resource == "arn:aws:states:::aws-sdk:efs:describeFileSystems":
+            self.throttled("Efs.ThrottlingException")
+            self.clock += self.settings["api_latency_ms"] / 1000
+            file_system_id = parameters["FileSystemId"]
+            return {"FileSystems": [dict(self.efs.file_systems[file_system_id], FileSystemId=file_system_id)]}, ""
+        if resource == "arn:aws:states:::aws-sdk:efs:updateFileSystem":
+            self.throttled("Efs.ThrottlingException")
+            changed_at = self.efs.throughput_changed_at.get(parameters["FileSystemId"])
+            if changed_at is not None and self.clock - changed_at < THROUGHPUT_CHANGE_INTERVAL_SECONDS:
+                raise StateError("Efs.TooManyRequestsException", "throughput changed less than 24 hours ago")
+            self.clock += self.settings["throughput_update_seconds"]
+            self.efs.throughput_changed_at[parameters["FileSystemId"]] = self.clock
+            file_system = self.efs.file_systems[parameters["FileSystemId"]]
+            file_system.update({key: value for key, value in parameters.items() if key != "FileSystemId"})
+            return {"ThroughputMode": file_system["ThroughputMode"]}, parameters["ThroughputMode"]
+        if resource == "arn:aws:states:::states:startExecution":
+            # runs on its own after the recovery, see run_started_restores
+            self.started_restores.append(parameters["Input"])
+            return {"ExecutionArn": f"{parameters['StateMachineArn']}:drill-{len(self.started_restores)}"}, ""
+        if resource == "arn:aws:states:::ecs:runTask.sync":
+            self.throttled("ECS.ThrottlingException")
+            return self.run_container(parameters)
+        raise NotImplementedError(f"task resource {resource}")
+
+    def run_started_restores(self):
+        """Throughput mode of every target EFS after the restore executions finished, off the RTO clock."""
+        recovery_clock = self.clock
+        machine = throughput_restore_state_machine_definition()
+        check_definition(machine)
+        for restore_input in self.started_restores:
+            self.run_states(machine, restore_input, {})
+        self.clock = recovery_clock
+        return {
+            domain["target_efs_id"]: self.efs.file_systems[domain["target_efs_id"]]["ThroughputMode"]
+            for domain in self.domains
+        }
+
+    def invoke_network_lambda(self, payload):
+        if self.network_lambda is None:
+            self.network_lambda = load_lambda(NETWORK_LAMBDA)
+            self.network_lambda.time = types.SimpleNamespace(sleep=self.sleep)
+            sys.modules["aws_clients"]._clients.update({"efs": self.efs, "ec2": self.ec2})
+            self.clock += self.settings["lambda_cold_start_seconds"]
+        started_at = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return self.network_lambda.lambda_handler(payload, lambda_context())
+        except StateError:
+            raise
+        except Exception as e:
+            raise StateError(type(e).__name__, str(e))
+        finally:
+            self.clock += time.perf_counter() - started_at
+
+    def run_container(self, parameters):
+        domain = next(
+            domain for domain in self.domains if domain["task_definition_arn"] == parameters["TaskDefinition"]
+        )
+        environment = {
+            name: str(value) for name, value in (
+                ("DR_MAX_MIBPS", BACKGROUND_SYNC_MAX_MIBPS),
+                ("DR_MAX_FILES_PER_SECOND", BACKGROUND_SYNC_MAX_FILES_PER_SECOND),
+                ("DR_LATENCY_BACKOFF_MS", BACKGROUND_SYNC_LATENCY_BACKOFF_MS),
+            ) if value
+        }
+        for override in parameters["Overrides"]["ContainerOverrides"]:
+            environment.update({variable["Name"]: variable["Value"] for variable in override["Environment"]})
+        self.clock += self.settings["task_start_seconds"]
+        mode = environment.get("DR_SYNC_MODE", "full")
+        source_dir = domain["source_dir"]
+        target_dir = domain["target_dir"]
+        files_before, bytes_before = tree_stats(target_dir)
+        saved_environment = dict(os.environ)
+        os.environ.update(environment)
+        try:
+            spec = importlib.util.spec_from_file_location(f"drill_container_{next(_module_ids)}", CONTAINER_MAIN)
+            container = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(container)
+            container.SOURCE_DIR = f"{source_dir}/"
+            container.TARGET_DIR = f"{target_dir}/"
+            container.USERS_INDEX = domain["users_index"]
+            started_at = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                container.main()
+        except Exception as e:
+            raise StateError("States.TaskFailed", f"{type(e).__name__}: {e}")
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_environment)
+        local_seconds = time.perf_counter() - started_at
+        throughput = self.efs.throughput_mibps(domain["target_efs_id"])
+        if mode == "prehydrate":
+            # every backup file is opened and read once, the archives written back, workers in parallel
+            backups = [
+                tree_stats(os.path.join(target_dir, "space_ebs_backup", space))
+                for space in domain["users_index"]["spaces"]
+            ]
+            files = sum(backup[0] for backup in backups)
+            _, archive_bytes = tree_stats(os.path.join(target_dir, ".sagemaker-dr", "prehydrated"))
+            ops = 2 * files + len(backups)
+            moved_bytes = sum(backup[1] for backup in backups) + archive_bytes
+            parallelism = max(1, min(container.PREHYDRATE_WORKERS, len(backups)))
+        else:
+            # every replica file is stat'ed in the source and looked up in the target, copies cost a few more
+            source_files, _ = tree_stats(source_dir)
+            files_after, bytes_after = tree_stats(target_dir)
+            files = files_after - files_before
+            ops = 2 * source_files + COPY_OPS_PER_FILE * files
+            moved_bytes = bytes_after - bytes_before
+            parallelism = 1
+        modelled_seconds = ops * self.settings["nfs_op_ms"] / 1000 / parallelism + moved_bytes / 2 ** 20 / throughput
+        self.clock += local_seconds + modelled_seconds
+        detail = (
+            f"task start {self.settings['task_start_seconds']}s, {mode}: {files} files, {ops} NFS ops, "
+            f"{moved_bytes / 2 ** 20:.1f} MiB at {throughput} MiB/s, local work {local_seconds:.1f}s"
+        )
+        return {}, detail
+
+    def restore_spaces(self, home_dir):
+        """Run restore.sh for every space as its owner opens it, returns (seconds of the slowest, its label)."""
+        slowest = (0.0, "")
+        for domain in self.domains:
+            spaces = (domain["users_index"] or {}).get("spaces", {})
+            throughput = self.efs.throughput_mibps(domain["target_efs_id"])
+            for space in spaces:
+                space_home = os.path.join(home_dir, domain["domain_id"], space)
+                efs_link = os.path.join(space_home, "custom-file-systems", "efs", domain["target_efs_id"])
+                os.makedirs(os.path.dirname(efs_link))
+                os.symlink(domain["target_dir"], efs_link)
+                started_at = time.perf_counter()
+                subprocess.run(
+                    ["bash", os.path.abspath(RESTORE_SCRIPT)], cwd=space_home, check=True, capture_output=True,
+                    env=dict(os.environ, SAGEMAKER_SPACE_NAME=space),
+                )
+                local_seconds = time.perf_counter() - started_at
+                staged = [
+                    os.path.join(domain["target_dir"], ".sagemaker-dr", "prehydrated", f"{space}.{extension}")
+                    for extension in ("tar.zst", "tar.gz")
+                ]
+                staged = [path for path in staged if os.path.exists(path)]
+                if staged:
+                    ops, read_bytes = 1, os.path.getsize(staged[0])
+                else:
+                    files, read_bytes = tree_stats(os.path.join(domain["target_dir"], "space_ebs_backup", space))
+                    ops = COPY_OPS_PER_FILE * files
+                # all spaces restore at once and share the file system throughput
+                seconds = local_seconds + ops * self.settings["nfs_op_ms"] / 1000 \
+                    + read_bytes / 2 ** 20 / (throughput / len(spaces))
+                if seconds >= slowest[0]:
+                    mode = "prehydrated archive" if staged else "file copy"
+                    slowest = (seconds, f"restore.sh [{space}]: {mode}, {ops} NFS ops, {read_bytes / 2 ** 20:.1f} MiB")
+        return slowest
+
+
+def run_drill(name, settings, execution_input, seed):
+    base_dir = tempfile.mkdtemp(prefix="dr-drill-")
+    try:
+        drill = Drill(settings, seed, base_dir)
+        machine = recovery_state_machine_definition(
+            [
+                {key: value for key, value in domain.items() if key not in ("source_dir", "target_dir", "users_index")}
+                for domain in drill.domains
+            ],
+            CLUSTER_ARN,
+            NETWORK_FUNCTION_ARN,
+            THROUGHPUT_RESTORE_ARN,
+        )
+        check_definition(machine)
+        try:
+            _, path = drill.run_states(machine, {}, {"Execution": {"Input": execution_input}})
+        except StateError as error:
+            # users cannot work in the secondary domain, there is no RTO to report
+            return {
+                "scenario": name,
+                "status": f"failed with {error.error}: {error.cause}",
+                "rto_seconds": None,
+                "step_function_seconds": round(drill.clock, 1),
+                "api_calls": drill.api_calls,
+                "throttles": drill.throttles,
+                "critical_path": [],
+            }
+        step_function_seconds = drill.clock
+        throughput_modes = drill.run_started_restores()
+        restore_seconds, restore_label = drill.restore_spaces(os.path.join(base_dir, "spaces"))
+        if restore_label:
+            path += [("space start", settings["space_start_seconds"], ""), (restore_label, restore_seconds, "")]
+        return {
+            "scenario": name,
+            "status": "succeeded",
+            "rto_seconds": round(sum(seconds for _, seconds, _ in path), 1),
+            "step_function_seconds": round(step_function_seconds, 1),
+            "slowest_restore_seconds": round(restore_seconds, 1),
+            "final_throughput_modes": throughput_modes,
+            "api_calls": drill.api_calls,
+            "throttles": drill.throttles,
+            "critical_path": [
+                {"step": step, "seconds": round(seconds, 2), "detail": detail} for step, seconds, detail in path
+            ],
+        }
+    finally:
+        shutil.rmtree(base_dir)
+
+
+def parse_setting(assignment):
+    key, _, value = assignment.partition("=")
+    if key not in DEFAULT_SETTINGS:
+        raise argparse.ArgumentTypeError(f"unknown setting {key}, valid settings are {', '.join(DEFAULT_SETTINGS)}")
+    return key, json.loads(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a recovery end to end and report its RTO critical path")
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--set", nargs="+", type=parse_setting, default=[], metavar="KEY=VALUE",
+                        help="override a simulation setting in every scenario")
+    parser.add_argument("--input", type=json.loads, default={}, help="execution input merged into each scenario's")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="one JSON result per line")
+    args = parser.parse_args()
+    if shutil.which("rsync") is None:
+        parser.error("rsync is required, the recovery container and restore.sh run it")
+    for scenario_name in args.scenario:
+        scenario = SCENARIOS[scenario_name]
+        settings = {**DEFAULT_SETTINGS, **scenario.get("settings", {}), **dict(args.set)}
+        result = run_drill(scenario_name, settings, {**scenario.get("input", {}), **args.input}, args.seed)
+        if args.json:
+            print(json.dumps(result))
+            continue
+        if result["rto_seconds"] is None:
+            print(f"{scenario_name}: {result['status']} after {result['step_function_seconds']}s")
+            continue
+        print(f"{scenario_name}: RTO {result['rto_seconds']}s, step function {result['step_function_seconds']}s, "
+              f"slowest restore {result['slowest_restore_seconds']}s, {result['api_calls']} API calls, "
+              f"{result['throttles']} throttled, throughput after restore {result['final_throughput_modes']}")
+        for step in result["critical_path"]:
+            print(f"  {step['seconds']:>9.2f}s  {step['step']}" + (f"  ({step['detail']})" if step["detail"] else ""))
@@ -0,0 +1,392 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+# Runs the Lambda handlers offline: botocore Stubber fakes the AWS APIs and a temp directory stands in for
+# the /mnt/efs mount. Each scenario reports wall time and API calls per operation:
+#   python benchmarks/lambda_harness.py
+#   python benchmarks/lambda_harness.py --scenario network_many_azs --repeat 5 --json
+# Run it from the repository root.
+
+import argparse
+import collections
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+SOURCE_EFS_ID = "fs-0a0000000000000a1"
+TARGET_EFS_ID = "fs-0b0000000000000b2"
+ENVIRONMENT = {
+    "AWS_DEFAULT_REGION": "us-east-2",
+    "AWS_ACCESS_KEY_ID": "harness",
+    "AWS_SECRET_ACCESS_KEY": "harness",
+    "AWS_LAMBDA_FUNCTION_NAME": "harness",
+    "EFS_ID": TARGET_EFS_ID,
+    "DOMAIN_ID": "d-harness",
+}
+os.environ.update(ENVIRONMENT)
+# the domain/EFS pair the recovery step function passes to the network Lambda
+NETWORK_EVENT = {
+    "domain": {
+        "source_efs_id": SOURCE_EFS_ID,
+        "target_efs_id": TARGET_EFS_ID,
+        "domain_id": "d-harness",
+        "default_security_group_id": "sg-0e0000005",
+    }
+}
+sys.path.insert(0, os.path.join(os.getcwd(), "lambda_layers", "instrumentation", "python"))
+sys.path.insert(0, os.path.join(os.getcwd(), "lambda_layers", "repermission", "python"))
+
+NETWORK_LAMBDA = "ecs_dr_recovery/config_efs_replica_network_lambda/config_efs_replica_network.py"
+SECURITY_GROUP_LAMBDA = "sagemaker_domain_dr/modify_efs_security_group/modify_efs_sg.py"
+USER_DIRECTORY_LAMBDA = "sagemaker_domain_dr/create_user_directory_lambda/create_user_directory.py"
+# shared modules of the Lambda layer, imported by every handler
+LAYER_MODULES = ("aws_clients", "instrumentation", "repermission")
+_module_ids = itertools.count()
+
+
+def load_lambda(path):
+    # a fresh module and fresh layer modules per run, so clients and caches start cold like a new
+    # execution environment
+    for layer_module in LAYER_MODULES:
+        sys.modules.pop(layer_module, None)
+    spec = importlib.util.spec_from_file_location(f"harness_lambda_{next(_module_ids)}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def lambda_context():
+    return types.SimpleNamespace(
+        aws_request_id="harness",
+        function_name="harness",
+        get_remaining_time_in_millis=lambda: 900 * 1000,
+    )
+
+
+class Run:
+    """Stubbed clients, API call counts, timings and the simulated sleep time of one scenario run."""
+
+    def __init__(self):
+        self.api_calls = collections.Counter()
+        self.stubbers = []
+        self.slept_seconds = 0
+        self.import_seconds = 0
+        self.client_seconds = 0
+        self.invocation_seconds = []
+
+    def load(self, path):
+        started_at = time.perf_counter()
+        module = load_lambda(path)
+        self.import_seconds = time.perf_counter() - started_at
+        return module
+
+    def client(self, service_name):
+        # the Lambda's own client factory builds the client, the harness stubs its responses
+        started_at = time.perf_counter()
+        client = sys.modules["aws_clients"].client(service_name)
+        self.client_seconds += time.perf_counter() - started_at
+        # after-call, a stubbed response short-circuits the before-call handlers registered after the Stubber's
+        client.meta.events.register("after-call", self.count_call)
+        from botocore.stub import Stubber
+
+        stubber = Stubber(client)
+        self.stubbers.append(stubber)
+        return stubber
+
+    def count_call(self, model, **kwargs):
+        self.api_calls[f"{model.service_model.service_name}.{model.name}"] += 1
+
+    def sleep(self, seconds):
+        self.slept_seconds += seconds
+
+    def invoke(self, handler, event):
+        # only the handler invocations count, not building the fixtures
+        started_at = time.perf_counter()
+        result = handler(event, lambda_context())
+        self.invocation_seconds.append(time.perf_counter() - started_at)
+        return result
+
+    def __enter__(self):
+        for stubber in self.stubbers:
+            stubber.activate()
+        return self
+
+    def __exit__(self, *exc_info):
+        for stubber in self.stubbers:
+            stubber.deactivate()
+        if exc_info[0] is None:
+            for stubber in self.stubbers:
+                stubber.assert_no_pending_responses()
+
+
+def mount_target(index, file_system_id, state="available"):
+    return {
+        "MountTargetId": f"fsmt-{file_system_id[-4:]}{index:04x}",
+        "FileSystemId": file_system_id,
+        "SubnetId": f"subnet-{index:08x}",
+        "LifeCycleState": state,
+        "AvailabilityZoneName": f"us-east-2{chr(ord('a') + index)}",
+        "VpcId": "vpc-0e000001",
+    }
+
+
+def network_scenario(az_count, conflict=False, pending_polls=0, invocations=1):
+    def scenario(run):
+        module = run.load(NETWORK_LAMBDA)
+        efs = run.client("efs")
+        ec2 = run.client("ec2")
+        module.time = types.SimpleNamespace(sleep=run.sleep)
+        target_mount_targets = [mount_target(i, TARGET_EFS_ID) for i in range(az_count)]
+        for _ in range(invocations):
+            efs.add_response("describe_mount_targets", {"MountTargets": target_mount_targets})
+            for index in range(az_count):
+                efs.add_response("describe_mount_target_security_groups", {"SecurityGroups": ["sg-0e0000001"]})
+                if conflict:
+                    efs.add_client_error("create_mount_target", service_error_code="MountTargetConflict",
+                                         http_status_code=409)
+                    # is_mount_target_valid compares the existing source mount target with the target one
+                    efs.add_response("describe_mount_targets", {"MountTargets": target_mount_targets})
+                    efs.add_response("describe_mount_target_security_groups", {"SecurityGroups": ["sg-0e0000001"]})
+                    efs.add_response("describe_mount_targets", {
+                        "MountTargets": [mount_target(i, SOURCE_EFS_ID) for i in range(az_count)]
+                    })
+                    efs.add_response("describe_mount_target_security_groups", {"SecurityGroups": ["sg-0e0000001"]})
+                    continue
+                source_mount_target = mount_target(index, SOURCE_EFS_ID, "creating" if pending_polls else "available")
+                efs.add_response("create_mount_target", source_mount_target)
+                for poll in range(pending_polls):
+                    state = "available" if poll == pending_polls - 1 else "creating"
+                    efs.add_response("describe_mount_targets", {
+                        "MountTargets": [mount_target(index, SOURCE_EFS_ID, state)]
+                    })
+            ec2.add_response("describe_security_groups", {
+                "SecurityGroups": [{"GroupId": "sg-0e0000002"}, {"GroupId": "sg-0e0000003"}]
+            })
+        with run:
+            for _ in range(invocations):
+                result = run.invoke(module.lambda_handler, NETWORK_EVENT)
+                assert len(result["body"]["ecs_task_subnets"]) == az_count
+    return scenario
+
+
+def security_group_scenario(az_count):
+    def scenario(run):
+        module = run.load(SECURITY_GROUP_LAMBDA)
+        efs = run.client("efs")
+        ec2 = run.client("ec2")
+        efs.add_response("describe_mount_targets", {
+            "MountTargets": [mount_target(i, TARGET_EFS_ID) for i in range(az_count)]
+        })
+        ec2.add_response("describe_security_groups", {"SecurityGroups": [{"GroupId": "sg-0e0000004"}]})
+        for _ in range(az_count):
+            efs.add_response("describe_mount_target_security_groups", {"SecurityGroups": ["sg-0e0000001"]})
+            efs.add_response("modify_mount_target_security_groups", {})
+        with run:
+            run.invoke(module.lambda_handler, {})
+    return scenario
+
+
+def user_directory_scenario(user_directories, files_per_user=0, non_recursive=False):
+    def scenario(run):
+        module = run.load(USER_DIRECTORY_LAMBDA)
+        efs_dir = tempfile.mkdtemp(prefix="harness-efs-")
+        try:
+            module.MOUNT_POINT = efs_dir
+            module.DELETED_DIRECTORY = os.path.join(efs_dir, "deleted")
+            module.EBS_BACKUP_DIRECTORY = os.path.join(efs_dir, "space_ebs_backup")
+            module.NON_RECURSIVE_USER_DIRECTORIES = non_recursive
+            module.USERS_INDEX = {
+                "users": {"harness-user": {"uid": 20001, "gid": 20001, "spaces": []}},
+                "uids": {"20001": "harness-user"},
+                "spaces": {},
+            }
+            for index in range(user_directories):
+                os.mkdir(os.path.join(efs_dir, f"user{index:05d}"))
+            # an existing tree, e.g. a profile re-created over restored data
+            user_dir = os.path.join(efs_dir, "harness-user")
+            for index in range(files_per_user):
+                if index % 100 == 0:
+                    sub_dir = os.path.join(user_dir, f"dir{index // 100}")
+                    os.makedirs(sub_dir)
+                open(os.path.join(sub_dir, f"file{index}"), "w").close()
+            request_parameters = {
+                "domainId": "d-harness",
+                "userProfileName": "harness-user",
+                "userSettings": {"customPosixUserConfig": {"uid": 20001, "gid": 20001}},
+            }
+            with run:
+                for event_name in ("CreateUserProfile", "DeleteUserProfile"):
+                    run.invoke(
+                        module.lambda_handler,
+                        {"id": event_name, "detail": {"eventName": event_name, "requestParameters": request_parameters}},
+                    )
+            assert os.path.isdir(os.path.join(module.DELETED_DIRECTORY, "harness-user"))
+        finally:
+            shutil.rmtree(efs_dir)
+    return scenario
+
+
+def user_posix_update_scenario(files_per_user, spaces=2, invocations=2):
+    # UpdateUserProfile with a new uid:gid, the second invocation finds nothing left to re-own
+    def scenario(run):
+        module = run.load(USER_DIRECTORY_LAMBDA)
+        efs_dir = tempfile.mkdtemp(prefix="harness-efs-")
+        try:
+            module.MOUNT_POINT = efs_dir
+            module.EBS_BACKUP_DIRECTORY = os.path.join(efs_dir, "space_ebs_backup")
+            space_names = [f"harness-space{index}" for index in range(spaces)]
+            module.USERS_INDEX = {
+                "users": {"harness-user": {"uid": 20002, "gid": 20002, "spaces": space_names}},
+                "uids": {"20002": "harness-user"},
+                "spaces": {space_name: "harness-user" for space_name in space_names},
+            }
+            roots = [os.path.join(efs_dir, "harness-user")]
+            roots += [os.path.join(module.EBS_BACKUP_DIRECTORY, space_name) for space_name in space_names]
+            for root_index, root in enumerate(roots):
+                for index in range(files_per_user // len(roots)):
+                    if index % 100 == 0:
+                        sub_dir = os.path.join(root, f"dir{index // 100}")
+                        os.makedirs(sub_dir)
+                    path = os.path.join(sub_dir, f"file{index}")
+                    open(path, "w").close()
+                    # a few entries already carry the new identity
+                    if index % 10 == root_index:
+                        os.chown(path, 20002, 20002)
+            request_parameters = {
+                "domainId": "d-harness",
+                "userProfileName": "harness-user",
+                "userSettings": {"customPosixUserConfig": {"uid": 20002, "gid": 20002}},
+            }
+            with run:
+                for _ in range(invocations):
+                    run.invoke(
+                        module.lambda_handler,
+                        {"id": "UpdateUserProfile",
+                         "detail": {"eventName": "UpdateUserProfile", "requestParameters": request_parameters}},
+                    )
+            for root in roots:
+                for dir_path, dir_names, file_names in os.walk(root):
+                    for name in [dir_path] + [os.path.join(dir_path, name) for name in file_names]:
+                        stat_info = os.lstat(name)
+                        assert (stat_info.st_uid, stat_info.st_gid) == (20002, 20002), name
+            assert not os.path.exists(os.path.join(efs_dir, ".sagemaker-dr", "repermission-harness-user.json"))
+        finally:
+            shutil.rmtree(efs_dir)
+    return scenario
+
+
+SCENARIOS = {
+    "network_single_az": network_scenario(1),
+    "network_many_azs": network_scenario(6),
+    "network_mount_target_conflict": network_scenario(3, conflict=True),
+    "network_slow_mount_targets": network_scenario(3, pending_polls=4),
+    "network_cold_and_warm": network_scenario(3, invocations=2),
+    "security_group_many_azs": security_group_scenario(6),
+    "user_directory_10k_users": user_directory_scenario(10000),
+    "user_directory_existing_tree": user_directory_scenario(100, files_per_user=20000),
+    "user_directory_non_recursive": user_directory_scenario(100, files_per_user=20000, non_recursive=True),
+    "user_directory_posix_update": user_posix_update_scenario(20000),
+}
+
+
+def run_scenario(name, repeat, verbose=False):
+    best = None
+    for _ in range(repeat):
+        run = Run()
+        # the EMF lines the instrumentation layer prints at the end of every invocation
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            SCENARIOS[name](run)
+        wall_seconds = sum(run.invocation_seconds)
+        if best is None or wall_seconds < best["wall_seconds"]:
+            best = {
+                "scenario": name,
+                "wall_seconds": round(wall_seconds, 4),
+                "import_seconds": round(run.import_seconds, 4),
+                "client_seconds": round(run.client_seconds, 4),
+                "first_invocation_seconds": round(run.invocation_seconds[0], 4),
+                "warm_invocation_seconds": round(min(run.invocation_seconds[1:]), 4)
+                if len(run.invocation_seconds) > 1 else None,
+                "api_calls": sum(run.api_calls.values()),
+                "api_calls_by_operation": dict(run.api_calls),
+                "simulated_sleep_seconds": run.slept_seconds,
+            }
+    return best
+
+
+def measure_init(path, service_names):
+    # run in a fresh interpreter by cold_start(), nothing but the Lambda and its layer imported yet
+    started_at = time.perf_counter()
+    load_lambda(path)
+    import_seconds = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    for service_name in service_names:
+        sys.modules["aws_clients"].client(service_name)
+    return {"import_seconds": round(import_seconds, 4), "client_seconds": round(time.perf_counter() - started_at, 4)}
+
+
+def cold_start():
+    results = {}
+    for path, service_names in ((NETWORK_LAMBDA, ["efs", "ec2"]), (SECURITY_GROUP_LAMBDA, ["efs", "ec2"])):
+        output = subprocess.run(
+            [sys.executable, __file__, "--measure-init", path, *service_names],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results[os.path.basename(path)] = json.loads(output.splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure-init":
+        print(json.dumps(measure_init(sys.argv[2], sys.argv[3:])))
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Run the Lambda handlers offline against stubbed AWS APIs")
+    parser.add_argument("--scenario", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="one JSON result per line")
+    parser.add_argument("--verbose", action="store_true", help="keep the Lambdas' own log lines")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="also time import and client creation of each Lambda in a fresh interpreter")
+    args = parser.parse_args()
+    # the Lambda runtime's log handler, the Lambdas set INFO on the root logger themselves
+    logging.basicConfig(format="%(message)s")
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    for scenario_name in args.scenario:
+        result = run_scenario(scenario_name, args.repeat, args.verbose)
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"{scenario_name}: {result['wall_seconds']:.3f}s (import {result['import_seconds']:.3f}s, "
+                  f"clients {result['client_seconds']:.3f}s, first {result['first_invocation_seconds']:.3f}s, "
+                  f"warm {result['warm_invocation_seconds']}), {result['api_calls']} API calls, "
+                  f"{result['simulated_sleep_seconds']}s simulated waits {result['api_calls_by_operation']}")
+    if args.cold_start:
+        for lambda_file, result in cold_start().items():
+            print(json.dumps({"cold_start": lambda_file, **result}) if args.json else
+                  f"cold start {lambda_file}: import {result['import_seconds']:.3f}s, "
+                  f"clients {result['client_seconds']:.3f}s")
@@ -0,0 +1,119 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+# Measures `cdk synth` cost for large users.yaml files:
+#   python benchmarks/synth_benchmark.py --users 1000 5000
+# Run it from the repository root, like `cdk synth`.
+
+import argparse
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.getcwd())
+
+from users_config import (  # noqa: E402
+    MAX_LIFECYCLE_CONFIG_CONTENT,
+    SafeLoader,
+    compile_sync_rules,
+    parse_users_config,
+    render_sync_rules,
+)
+
+BACKUP_SCRIPT = "sagemaker_domain_dr/lifecycle_config_script/backup.sh"
+
+
+def synthetic_users_file(user_count):
+    users = {}
+    for index in range(user_count):
+        user_name = f"user{index:05d}"
+        users[user_name] = {
+            "CustomPosix": f"{30000 + index}:{30000 + index}",
+            "Spaces": {
+                f"{user_name}-jupyterlab": {"type": "JupyterLab"},
+                f"{user_name}-codeeditor": {"type": "CodeEditor"},
+            },
+        }
+        if index % 50 == 0:
+            users[user_name]["SyncRules"] = {"Exclude": ["/scratch/"]}
+    return {"SyncRules": {"Exclude": ["__pycache__/", "node_modules/"], "Include": []}, "Users": users}
+
+
+def timed(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark(user_count, repeat, run_synth):
+    with tempfile.TemporaryDirectory() as work_dir:
+        users_path = os.path.join(work_dir, "users.yaml")
+        with open(users_path, "w") as f:
+            yaml.safe_dump(synthetic_users_file(user_count), f)
+
+        def parse(loader):
+            with open(users_path) as f:
+                return yaml.load(f, Loader=loader)
+
+        with open(BACKUP_SCRIPT) as f:
+            backup_script = f.read()
+        users_file = parse(SafeLoader)
+        users_config = parse_users_config(users_file, users_path)
+        results = {
+            "parse_safe_loader": timed(lambda: parse(yaml.SafeLoader), repeat),
+            f"parse_{SafeLoader.__name__}": timed(lambda: parse(SafeLoader), repeat),
+            "validate_users_config": timed(lambda: parse_users_config(users_file, users_path), repeat),
+            "render_backup_script": timed(
+                lambda: render_sync_rules(backup_script, compile_sync_rules(users_config)), repeat
+            ),
+        }
+        rendered_script = render_sync_rules(backup_script, compile_sync_rules(users_config))
+        content_length = len(base64.b64encode(rendered_script.encode("utf-8")))
+        # app.py refuses content CloudFormation would reject at deploy time
+        if run_synth and content_length <= MAX_LIFECYCLE_CONFIG_CONTENT:
+            env = dict(os.environ, SAGEMAKER_DR_USERS_FILE=users_path, CDK_OUTDIR=os.path.join(work_dir, "cdk.out"))
+            results["cdk_synth"] = timed(
+                lambda: subprocess.run([sys.executable, "app.py"], env=env, check=True, stdout=subprocess.DEVNULL),
+                repeat
+            )
+    for name, seconds in results.items():
+        print(f"users={user_count} {name}: {seconds:.3f}s")
+    fits = content_length <= MAX_LIFECYCLE_CONFIG_CONTENT
+    print(f"users={user_count} backup_lifecycle_config_content: {content_length}/{MAX_LIFECYCLE_CONFIG_CONTENT} "
+          f"characters{'' if fits else ', over the CloudFormation limit'}")
+    return fits
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark synth time over synthetic users.yaml files")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-synth", action="store_true", help="only time the config layer, not app.py")
+    args = parser.parse_args()
+    results = [benchmark(count, args.repeat, not args.skip_synth) for count in args.users]
+    if not all(results):
+        sys.exit(1)
@@ -1,5 +1,83 @@
 PRIMARY_REGION = "us-west-1"
 SECONDARY_REGION = "us-east-2"
+# standby regions, each with its own secondary domain and recovery stack. EFS replicates a file system to a single
+# region, so the primary custom EFS replicates to the first one and every other region replicates the previous
+# region's secondary custom EFS, kept current by ACTIVE_ACTIVE_SYNC_SCHEDULE
+SECONDARY_REGIONS = [SECONDARY_REGION]
 # neeed to replace the default with your account number
 ACCOUNT_ID = "<ACCOUNT_ID>"
 
+# active-active: EventBridge Scheduler expression that runs an incremental recovery sync,
+# e.g. "rate(15 minutes)"; None keeps the recovery step function manual-only
+ACTIVE_ACTIVE_SYNC_SCHEDULE = None
+# failback: replicate the secondary custom EFS back to the primary region and deploy
+# a failback step function in the primary region
+FAILBACK_REPLICATION = False
+# EventBridge schedule expression for the inventory index Lambda on each replicated custom EFS,
+# e.g. "rate(1 hour)"; the recovery task plans from the replicated index instead of walking the replica
+INVENTORY_INDEX_SCHEDULE = None
+# number of nested stacks user profiles and spaces are spread over, by a stable hash of the user name;
+# None keeps them in the domain stack. Changing the number moves users between shards and replaces their profiles
+USER_PROVISIONING_SHARDS = None
+# the user directory Lambda creates /<user> of users.yaml users once with the user's uid:gid instead of running the
+# recursive chown/chmod on every profile creation
+NON_RECURSIVE_USER_DIRECTORIES = False
+# UpdateUserProfile with a new POSIX uid/gid re-owns the user's directory and space backups, walking directories
+# with REPERMISSION_WORKERS threads and changing only entries with another owner
+REPERMISSION_WORKERS = 16
+# what the create user directory Lambda can't re-own before its timeout is handed off to a Fargate task
+REPERMISSION_FARGATE_HANDOFF = False
+# throughput mode of both custom file systems: "bursting", "elastic" or "provisioned" (with
+# CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS), and performance mode: "generalPurpose" or "maxIO".
+# None keeps the EFS defaults; changing the performance mode of a deployed stack replaces the file system
+CUSTOM_EFS_THROUGHPUT_MODE = None
+CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS = None
+CUSTOM_EFS_PERFORMANCE_MODE = None
+# throughput mode the recovery step function switches the target EFS to for the sync and back afterwards:
+# "elastic", "provisioned" (with DR_SYNC_BOOST_PROVISIONED_MIBPS) or None; scheduled incremental syncs never boost
+DR_SYNC_THROUGHPUT_BOOST = None
+DR_SYNC_BOOST_PROVISIONED_MIBPS = 1024
+# EFS refuses a throughput mode change or a provisioned decrease within 24 hours of the previous change, so the
+# original mode is restored by a separate step function execution that waits this long after the sync
+DR_SYNC_BOOST_RESTORE_DELAY_SECONDS = 24 * 60 * 60
+# EventBridge schedule expression for the replication lag monitor on each replicated custom EFS,
+# e.g. "rate(5 minutes)"; alarms when the replica is older than RPO_ALARM_THRESHOLD_SECONDS. Must be a rate()
+# of at most 12 hours, the alarm period follows it
+REPLICATION_MONITOR_SCHEDULE = None
+RPO_ALARM_THRESHOLD_SECONDS = 3600
+# instruction set of every Lambda function: "x86_64" or "arm64" (Graviton, cheaper per GB-second)
+LAMBDA_ARCHITECTURE = "x86_64"
+# space backup format written by the lifecycle script: "files" mirrors every file under space_ebs_backup/<space>,
+# "archive" packs them into compressed tar segments of SPACE_BACKUP_SEGMENT_FILES entries with a path index,
+# appending changed files each backup and rewriting all segments every SPACE_BACKUP_FULL_EVERY backups
+SPACE_BACKUP_FORMAT = "files"
+SPACE_BACKUP_SEGMENT_FILES = 20000
+SPACE_BACKUP_FULL_EVERY = 30
+# limits for background syncs: the scheduled incremental syncs (and executions with {"qos": "background"}) and the
+# space backup lifecycle script; None runs at full speed. With BACKGROUND_SYNC_LATENCY_BACKOFF_MS the recovery sync
+# also halves its files per second while a synced write to the target EFS takes longer than that
+BACKGROUND_SYNC_MAX_MIBPS = None
+BACKGROUND_SYNC_MAX_FILES_PER_SECOND = None
+BACKGROUND_SYNC_LATENCY_BACKOFF_MS = None
+# SSM parameter path the domain stacks publish their IDs under: <prefix>/<Primary|Secondary>/CustomEfsId, ...
+SSM_PARAMETER_PREFIX = "/SagemakerDomain"
+# appended to the stack names and the names unique per account or region (domain, IAM role, Lambda functions, alarms,
+# EventBridge rule, ECS cluster, step functions) so several domain deployments, each with its own SSM_PARAMETER_PREFIX
+# of letters, digits and hyphens, don't collide; the default prefix keeps the original names
+DEPLOYMENT_NAME_SUFFIX = (
+    "" if SSM_PARAMETER_PREFIX == "/SagemakerDomain" else "-" + SSM_PARAMETER_PREFIX.strip("/").replace("/", "-")
+)
+# domain/EFS pairs recovered by one ECSTaskStack, given as the SSM_PARAMETER_PREFIX each domain deployment published
+# its IDs under; None recovers the domain of this deployment only. The pairs are recovered in parallel, at most
+# RECOVERY_MAX_CONCURRENCY at a time
+RECOVERY_DOMAIN_PARAMETER_PREFIXES = None
+RECOVERY_MAX_CONCURRENCY = 4
+# after a full recovery sync, pack each users.yaml space backup into one archive on the secondary custom EFS so
+# restore.sh extracts it with one sequential read; executions override it with {"prehydrate": "true"|"false"}
+PREHYDRATE_SPACES = False
+# mirror mode for full and incremental recovery syncs: files modified or deleted in the primary are updated or
+# deleted in the secondary custom EFS too. Deletions come from diffing the previous sync's file manifest, and a sync
+# that would delete more than MIRROR_MAX_DELETE_PERCENT of the manifest aborts instead; executions override both with
+# {"mirror": "true"|"false", "mirror_max_delete_percent": "<percent>"}
+MIRROR_SYNC = False
+MIRROR_MAX_DELETE_PERCENT = 10
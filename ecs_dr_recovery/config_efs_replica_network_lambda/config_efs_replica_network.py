@@ -16,37 +16,24 @@
  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import logging
-import os
 import time
 
-import boto3
+from aws_clients import client
+from instrumentation import instrument_handler, log, span
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
 
-SOURCE_EFS_ID = os.environ["SOURCE_EFS_ID"]
-TARGET_EFS_ID = os.environ["TARGET_EFS_ID"]
-SECONDARY_SAGEMAKER_DOMAIN_ID = os.environ["SECONDARY_SAGEMAKER_DOMAIN_ID"]
-DEFAULT_SECURITY_GROUP_ID = os.environ["DEFAULT_SECURITY_GROUP_ID"]
-
-
-efs_client = boto3.client("efs")
-ec2_client = boto3.client("ec2")
-
-
-def is_mount_target_valid(availability_zone):
-    target_efs_describe_response = efs_client.describe_mount_targets(FileSystemId=TARGET_EFS_ID)
+def is_mount_target_valid(availability_zone, source_efs_id, target_efs_id):
+    target_efs_describe_response = client("efs").describe_mount_targets(FileSystemId=target_efs_id)
     target_efs_mount_targets = target_efs_describe_response["MountTargets"]
     target_efs_mt_dict = [d for d in target_efs_mount_targets if d["AvailabilityZoneName"] == availability_zone][0]
-    target_efs_mt_sg = efs_client.describe_mount_target_security_groups(
+    target_efs_mt_sg = client("efs").describe_mount_target_security_groups(
         MountTargetId=target_efs_mt_dict["MountTargetId"]
     )["SecurityGroups"]
 
-    source_efs_describe_response = efs_client.describe_mount_targets(FileSystemId=SOURCE_EFS_ID)
+    source_efs_describe_response = client("efs").describe_mount_targets(FileSystemId=source_efs_id)
     source_efs_mount_targets = source_efs_describe_response["MountTargets"]
     source_efs_mt_dict = [d for d in source_efs_mount_targets if d["AvailabilityZoneName"] == availability_zone][0]
-    source_efs_mt_sg = efs_client.describe_mount_target_security_groups(
+    source_efs_mt_sg = client("efs").describe_mount_target_security_groups(
         MountTargetId=source_efs_mt_dict["MountTargetId"]
     )["SecurityGroups"]
     if (target_efs_mt_dict["SubnetId"] == source_efs_mt_dict["SubnetId"]) and (source_efs_mt_sg == target_efs_mt_sg):
@@ -55,67 +42,77 @@ def is_mount_target_valid(availability_zone):
         return False
 
 
-def get_efs_security_groups_ids():
-    response = ec2_client.describe_security_groups(
+def get_efs_security_groups_ids(domain_id):
+    response = client("ec2").describe_security_groups(
         GroupNames=[
-            f"security-group-for-inbound-nfs-{SECONDARY_SAGEMAKER_DOMAIN_ID}",
-            f"security-group-for-outbound-nfs-{SECONDARY_SAGEMAKER_DOMAIN_ID}"
+            f"security-group-for-inbound-nfs-{domain_id}",
+            f"security-group-for-outbound-nfs-{domain_id}"
         ]
     )
     efs_security_groups_ids = [sg["GroupId"] for sg in response["SecurityGroups"]]
     return efs_security_groups_ids
 
 
+@instrument_handler
 def lambda_handler(event, context):
+    # one domain/EFS pair of the recovery step function's Map state
+    domain = event["domain"]
+    source_efs_id = domain["source_efs_id"]
+    target_efs_id = domain["target_efs_id"]
     efs_security_groups = []
     efs_subnets = []
-    target_efs_describe_response = efs_client.describe_mount_targets(FileSystemId=TARGET_EFS_ID)
+    target_efs_describe_response = client("efs").describe_mount_targets(FileSystemId=target_efs_id)
     for mount_target in target_efs_describe_response["MountTargets"]:
         availability_zone = mount_target["AvailabilityZoneName"]
         vpc_id = mount_target["VpcId"]
         if mount_target["LifeCycleState"] == "available":
-            security_groups = efs_client.describe_mount_target_security_groups(
+            security_groups = client("efs").describe_mount_target_security_groups(
                 MountTargetId=mount_target["MountTargetId"]
             )["SecurityGroups"]
             efs_security_groups += security_groups
             efs_subnets.append(mount_target["SubnetId"])
             create_mount_target_kwargs = {
-                "FileSystemId": SOURCE_EFS_ID,
+                "FileSystemId": source_efs_id,
                 "SubnetId": mount_target["SubnetId"],
                 "SecurityGroups": security_groups
             }
             try:
-                source_efs_mount_target_creation_response = efs_client.create_mount_target(
+                source_efs_mount_target_creation_response = client("efs").create_mount_target(
                     **create_mount_target_kwargs
                 )
-            except efs_client.exceptions.MountTargetConflict:
-                if is_mount_target_valid(availability_zone):
-                    logger.info(f"{availability_zone} MountTarget already exists, skip creation.")
+            except client("efs").exceptions.MountTargetConflict:
+                if is_mount_target_valid(availability_zone, source_efs_id, target_efs_id):
+                    log("mount_target_exists", availability_zone=availability_zone)
                     continue
                 else:
                     raise Exception(
                         f"MountTargetConflict. Please delete existing {availability_zone} MountTarget."
                     )
             source_efs_mount_target_id = source_efs_mount_target_creation_response["MountTargetId"]
-            logger.info(
-                f"MountTarget {source_efs_mount_target_id} in {vpc_id} {availability_zone} created for {SOURCE_EFS_ID}."
+            log(
+                "mount_target_created",
+                mount_target_id=source_efs_mount_target_id,
+                vpc_id=vpc_id,
+                availability_zone=availability_zone,
+                file_system_id=source_efs_id,
             )
             # Wait MountTarget to be available
-            wait_time = 0
-            mount_target_state = source_efs_mount_target_creation_response["LifeCycleState"]
-            while mount_target_state != "available":
-                source_efs_describe_response = efs_client.describe_mount_targets(
-                    MountTargetId=source_efs_mount_target_id
-                )
-                mount_target_state = source_efs_describe_response["MountTargets"][0]["LifeCycleState"]
-                time.sleep(30)
-                wait_time += 30
-                logger.info(f"Waiting {source_efs_mount_target_id} creation completed. {wait_time}s elapsed.")
-                if wait_time >= 180:
-                    raise Exception(f"MountTarget {vpc_id} {availability_zone} creation failed.")
+            with span("wait_mount_target", mount_target_id=source_efs_mount_target_id):
+                wait_time = 0
+                mount_target_state = source_efs_mount_target_creation_response["LifeCycleState"]
+                while mount_target_state != "available":
+                    source_efs_describe_response = client("efs").describe_mount_targets(
+                        MountTargetId=source_efs_mount_target_id
+                    )
+                    mount_target_state = source_efs_describe_response["MountTargets"][0]["LifeCycleState"]
+                    time.sleep(30)
+                    wait_time += 30
+                    log("waiting_mount_target", mount_target_id=source_efs_mount_target_id, elapsed_seconds=wait_time)
+                    if wait_time >= 180:
+                        raise Exception(f"MountTarget {vpc_id} {availability_zone} creation failed.")
         else:
             raise Exception(f"Source EFS mount target {mount_target} is not in available status")
-    ecs_task_security_groups = get_efs_security_groups_ids() + [DEFAULT_SECURITY_GROUP_ID]
+    ecs_task_security_groups = get_efs_security_groups_ids(domain["domain_id"]) + [domain["default_security_group_id"]]
     return {
         "statusCode": 200,
         "body": {
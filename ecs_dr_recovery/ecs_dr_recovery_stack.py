@@ -17,6 +17,8 @@
 """
 
 import json
+import os
+from typing import Optional
 from constructs import Construct
 from aws_cdk import (
     aws_lambda,
@@ -25,45 +27,49 @@ from aws_cdk import (
     aws_iam as iam,
     aws_ssm as ssm,
     aws_ec2 as ec2,
+    aws_s3_assets as s3_assets,
+    aws_scheduler as scheduler,
     aws_stepfunctions as sfn,
     custom_resources as cr,
     Stack,
     Duration,
 )
-from constants import PRIMARY_REGION
+from constants import (
+    PRIMARY_REGION,
+    SECONDARY_REGION,
+    ACTIVE_ACTIVE_SYNC_SCHEDULE,
+    LAMBDA_ARCHITECTURE,
+    BACKGROUND_SYNC_MAX_MIBPS,
+    BACKGROUND_SYNC_MAX_FILES_PER_SECOND,
+    BACKGROUND_SYNC_LATENCY_BACKOFF_MS,
+    SSM_PARAMETER_PREFIX,
+    RECOVERY_DOMAIN_PARAMETER_PREFIXES,
+    DEPLOYMENT_NAME_SUFFIX,
+)
+from users_config import load_sync_rules, users_index_asset_dir, USERS_INDEX_FILE_NAME
+from ecs_dr_recovery.recovery_state_machine import (
+    recovery_state_machine_definition,
+    throughput_restore_state_machine_definition,
+)
 
 
 class ECSTaskStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+        self, scope: Construct, construct_id: str, failback: bool = False, source_region: Optional[str] = None, **kwargs
+    ) -> None:
         super().__init__(scope, construct_id, **kwargs)
+        # failback reverses the direction: secondary EFS replica -> primary custom EFS. source_region is the region
+        # whose custom EFS replicates here, a previous secondary region when app.py chains several of them
+        if failback:
+            source_region = source_region or SECONDARY_REGION
+            target_flag = "Primary"
+        else:
+            source_region = source_region or PRIMARY_REGION
+            target_flag = "Secondary"
+        source_flag = "Primary" if source_region == PRIMARY_REGION else "Secondary"
 
         # Default VPC
         default_vpc = ec2.Vpc.from_lookup(self, id="DefaultVPC", is_default=True)
-        custom_efs_default_sg_id_ssm = ssm.StringParameter.from_string_parameter_name(
-            self,
-            "RecoveryCustomEFSDefaultSecurityGroupParameter",
-            string_parameter_name="/SagemakerDomain/Secondary/CustomEfsDefaultSecurityGroup"
-        )
-        custom_efs_default_sg_id = custom_efs_default_sg_id_ssm.string_value
-        ecs_efs_sg = ec2.CfnSecurityGroup(
-            self, "ECSAllowEfsSecurityGroup",
-            group_description="Allow Traffic from Custom EFS",
-            # the properties below are optional
-            group_name="SecurityGroup4EcsAllowEfs",
-            security_group_egress=[ec2.CfnSecurityGroup.EgressProperty(
-                ip_protocol="-1",
-                cidr_ip="0.0.0.0/0",
-                description="Allow all outbound",
-            )],
-            security_group_ingress=[ec2.CfnSecurityGroup.IngressProperty(
-                ip_protocol="tcp",
-                description=f"Allow HTTP Inbound from {custom_efs_default_sg_id}",
-                from_port=80,
-                source_security_group_id=custom_efs_default_sg_id,
-                to_port=80
-            )],
-            vpc_id=default_vpc.vpc_id
-        )
 
         # Docker Image
         asset = ecr_asset.DockerImageAsset(
@@ -75,156 +81,231 @@ class ECSTaskStack(Stack):
         cluster = ecs.Cluster(
             self,
             "SagemakerDomainDrECSCluster",
-            cluster_name="SagemakerDomainDrTaskCluster",
+            cluster_name=f"SagemakerDomainDrTaskCluster{DEPLOYMENT_NAME_SUFFIX}",
             vpc=default_vpc
         )
-
-        # Task Definition
-        fargate_task_definition = ecs.FargateTaskDefinition(
+        users_index_asset = s3_assets.Asset(
             self,
-            "SagemakerDomainRecoveryTaskDef",
-            ephemeral_storage_gib=50,
-            cpu=1024,
-            memory_limit_mib=4096,
+            "UsersIndexAsset",
+            path=os.path.join(users_index_asset_dir(), USERS_INDEX_FILE_NAME),
         )
-        # Add Volume
-        source_efs_id_ssm = cr.AwsCustomResource(
-            self,
-            "RetrieveReplicatedEFSId",
-            on_update=cr.AwsSdkCall(
-                service="SSM",
-                action="getParameter",
-                parameters={
-                    "Name": "/SagemakerDomain/Primary/ReplicaEfsId"
-                },
-                region=PRIMARY_REGION,
-                physical_resource_id=cr.PhysicalResourceId.of(
-                    "retrieve-replicated-efs-id-cross-region"
+        background_limits = {
+            "DR_MAX_MIBPS": BACKGROUND_SYNC_MAX_MIBPS,
+            "DR_MAX_FILES_PER_SECOND": BACKGROUND_SYNC_MAX_FILES_PER_SECOND,
+            "DR_LATENCY_BACKOFF_MS": BACKGROUND_SYNC_LATENCY_BACKOFF_MS,
+        }
+
+        # One security group and task definition per domain/EFS pair, the task definition pins both file systems
+        recovery_domains = []
+        task_definitions = []
+        for index, parameter_prefix in enumerate(RECOVERY_DOMAIN_PARAMETER_PREFIXES or [SSM_PARAMETER_PREFIX]):
+            # the first pair keeps the construct IDs of a single domain deployment
+            suffix = str(index) if index else ""
+            custom_efs_default_sg_id_ssm = ssm.StringParameter.from_string_parameter_name(
+                self,
+                f"RecoveryCustomEFSDefaultSecurityGroupParameter{suffix}",
+                string_parameter_name=f"{parameter_prefix}/{target_flag}/CustomEfsDefaultSecurityGroup"
+            )
+            custom_efs_default_sg_id = custom_efs_default_sg_id_ssm.string_value
+            ecs_efs_sg = ec2.CfnSecurityGroup(
+                self, f"ECSAllowEfsSecurityGroup{suffix}",
+                group_description="Allow Traffic from Custom EFS",
+                # the properties below are optional
+                group_name=f"SecurityGroup4EcsAllowEfs{suffix}{DEPLOYMENT_NAME_SUFFIX}",
+                security_group_egress=[ec2.CfnSecurityGroup.EgressProperty(
+                    ip_protocol="-1",
+                    cidr_ip="0.0.0.0/0",
+                    description="Allow all outbound",
+                )],
+                security_group_ingress=[ec2.CfnSecurityGroup.IngressProperty(
+                    ip_protocol="tcp",
+                    description=f"Allow HTTP Inbound from {custom_efs_default_sg_id}",
+                    from_port=80,
+                    source_security_group_id=custom_efs_default_sg_id,
+                    to_port=80
+                )],
+                vpc_id=default_vpc.vpc_id
+            )
+
+            # Task Definition
+            fargate_task_definition = ecs.FargateTaskDefinition(
+                self,
+                f"SagemakerDomainRecoveryTaskDef{suffix}",
+                ephemeral_storage_gib=50,
+                cpu=1024,
+                memory_limit_mib=4096,
+            )
+            # Add Volume
+            source_efs_id_ssm = cr.AwsCustomResource(
+                self,
+                f"RetrieveReplicatedEFSId{suffix}",
+                on_update=cr.AwsSdkCall(
+                    service="SSM",
+                    action="getParameter",
+                    parameters={
+                        "Name": f"{parameter_prefix}/{source_flag}/ReplicaEfsId"
+                    },
+                    region=source_region,
+                    physical_resource_id=cr.PhysicalResourceId.of(
+                        f"retrieve-replicated-efs-id-cross-region{suffix}"
+                    )
+                ),
+                policy=cr.AwsCustomResourcePolicy.from_sdk_calls(
+                    resources=cr.AwsCustomResourcePolicy.ANY_RESOURCE
                 )
-            ),
-            policy=cr.AwsCustomResourcePolicy.from_sdk_calls(
-                resources=cr.AwsCustomResourcePolicy.ANY_RESOURCE
             )
-        )
-        source_efs_id = source_efs_id_ssm.get_response_field("Parameter.Value")
-        target_efs_id_ssm = ssm.StringParameter.from_string_parameter_name(
-            self,
-            "RecoveryEFSIdParameter",
-            string_parameter_name="/SagemakerDomain/Secondary/CustomEfsId"
-        )
-        target_efs_id = target_efs_id_ssm.string_value
-        fargate_task_definition.add_volume(
-            name="source_domain_efs",
-            efs_volume_configuration={
-                "file_system_id": source_efs_id,
-                "root_directory": "/",
-                "transit_encryption": "ENABLED",
-                "authorization_config": {
-                    "iam": "ENABLED"
+            source_efs_id = source_efs_id_ssm.get_response_field("Parameter.Value")
+            target_efs_id_ssm = ssm.StringParameter.from_string_parameter_name(
+                self,
+                f"RecoveryEFSIdParameter{suffix}",
+                string_parameter_name=f"{parameter_prefix}/{target_flag}/CustomEfsId"
+            )
+            target_efs_id = target_efs_id_ssm.string_value
+            fargate_task_definition.add_volume(
+                name="source_domain_efs",
+                efs_volume_configuration={
+                    "file_system_id": source_efs_id,
+                    "root_directory": "/",
+                    "transit_encryption": "ENABLED",
+                    "authorization_config": {
+                        "iam": "ENABLED"
+                    }
                 }
-            }
-        )
-        fargate_task_definition.add_volume(
-            name="target_domain_efs",
-            efs_volume_configuration={
-                "file_system_id": target_efs_id,
-                "root_directory": "/",
-                "transit_encryption": "ENABLED",
-                "authorization_config": {
-                    "iam": "ENABLED"
+            )
+            fargate_task_definition.add_volume(
+                name="target_domain_efs",
+                efs_volume_configuration={
+                    "file_system_id": target_efs_id,
+                    "root_directory": "/",
+                    "transit_encryption": "ENABLED",
+                    "authorization_config": {
+                        "iam": "ENABLED"
+                    }
                 }
-            }
-        )
-        # Add Permission
-        ecs_exec_role_ecr_token_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            resources=["*"],
-            actions=["ecr:GetAuthorizationToken"]
-        )
-        fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_ecr_token_policy)
-        ecs_exec_role_ecr_image_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            resources=[f"arn:aws:ecr:{self.region}:{self.account}:repository/{asset.repository}"],
-            actions=[
-                "ecr:BatchCheckLayerAvailability",
-                "ecr:GetDownloadUrlForLayer",
-                "ecr:BatchGetImage"
-            ]
-        )
-        fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_ecr_image_policy)
-        ecs_exec_role_cw_log_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            resources=["*"],
-            actions=[
-                "logs:CreateLogGroup",
-                "logs:CreateLogStream",
-                "logs:PutLogEvents"
-            ]
-        )
-        fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_cw_log_policy)
-        ecs_exec_role_efs_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            resources=[
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{source_efs_id}",
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{target_efs_id}"
-            ],
-            actions=[
-                "elasticfilesystem:ClientMount",
-                "elasticfilesystem:ClientRootAccess",
-                "elasticfilesystem:ClientWrite"
-            ]
-        )
-        fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_efs_policy)
-        ecs_dr_task_efs_policy = iam.PolicyStatement(
-            effect=iam.Effect.ALLOW,
-            resources=[
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{source_efs_id}",
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{target_efs_id}"
-            ],
-            actions=[
-                "elasticfilesystem:ClientMount",
-                "elasticfilesystem:ClientRootAccess",
-                "elasticfilesystem:ClientWrite"
-            ]
-        )
-        fargate_task_definition.add_to_task_role_policy(ecs_dr_task_efs_policy)
-        # Add Container
-        container = fargate_task_definition.add_container(
-            "SagemakerDomainRecoveryContainer",
-            image=ecs.ContainerImage.from_docker_image_asset(asset),
-            logging=ecs.LogDrivers.aws_logs(
-                stream_prefix="ecs",
             )
-        )
-        # Add PortMapping
-        port_mapping = ecs.PortMapping(
-            container_port=80,
-            app_protocol=ecs.AppProtocol.http,
-            host_port=80,
-            name="port-80-mapping",
-            protocol=ecs.Protocol.TCP
-        )
-        container.add_port_mappings(port_mapping)
-        # Add MountPoint
-        mount_point_source_efs = ecs.MountPoint(
-            container_path="/source_efs",
-            read_only=True,
-            source_volume="source_domain_efs"
-        )
-        mount_point_target_efs = ecs.MountPoint(
-            container_path="/target_efs",
-            read_only=False,
-            source_volume="target_domain_efs"
-        )
-        container.add_mount_points(mount_point_source_efs, mount_point_target_efs)
+            # Add Permission
+            ecs_exec_role_ecr_token_policy = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=["ecr:GetAuthorizationToken"]
+            )
+            fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_ecr_token_policy)
+            ecs_exec_role_ecr_image_policy = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:aws:ecr:{self.region}:{self.account}:repository/{asset.repository}"],
+                actions=[
+                    "ecr:BatchCheckLayerAvailability",
+                    "ecr:GetDownloadUrlForLayer",
+                    "ecr:BatchGetImage"
+                ]
+            )
+            fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_ecr_image_policy)
+            ecs_exec_role_cw_log_policy = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "logs:CreateLogGroup",
+                    "logs:CreateLogStream",
+                    "logs:PutLogEvents"
+                ]
+            )
+            fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_cw_log_policy)
+            ecs_exec_role_efs_policy = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{source_efs_id}",
+                    f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{target_efs_id}"
+                ],
+                actions=[
+                    "elasticfilesystem:ClientMount",
+                    "elasticfilesystem:ClientRootAccess",
+                    "elasticfilesystem:ClientWrite"
+                ]
+            )
+            fargate_task_definition.add_to_execution_role_policy(ecs_exec_role_efs_policy)
+            ecs_dr_task_efs_policy = iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[
+                    f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{source_efs_id}",
+                    f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{target_efs_id}"
+                ],
+                actions=[
+                    "elasticfilesystem:ClientMount",
+                    "elasticfilesystem:ClientRootAccess",
+                    "elasticfilesystem:ClientWrite"
+                ]
+            )
+            fargate_task_definition.add_to_task_role_policy(ecs_dr_task_efs_policy)
+            container_environment = {name: str(value) for name, value in background_limits.items() if value}
+            # users.yaml only describes the domain deployed from this repository
+            if parameter_prefix == SSM_PARAMETER_PREFIX:
+                users_index_asset.grant_read(fargate_task_definition.task_role)
+                container_environment.update({
+                    "DR_SYNC_RULES": json.dumps(load_sync_rules()),
+                    "DR_USERS_INDEX_URL": users_index_asset.s3_object_url,
+                })
+            # Add Container
+            container = fargate_task_definition.add_container(
+                "SagemakerDomainRecoveryContainer",
+                image=ecs.ContainerImage.from_docker_image_asset(asset),
+                logging=ecs.LogDrivers.aws_logs(
+                    stream_prefix="ecs",
+                ),
+                environment=container_environment,
+            )
+            # Add PortMapping
+            port_mapping = ecs.PortMapping(
+                container_port=80,
+                app_protocol=ecs.AppProtocol.http,
+                host_port=80,
+                name="port-80-mapping",
+                protocol=ecs.Protocol.TCP
+            )
+            container.add_port_mappings(port_mapping)
+            # Add MountPoint
+            mount_point_source_efs = ecs.MountPoint(
+                container_path="/source_efs",
+                read_only=True,
+                source_volume="source_domain_efs"
+            )
+            mount_point_target_efs = ecs.MountPoint(
+                container_path="/target_efs",
+                read_only=False,
+                source_volume="target_domain_efs"
+            )
+            container.add_mount_points(mount_point_source_efs, mount_point_target_efs)
+            target_domain_id_ssm = ssm.StringParameter.from_string_parameter_name(
+                self,
+                f"SecondarySagemakerDomainIdParameter{suffix}",
+                string_parameter_name=f"{parameter_prefix}/{target_flag}/DomainId"
+            )
+            recovery_domains.append({
+                "name": parameter_prefix,
+                "source_efs_id": source_efs_id,
+                "target_efs_id": target_efs_id,
+                "domain_id": target_domain_id_ssm.string_value,
+                "default_security_group_id": ecs_efs_sg.attr_group_id,
+                "task_definition_arn": fargate_task_definition.task_definition_arn,
+                # spaces to prehydrate come from the users index
+                "prehydrate": parameter_prefix == SSM_PARAMETER_PREFIX,
+            })
+            task_definitions.append(fargate_task_definition)
+        efs_arns = [
+            f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{domain[key]}"
+            for domain in recovery_domains
+            for key in ("source_efs_id", "target_efs_id")
+        ]
 
         # Lambda Function for EFS Replica Network Config
-        secondary_sagemaker_domain_id_ssm = ssm.StringParameter.from_string_parameter_name(
-            self,
-            "SecondarySagemakerDomainIdParameter",
-            string_parameter_name="/SagemakerDomain/Secondary/DomainId"
+        lambda_architecture = (
+            aws_lambda.Architecture.ARM_64 if LAMBDA_ARCHITECTURE == "arm64" else aws_lambda.Architecture.X86_64
+        )
+        instrumentation_layer = aws_lambda.LayerVersion(
+            self, "InstrumentationLayer",
+            code=aws_lambda.Code.from_asset("lambda_layers/instrumentation/"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_12],
+            description="Tracing, timing and AWS client helpers for the SageMaker domain DR Lambdas",
         )
-        secondary_sagemaker_domain_id = secondary_sagemaker_domain_id_ssm.string_value
         config_efs_replica_network_lambda = aws_lambda.Function(
             self,
             f"ConfigEfsReplicaNetworkLambda",
@@ -232,23 +313,16 @@ class ECSTaskStack(Stack):
                 "ecs_dr_recovery/config_efs_replica_network_lambda"
             ),
             handler="config_efs_replica_network.lambda_handler",
-            runtime=aws_lambda.Runtime.PYTHON_3_10,
+            layers=[instrumentation_layer],
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            architecture=lambda_architecture,
             description="Lambda function to config primary region's EFS replica mount target",
-            function_name="config-efs-replica-network-lambda-function",
-            environment={
-                "SOURCE_EFS_ID": source_efs_id,
-                "TARGET_EFS_ID": target_efs_id,
-                "SECONDARY_SAGEMAKER_DOMAIN_ID": secondary_sagemaker_domain_id,
-                "DEFAULT_SECURITY_GROUP_ID": ecs_efs_sg.attr_group_id,
-            },
+            function_name=f"config-efs-replica-network-lambda-function{DEPLOYMENT_NAME_SUFFIX}",
             timeout=Duration.seconds(900),
         )
         lambda_role_efs_policy = iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            resources=[
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{source_efs_id}",
-                f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{target_efs_id}"
-            ],
+            resources=efs_arns,
             actions=[
                 "elasticfilesystem:DescribeMountTargets",
                 "elasticfilesystem:DescribeMountTargetSecurityGroups",
@@ -266,60 +340,42 @@ class ECSTaskStack(Stack):
         )
         config_efs_replica_network_lambda.add_to_role_policy(lambda_role_sg_policy)
 
+        target_efs_arns = [
+            f"arn:aws:elasticfilesystem:{self.region}:{self.account}:file-system/{domain['target_efs_id']}"
+            for domain in recovery_domains
+        ]
+        # Throughput Restore Step Function, started by the recovery and waiting out the EFS 24 hour limit
+        throughput_restore_state_machine = sfn.StateMachine(
+            self,
+            "EfsThroughputRestoreStateMachine",
+            definition_body=sfn.DefinitionBody.from_string(json.dumps(throughput_restore_state_machine_definition())),
+            timeout=Duration.days(2),
+        )
+        throughput_restore_state_machine.add_to_role_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=target_efs_arns,
+                actions=["elasticfilesystem:UpdateFileSystem"]
+            )
+        )
+
         # Recovery Step Function
-        sfn_definition = {
-            "Comment": "A description of my state machine",
-            "StartAt": "Config EFS Mount Target",
-            "States": {
-                "Config EFS Mount Target": {
-                    "Type": "Task",
-                    "Resource": "arn:aws:states:::lambda:invoke",
-                    "OutputPath": "$.Payload",
-                    "Parameters": {
-                        "FunctionName": f"{config_efs_replica_network_lambda.function_arn}:$LATEST",
-                        "Payload.$": "$"
-                    },
-                    "Retry": [
-                        {
-                            "ErrorEquals": [
-                                "Lambda.ServiceException",
-                                "Lambda.AWSLambdaException",
-                                "Lambda.SdkClientException",
-                                "Lambda.TooManyRequestsException"
-                            ],
-                            "IntervalSeconds": 1,
-                            "MaxAttempts": 3,
-                            "BackoffRate": 2
-                        }
-                    ],
-                    "Next": "ECS DR Recovery Task"
-                },
-                "ECS DR Recovery Task": {
-                    "Type": "Task",
-                    "Resource": "arn:aws:states:::ecs:runTask.sync",
-                    "Parameters": {
-                        "LaunchType": "FARGATE",
-                        "Cluster": cluster.cluster_arn,
-                        "TaskDefinition": fargate_task_definition.task_definition_arn,
-                        "NetworkConfiguration": {
-                            "AwsvpcConfiguration": {
-                                "Subnets.$": "$.body.ecs_task_subnets",
-                                "SecurityGroups.$": "$.body.ecs_task_security_groups",
-                                "AssignPublicIp": "ENABLED"
-                            }
-                        }
-                    },
-                    "End": True
-                }
-            }
-        }
+        sfn_definition = recovery_state_machine_definition(
+            recovery_domains,
+            cluster.cluster_arn,
+            config_efs_replica_network_lambda.function_arn,
+            throughput_restore_state_machine.state_machine_arn,
+            failback
+        )
         sfn_definition_string = json.dumps(sfn_definition)
         # Create state machine
         dr_state_machine = sfn.StateMachine(
             self,
             "SagemakerStudioDrStateMachine",
             definition_body=sfn.DefinitionBody.from_string(sfn_definition_string),
-            state_machine_name="Sagemaker-Studio-DR-SFN",
+            state_machine_name=(
+                "Sagemaker-Studio-Failback-SFN" if failback else "Sagemaker-Studio-DR-SFN"
+            ) + DEPLOYMENT_NAME_SUFFIX,
             timeout=Duration.minutes(60),
         )
         sfn_role_lambda_policy = iam.PolicyStatement(
@@ -330,7 +386,7 @@ class ECSTaskStack(Stack):
         dr_state_machine.add_to_role_policy(sfn_role_lambda_policy)
         sfn_role_run_task_policy = iam.PolicyStatement(
             effect=iam.Effect.ALLOW,
-            resources=[fargate_task_definition.task_definition_arn],
+            resources=[task_definition.task_definition_arn for task_definition in task_definitions],
             actions=["ecs:RunTask"]
         )
         dr_state_machine.add_to_role_policy(sfn_role_run_task_policy)
@@ -359,8 +415,10 @@ class ECSTaskStack(Stack):
             effect=iam.Effect.ALLOW,
             resources=[
                 config_efs_replica_network_lambda.role.role_arn,
-                fargate_task_definition.task_role.role_arn,
-                fargate_task_definition.execution_role.role_arn
+            ] + [
+                role.role_arn
+                for task_definition in task_definitions
+                for role in (task_definition.task_role, task_definition.execution_role)
             ],
             actions=["iam:PassRole"]
         )
@@ -375,4 +433,45 @@ class ECSTaskStack(Stack):
             ]
         )
         dr_state_machine.add_to_role_policy(sfn_role_rule_policy)
+        sfn_role_efs_throughput_policy = iam.PolicyStatement(
+            effect=iam.Effect.ALLOW,
+            resources=target_efs_arns,
+            actions=[
+                "elasticfilesystem:DescribeFileSystems",
+                "elasticfilesystem:UpdateFileSystem"
+            ]
+        )
+        dr_state_machine.add_to_role_policy(sfn_role_efs_throughput_policy)
+        throughput_restore_state_machine.grant_start_execution(dr_state_machine)
 
+        # Active-Active Incremental Sync Schedule
+        if ACTIVE_ACTIVE_SYNC_SCHEDULE and not failback:
+            scheduler_role = iam.Role(
+                self,
+                "ActiveActiveSyncSchedulerRole",
+                assumed_by=iam.ServicePrincipal("scheduler.amazonaws.com"),
+            )
+            scheduler_role.add_to_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[dr_state_machine.state_machine_arn],
+                    actions=["states:StartExecution"]
+                )
+            )
+            scheduler.CfnSchedule(
+                self,
+                "ActiveActiveSyncSchedule",
+                name=f"Sagemaker-Studio-DR-Incremental-Sync{DEPLOYMENT_NAME_SUFFIX}",
+                description="Runs the recovery step function in incremental sync mode",
+                schedule_expression=ACTIVE_ACTIVE_SYNC_SCHEDULE,
+                flexible_time_window=scheduler.CfnSchedule.FlexibleTimeWindowProperty(mode="OFF"),
+                target=scheduler.CfnSchedule.TargetProperty(
+                    arn=dr_state_machine.state_machine_arn,
+                    role_arn=scheduler_role.role_arn,
+                    input=json.dumps({"sync_mode": "incremental", "boost_throughput": "none", "qos": "background"}),
+                    # a missed cycle is covered by the next one, the container lock guards overlaps
+                    retry_policy=scheduler.CfnSchedule.RetryPolicyProperty(
+                        maximum_retry_attempts=0
+                    ),
+                ),
+            )
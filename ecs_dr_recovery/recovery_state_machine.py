@@ -0,0 +1,506 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from constants import (
+    DR_SYNC_THROUGHPUT_BOOST,
+    DR_SYNC_BOOST_PROVISIONED_MIBPS,
+    DR_SYNC_BOOST_RESTORE_DELAY_SECONDS,
+    RECOVERY_MAX_CONCURRENCY,
+    PREHYDRATE_SPACES,
+    MIRROR_SYNC,
+    MIRROR_MAX_DELETE_PERCENT,
+)
+
+# Step Functions retries of control-plane calls: jittered and capped, and only for throttling, so they
+# do not multiply the adaptive per-call retries the Lambdas make with their own clients. Efs.TooManyRequestsException
+# is the 24 hour limit on throughput changes, not throttling, and retrying it within seconds cannot succeed
+EFS_THROTTLING_RETRY = {
+    "ErrorEquals": ["Efs.ThrottlingException"],
+    "IntervalSeconds": 2,
+    "MaxAttempts": 4,
+    "BackoffRate": 2,
+    "MaxDelaySeconds": 30,
+    "JitterStrategy": "FULL"
+}
+ECS_THROTTLING_RETRY = {
+    "ErrorEquals": ["ECS.ThrottlingException"],
+    "IntervalSeconds": 5,
+    "MaxAttempts": 3,
+    "BackoffRate": 2,
+    "MaxDelaySeconds": 60,
+    "JitterStrategy": "FULL"
+}
+
+
+# a targeted restore selected users, spaces or paths in the execution input
+RESTORE_SCOPE_SELECTED = {
+    "Or": [
+        {"Variable": "$.config.restore.users[0]", "IsPresent": True},
+        {"Variable": "$.config.restore.spaces[0]", "IsPresent": True},
+        {"Variable": "$.config.restore.paths[0]", "IsPresent": True}
+    ]
+}
+EFS_LIFECYCLE_RETRY = {
+    "ErrorEquals": ["Efs.IncorrectFileSystemLifeCycleStateException"],
+    "IntervalSeconds": 30,
+    "MaxAttempts": 10,
+    "BackoffRate": 1
+}
+
+
+def throughput_restore_state_machine_definition():
+    """
+    Step function switching a target EFS back to the throughput it had before the recovery boost.
+    The recovery starts it with the describeFileSystems result of the target and returns at once,
+    the execution waits out the 24 hours EFS enforces between throughput changes.
+    """
+    return {
+        "Comment": "Restores the throughput mode of a recovery target EFS after the boost",
+        "StartAt": "Wait For Throughput Change Limit",
+        "States": {
+            "Wait For Throughput Change Limit": {
+                "Type": "Wait",
+                "Seconds": DR_SYNC_BOOST_RESTORE_DELAY_SECONDS,
+                "Next": "Check Original Throughput Mode"
+            },
+            "Check Original Throughput Mode": {
+                "Type": "Choice",
+                "Choices": [
+                    {
+                        "Variable": "$.file_system.ThroughputMode",
+                        "StringEquals": "provisioned",
+                        "Next": "Restore Provisioned Throughput"
+                    }
+                ],
+                "Default": "Restore Throughput Mode"
+            },
+            "Restore Throughput Mode": {
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:efs:updateFileSystem",
+                "Parameters": {
+                    "FileSystemId.$": "$.file_system.FileSystemId",
+                    "ThroughputMode.$": "$.file_system.ThroughputMode"
+                },
+                "Retry": [EFS_THROTTLING_RETRY, EFS_LIFECYCLE_RETRY],
+                "End": True
+            },
+            "Restore Provisioned Throughput": {
+                "Type": "Task",
+                "Resource": "arn:aws:states:::aws-sdk:efs:updateFileSystem",
+                "Parameters": {
+                    "FileSystemId.$": "$.file_system.FileSystemId",
+                    "ThroughputMode": "provisioned",
+                    "ProvisionedThroughputInMibps.$": "$.file_system.ProvisionedThroughputInMibps"
+                },
+                "Retry": [EFS_THROTTLING_RETRY, EFS_LIFECYCLE_RETRY],
+                "End": True
+            }
+        }
+    }
+
+
+def recovery_state_machine_definition(
+    recovery_domains, cluster_arn, network_function_arn, throughput_restore_state_machine_arn, failback=False
+):
+    """
+    Amazon States Language of the recovery step function as a dict. Kept free of CDK imports so the
+    definition can be built and exercised offline, see benchmarks/dr_drill.py.
+    """
+    return {
+        "Comment": "A description of my state machine",
+        "StartAt": "Apply Default Input",
+        "States": {
+            "Apply Default Input": {
+                "Type": "Pass",
+                "Result": {
+                    "sync_mode": "failback" if failback else "full",
+                    "failback_since": "",
+                    "dedup": "false",
+                    "boost_throughput": DR_SYNC_THROUGHPUT_BOOST or "none",
+                    "boost_provisioned_mibps": DR_SYNC_BOOST_PROVISIONED_MIBPS,
+                    "restore": {"users": [], "spaces": [], "paths": []},
+                    # a manual execution is a real recovery, the schedule passes "background"
+                    "qos": "full",
+                    "prehydrate": "true" if PREHYDRATE_SPACES and not failback else "false",
+                    "mirror": "true" if MIRROR_SYNC and not failback else "false",
+                    "mirror_max_delete_percent": str(MIRROR_MAX_DELETE_PERCENT)
+                },
+                "ResultPath": "$.defaults",
+                "Next": "Merge Execution Input"
+            },
+            "Merge Execution Input": {
+                "Type": "Pass",
+                "Parameters": {
+                    "config.$": "States.JsonMerge($.defaults, $$.Execution.Input, false)",
+                    "domains": recovery_domains
+                },
+                "Next": "Recover Domains"
+            },
+            "Recover Domains": {
+                "Type": "Map",
+                "ItemsPath": "$.domains",
+                "ItemSelector": {
+                    "config.$": "$.config",
+                    "domain.$": "$$.Map.Item.Value"
+                },
+                "MaxConcurrency": RECOVERY_MAX_CONCURRENCY,
+                "ItemProcessor": {
+                    "ProcessorConfig": {"Mode": "INLINE"},
+                    "StartAt": "Check Throughput Boost",
+                    "States": {
+                        "Check Throughput Boost": {
+                            "Type": "Choice",
+                            "Choices": [
+                                {
+                                    "Variable": "$.config.boost_throughput",
+                                    "StringEquals": "none",
+                                    "Next": "Config EFS Mount Target"
+                                },
+                                {
+                                    # targeted restores are small and may overlap a full sync that owns the boost
+                                    **RESTORE_SCOPE_SELECTED,
+                                    "Next": "Config EFS Mount Target"
+                                }
+                            ],
+                            "Default": "Describe Target EFS"
+                        },
+                        "Describe Target EFS": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::aws-sdk:efs:describeFileSystems",
+                            "Parameters": {
+                                "FileSystemId.$": "$.domain.target_efs_id"
+                            },
+                            "ResultSelector": {
+                                "file_system.$": "$.FileSystems[0]"
+                            },
+                            "ResultPath": "$.target_efs",
+                            "Retry": [EFS_THROTTLING_RETRY],
+                            # the sync runs without the boost
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.boost_error",
+                                    "Next": "Config EFS Mount Target"
+                                }
+                            ],
+                            "Next": "Check Target Throughput Mode"
+                        },
+                        "Check Target Throughput Mode": {
+                            "Type": "Choice",
+                            "Choices": [
+                                {
+                                    "Variable": "$.target_efs.file_system.ThroughputMode",
+                                    "StringEqualsPath": "$.config.boost_throughput",
+                                    "Next": "Config EFS Mount Target"
+                                },
+                                {
+                                    "Variable": "$.config.boost_throughput",
+                                    "StringEquals": "provisioned",
+                                    "Next": "Boost To Provisioned Throughput"
+                                }
+                            ],
+                            "Default": "Boost To Elastic Throughput"
+                        },
+                        "Boost To Elastic Throughput": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::aws-sdk:efs:updateFileSystem",
+                            "Parameters": {
+                                "FileSystemId.$": "$.domain.target_efs_id",
+                                "ThroughputMode": "elastic"
+                            },
+                            "ResultSelector": {
+                                "throughput_mode.$": "$.ThroughputMode"
+                            },
+                            "ResultPath": "$.boost",
+                            "Retry": [EFS_THROTTLING_RETRY],
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.boost_error",
+                                    "Next": "Config EFS Mount Target"
+                                }
+                            ],
+                            "Next": "Schedule Throughput Restore"
+                        },
+                        "Boost To Provisioned Throughput": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::aws-sdk:efs:updateFileSystem",
+                            "Parameters": {
+                                "FileSystemId.$": "$.domain.target_efs_id",
+                                "ThroughputMode": "provisioned",
+                                "ProvisionedThroughputInMibps.$": "$.config.boost_provisioned_mibps"
+                            },
+                            "ResultSelector": {
+                                "throughput_mode.$": "$.ThroughputMode"
+                            },
+                            "ResultPath": "$.boost",
+                            "Retry": [EFS_THROTTLING_RETRY],
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.boost_error",
+                                    "Next": "Config EFS Mount Target"
+                                }
+                            ],
+                            "Next": "Schedule Throughput Restore"
+                        },
+                        # started right after the boost, so a failure or timeout later in the recovery can't leave
+                        # the target boosted. EFS refuses switching back sooner, the execution waits 24 hours
+                        "Schedule Throughput Restore": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::states:startExecution",
+                            "Parameters": {
+                                "StateMachineArn": throughput_restore_state_machine_arn,
+                                "Input": {
+                                    "file_system.$": "$.target_efs.file_system"
+                                }
+                            },
+                            "ResultSelector": {
+                                "execution_arn.$": "$.ExecutionArn"
+                            },
+                            "ResultPath": "$.throughput_restore",
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.restore_error",
+                                    "Next": "Config EFS Mount Target"
+                                }
+                            ],
+                            "Next": "Config EFS Mount Target"
+                        },
+                        "Config EFS Mount Target": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::lambda:invoke",
+                            "ResultSelector": {
+                                "body.$": "$.Payload.body"
+                            },
+                            "ResultPath": "$.network",
+                            "Parameters": {
+                                "FunctionName": f"{network_function_arn}:$LATEST",
+                                "Payload.$": "$"
+                            },
+                            "Retry": [
+                                {
+                                    "ErrorEquals": [
+                                        "Lambda.ServiceException",
+                                        "Lambda.AWSLambdaException",
+                                        "Lambda.SdkClientException",
+                                        "Lambda.TooManyRequestsException"
+                                    ],
+                                    "IntervalSeconds": 1,
+                                    "MaxAttempts": 3,
+                                    "BackoffRate": 2,
+                                    "MaxDelaySeconds": 30,
+                                    "JitterStrategy": "FULL"
+                                }
+                            ],
+                            # without mount targets there is nothing to sync, the domain fails on its own
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.sync_error",
+                                    "Next": "Check Sync Result"
+                                }
+                            ],
+                            "Next": "ECS DR Recovery Task"
+                        },
+                        "ECS DR Recovery Task": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::ecs:runTask.sync",
+                            "Parameters": {
+                                "LaunchType": "FARGATE",
+                                "Cluster": cluster_arn,
+                                "TaskDefinition.$": "$.domain.task_definition_arn",
+                                "NetworkConfiguration": {
+                                    "AwsvpcConfiguration": {
+                                        "Subnets.$": "$.network.body.ecs_task_subnets",
+                                        "SecurityGroups.$": "$.network.body.ecs_task_security_groups",
+                                        "AssignPublicIp": "ENABLED"
+                                    }
+                                },
+                                "Overrides": {
+                                    "ContainerOverrides": [
+                                        {
+                                            "Name": "SagemakerDomainRecoveryContainer",
+                                            "Environment": [
+                                                {
+                                                    "Name": "DR_SYNC_MODE",
+                                                    "Value.$": "$.config.sync_mode"
+                                                },
+                                                {
+                                                    "Name": "DR_FAILBACK_SINCE",
+                                                    "Value.$": "$.config.failback_since"
+                                                },
+                                                {
+                                                    "Name": "DR_DEDUP",
+                                                    "Value.$": "$.config.dedup"
+                                                },
+                                                {
+                                                    "Name": "DR_RESTORE_SCOPE",
+                                                    "Value.$": "States.JsonToString($.config.restore)"
+                                                },
+                                                {
+                                                    "Name": "DR_QOS",
+                                                    "Value.$": "$.config.qos"
+                                                },
+                                                {
+                                                    "Name": "DR_MIRROR",
+                                                    "Value.$": "$.config.mirror"
+                                                },
+                                                {
+                                                    "Name": "DR_MIRROR_MAX_DELETE_PERCENT",
+                                                    "Value.$": "$.config.mirror_max_delete_percent"
+                                                }
+                                            ]
+                                        }
+                                    ]
+                                }
+                            },
+                            "ResultPath": None,
+                            "Retry": [ECS_THROTTLING_RETRY],
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.sync_error",
+                                    "Next": "Check Sync Result"
+                                }
+                            ],
+                            "Next": "Check Prehydrate"
+                        },
+                        "Check Prehydrate": {
+                            "Type": "Choice",
+                            "Choices": [
+                                {
+                                    "And": [
+                                        {"Variable": "$.config.prehydrate", "StringEquals": "true"},
+                                        {"Variable": "$.config.sync_mode", "StringEquals": "full"},
+                                        {"Variable": "$.domain.prehydrate", "BooleanEquals": True},
+                                        # a targeted restore only synced its selection, the other archives stay
+                                        {"Not": RESTORE_SCOPE_SELECTED}
+                                    ],
+                                    "Next": "Prehydrate Spaces"
+                                }
+                            ],
+                            "Default": "Check Sync Result"
+                        },
+                        # packs every users.yaml space backup into one archive for restore.sh, while
+                        # the target EFS still runs with the boosted throughput
+                        "Prehydrate Spaces": {
+                            "Type": "Task",
+                            "Resource": "arn:aws:states:::ecs:runTask.sync",
+                            "Parameters": {
+                                "LaunchType": "FARGATE",
+                                "Cluster": cluster_arn,
+                                "TaskDefinition.$": "$.domain.task_definition_arn",
+                                "NetworkConfiguration": {
+                                    "AwsvpcConfiguration": {
+                                        "Subnets.$": "$.network.body.ecs_task_subnets",
+                                        "SecurityGroups.$": "$.network.body.ecs_task_security_groups",
+                                        "AssignPublicIp": "ENABLED"
+                                    }
+                                },
+                                "Overrides": {
+                                    "ContainerOverrides": [
+                                        {
+                                            "Name": "SagemakerDomainRecoveryContainer",
+                                            "Environment": [
+                                                {
+                                                    "Name": "DR_SYNC_MODE",
+                                                    "Value": "prehydrate"
+                                                }
+                                            ]
+                                        }
+                                    ]
+                                }
+                            },
+                            "ResultPath": None,
+                            "Retry": [ECS_THROTTLING_RETRY],
+                            # restore.sh falls back to copying the backup, so the domain still succeeds
+                            "Catch": [
+                                {
+                                    "ErrorEquals": ["States.ALL"],
+                                    "ResultPath": "$.prehydrate_error",
+                                    "Next": "Check Sync Result"
+                                }
+                            ],
+                            "Next": "Check Sync Result"
+                        },
+                        "Check Sync Result": {
+                            "Type": "Choice",
+                            "Choices": [
+                                {
+                                    "Variable": "$.sync_error",
+                                    "IsPresent": True,
+                                    "Next": "Domain Sync Failed"
+                                }
+                            ],
+                            "Default": "Domain Sync Succeeded"
+                        },
+                        "Domain Sync Failed": {
+                            "Type": "Pass",
+                            "Parameters": {
+                                "domain.$": "$.domain.name",
+                                "failed": True,
+                                "sync_error.$": "$.sync_error"
+                            },
+                            "End": True
+                        },
+                        "Domain Sync Succeeded": {
+                            "Type": "Pass",
+                            "Parameters": {
+                                "domain.$": "$.domain.name",
+                                "failed": False
+                            },
+                            "End": True
+                        }
+                    }
+                },
+                "ResultPath": "$.results",
+                "Next": "Collect Failed Domains"
+            },
+            # every Task in an iteration catches its errors and each iteration ends in a Pass state, so one failed
+            # domain does not fail the Map and cancel the others
+            "Collect Failed Domains": {
+                "Type": "Pass",
+                "Parameters": {
+                    "results.$": "$.results",
+                    "failed_domains.$": "$.results[?(@.failed == true)]"
+                },
+                "Next": "Check Recovery Result"
+            },
+            "Check Recovery Result": {
+                "Type": "Choice",
+                "Choices": [
+                    {
+                        "Variable": "$.failed_domains[0]",
+                        "IsPresent": True,
+                        "Next": "Recovery Sync Failed"
+                    }
+                ],
+                "Default": "Recovery Sync Succeeded"
+            },
+            "Recovery Sync Failed": {
+                "Type": "Fail",
+                "Error": "RecoverySyncFailed",
+                "Cause": "The ECS recovery task failed for some domains, see failed_domains in the history"
+            },
+            "Recovery Sync Succeeded": {
+                "Type": "Succeed"
+            }
+        }
+    }
@@ -0,0 +1,199 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import stat
+
+from journal import STATE_DIR_NAME, state_dir
+
+INDEX_FILE_NAME = "dedup-index.json"
+HASH_CHUNK_BYTES = 1024 * 1024
+# index keys of stored copies not hashed yet, `size:<size>:<path>`: no other file had their size when they were copied
+UNHASHED_PREFIX = "size:"
+# index keys of linked duplicates, `link:<path>` -> [source size, source mtime, target mtime_ns]: a link carries the
+# stored copy's mtime, so the mirror sync's size/mtime check would report it stale on every run
+LINK_PREFIX = "link:"
+
+
+def load_index(target_dir):
+    index_path = os.path.join(target_dir, STATE_DIR_NAME, INDEX_FILE_NAME)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path) as f:
+        return json.load(f)
+
+
+def save_index(target_dir, index):
+    index_path = os.path.join(state_dir(target_dir), INDEX_FILE_NAME)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def content_key(path, stat_info):
+    # a hardlink shares owner and mode, so only files that agree on both can share an inode. EFS has no
+    # reflinks, identical files of different users are copied
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}:{stat_info.st_size}:{stat_info.st_uid}:{stat_info.st_gid}:{stat_info.st_mode:o}"
+
+
+def link_to_stored_copy(target_dir, stored_path, relative_path):
+    destination = os.path.join(target_dir, relative_path)
+    tmp_path = f"{destination}.dedup-tmp"
+    os.link(os.path.join(target_dir, stored_path), tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def record_link(target_dir, index, relative_path, source_stat):
+    target_stat = os.lstat(os.path.join(target_dir, relative_path))
+    index[f"{LINK_PREFIX}{relative_path}"] = [source_stat.st_size, int(source_stat.st_mtime), target_stat.st_mtime_ns]
+
+
+def linked_copy_current(target_dir, index, relative_path, source_stat):
+    # linked by an earlier run and neither the source nor the target link changed since
+    entry = index.get(f"{LINK_PREFIX}{relative_path}")
+    if entry is None:
+        return False
+    try:
+        target_stat = os.lstat(os.path.join(target_dir, relative_path))
+    except FileNotFoundError:
+        target_stat = None
+    if target_stat is not None and entry == [source_stat.st_size, int(source_stat.st_mtime), target_stat.st_mtime_ns]:
+        return True
+    del index[f"{LINK_PREFIX}{relative_path}"]
+    return False
+
+
+def stored_copy(target_dir, index, key):
+    entry = index.get(key)
+    if entry is None:
+        return None
+    stored_path, stored_mtime_ns = entry
+    try:
+        stored_stat = os.lstat(os.path.join(target_dir, stored_path))
+    except FileNotFoundError:
+        stored_stat = None
+    # the stored copy was deleted or rewritten in the target since it was indexed
+    if stored_stat is None or stored_stat.st_mtime_ns != stored_mtime_ns:
+        del index[key]
+        return None
+    return stored_path
+
+
+def hash_stored_copy(source_dir, target_dir, index, unhashed_key):
+    # a file of the same size showed up, key the stored copy by content from its source, like every other key
+    stored_path, stored_mtime_ns = index.pop(unhashed_key)
+    try:
+        target_stat = os.lstat(os.path.join(target_dir, stored_path))
+        source_stat = os.lstat(os.path.join(source_dir, stored_path))
+    except FileNotFoundError:
+        return
+    if target_stat.st_mtime_ns != stored_mtime_ns:
+        return
+    if (source_stat.st_size, int(source_stat.st_mtime)) != (target_stat.st_size, int(target_stat.st_mtime)):
+        return
+    index.setdefault(content_key(os.path.join(source_dir, stored_path), source_stat), [stored_path, stored_mtime_ns])
+
+
+def plan_dedup(relative_paths, source_dir, target_dir, index, min_bytes):
+    """
+    Hardlink files whose content already has a stored copy in the target and return
+    (copy_paths, first_copies, pending_links, bytes_saved). copy_paths still contains the parent
+    directories of linked files so rsync owns their creation and attributes; pending_links are
+    duplicates of files first seen in this run, linked by finish_dedup once rsync copied them.
+    Only files sharing their size with another file of the run or of the index are hashed.
+    """
+    copy_paths = []
+    linked_dirs = set()
+    first_copies = {}
+    pending_links = []
+    bytes_saved = 0
+    candidates = []
+    size_counts = collections.Counter()
+    for relative_path in relative_paths:
+        try:
+            stat_info = os.lstat(os.path.join(source_dir, relative_path))
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(stat_info.st_mode) or stat_info.st_size < min_bytes:
+            copy_paths.append(relative_path)
+            continue
+        if linked_copy_current(target_dir, index, relative_path, stat_info):
+            continue
+        candidates.append((relative_path, stat_info))
+        size_counts[stat_info.st_size] += 1
+    hashed_sizes = set()
+    unhashed_keys = collections.defaultdict(list)
+    for key in index:
+        if key.startswith(LINK_PREFIX):
+            continue
+        if key.startswith(UNHASHED_PREFIX):
+            unhashed_keys[int(key.split(":")[1])].append(key)
+        else:
+            hashed_sizes.add(int(key.split(":")[1]))
+    for relative_path, stat_info in candidates:
+        size = stat_info.st_size
+        if size_counts[size] == 1 and size not in hashed_sizes and size not in unhashed_keys:
+            first_copies[f"{UNHASHED_PREFIX}{size}:{relative_path}"] = relative_path
+            copy_paths.append(relative_path)
+            continue
+        for unhashed_key in unhashed_keys.pop(size, []):
+            hash_stored_copy(source_dir, target_dir, index, unhashed_key)
+        hashed_sizes.add(size)
+        source_path = os.path.join(source_dir, relative_path)
+        key = content_key(source_path, stat_info)
+        stored_path = stored_copy(target_dir, index, key)
+        if stored_path is not None and os.path.isdir(os.path.join(target_dir, os.path.dirname(relative_path))):
+            if stored_path != relative_path:
+                link_to_stored_copy(target_dir, stored_path, relative_path)
+                record_link(target_dir, index, relative_path, stat_info)
+                bytes_saved += stat_info.st_size
+            continue
+        if stored_path is not None or key in first_copies:
+            pending_links.append((relative_path, key, stat_info))
+            linked_dirs.add(os.path.dirname(relative_path))
+            continue
+        first_copies[key] = relative_path
+        copy_paths.append(relative_path)
+    copy_paths.extend(sorted(d for d in linked_dirs if d))
+    return copy_paths, first_copies, pending_links, bytes_saved
+
+
+def finish_dedup(target_dir, index, first_copies, pending_links):
+    bytes_saved = 0
+    for key, relative_path in first_copies.items():
+        try:
+            index[key] = [relative_path, os.lstat(os.path.join(target_dir, relative_path)).st_mtime_ns]
+        except FileNotFoundError:
+            continue
+    for relative_path, key, source_stat in pending_links:
+        stored_path = stored_copy(target_dir, index, key)
+        if stored_path is None:
+            continue
+        link_to_stored_copy(target_dir, stored_path, relative_path)
+        record_link(target_dir, index, relative_path, source_stat)
+        bytes_saved += source_stat.st_size
+    return bytes_saved
+
@@ -0,0 +1,74 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import time
+
+from journal import load_journal, state_dir, list_changed_files
+
+
+def failback_baseline(source_dir, override):
+    # explicit execution input wins, otherwise the last full recovery sync recorded in the secondary EFS journal,
+    # which replicated back together with the data. Incremental syncs move last_sync_at past the failover, so it
+    # only stands in for journals written before failover_at existed that never saw an incremental sync
+    if override:
+        return float(override)
+    journal = load_journal(source_dir)
+    if "failover_at" in journal:
+        return journal["failover_at"]
+    if "last_sync_at" in journal and "watermark" not in journal:
+        return journal["last_sync_at"]
+    raise ValueError("No failover timestamp in the source journal, set failback_since in the execution input")
+
+
+def plan_failback(source_dir, target_dir, since, rules=None, changed_paths=None):
+    """
+    Split files written in the secondary region since the failover into files safe to copy
+    back and conflicts, i.e. files that also changed in the primary after the failover.
+    """
+    copy_paths = []
+    conflicts = []
+    # every file in the failback replica has a fresh ctime, so only mtime tells user writes apart
+    if changed_paths is None:
+        changed_paths = list_changed_files(source_dir, since, use_ctime=False, rules=rules)
+    for relative_path in changed_paths:
+        try:
+            target_stat = os.stat(os.path.join(target_dir, relative_path), follow_symlinks=False)
+        except FileNotFoundError:
+            copy_paths.append(relative_path)
+            continue
+        if target_stat.st_mtime < since:
+            copy_paths.append(relative_path)
+            continue
+        source_stat = os.stat(os.path.join(source_dir, relative_path), follow_symlinks=False)
+        if (source_stat.st_size, int(source_stat.st_mtime)) == (target_stat.st_size, int(target_stat.st_mtime)):
+            continue
+        conflicts.append({
+            "path": relative_path,
+            "source_mtime": source_stat.st_mtime,
+            "target_mtime": target_stat.st_mtime,
+        })
+    return copy_paths, conflicts
+
+
+def write_conflict_report(target_dir, since, conflicts):
+    report_path = os.path.join(state_dir(target_dir), f"failback-conflicts-{int(time.time())}.json")
+    with open(report_path, "w") as f:
+        json.dump({"since": since, "conflicts": conflicts}, f, indent=1)
+    return report_path
@@ -0,0 +1,145 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gzip
+import json
+import os
+import stat
+from urllib.parse import quote
+
+from journal import STATE_DIR_NAME, walk_files
+from sync_rules import EBS_BACKUP_DIRECTORY
+from users_index import owner_of
+
+# written on the primary custom EFS by the inventory index Lambda, read here from the replica
+INVENTORY_DIRECTORY_NAME = "inventory"
+
+
+def load_inventory(source_dir):
+    summary_path = os.path.join(source_dir, STATE_DIR_NAME, INVENTORY_DIRECTORY_NAME, "summary.json")
+    if not os.path.exists(summary_path):
+        return None
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def print_inventory_plan(inventory, users_index=None):
+    shards = inventory["shards"]
+    total_files = sum(shard["files"] for shard in shards.values())
+    total_bytes = sum(shard["bytes"] for shard in shards.values())
+    print(f"inventory: {len(shards)} shards, {total_files} files, {total_bytes} bytes, "
+          f"updated_at {inventory.get('updated_at')}")
+    for shard_name, shard in sorted(shards.items(), key=lambda item: -item[1]["bytes"]):
+        print(f"inventory_shard: {shard_name} owner={owner_of(users_index, shard_name)} files={shard['files']} "
+              f"bytes={shard['bytes']} last_modified={shard['last_modified']}")
+
+
+def shard_path(source_dir, shard_name):
+    return os.path.join(source_dir, STATE_DIR_NAME, INVENTORY_DIRECTORY_NAME, f"{quote(shard_name, safe='')}.tsv.gz")
+
+
+def iter_shard_rows(source_dir, shard_name):
+    with gzip.open(shard_path(source_dir, shard_name), "rb") as f:
+        buffer = b""
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            records = (buffer + chunk).split(b"\0")
+            buffer = records.pop()
+            for record in records:
+                kind, mtime_ns, size, path = record.split(b"\t", 3)
+                yield kind.decode(), int(mtime_ns), int(size), os.fsdecode(path)
+
+
+def list_shard_files(source_dir, shard_name, rules):
+    """
+    Files of one indexed shard without walking it: only the directories are stat'ed, and a
+    directory whose mtime moved since the index was written (entries added or removed) is
+    re-listed, with new subdirectories walked in full.
+    """
+    indexed_dirs = set()
+    changed_dirs = []
+    excluded_dirs = set()
+    unchanged_files = []
+    for kind, mtime_ns, _, relative_path in iter_shard_rows(source_dir, shard_name):
+        parent = os.path.dirname(relative_path)
+        if parent in excluded_dirs:
+            if kind == "d":
+                excluded_dirs.add(relative_path)
+            continue
+        if rules is not None and relative_path != shard_name and rules.excluded(relative_path, kind == "d"):
+            if kind == "d":
+                excluded_dirs.add(relative_path)
+            continue
+        if kind == "d":
+            # a directory deleted or renamed since the index was written lists none of its rows,
+            # its parent's mtime moved, so a renamed one is walked under its new name
+            try:
+                stat_info = os.stat(os.path.join(source_dir, relative_path), follow_symlinks=False)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if not stat.S_ISDIR(stat_info.st_mode):
+                continue
+            indexed_dirs.add(relative_path)
+            if stat_info.st_mtime_ns != mtime_ns:
+                changed_dirs.append(relative_path)
+        else:
+            unchanged_files.append(relative_path)
+    changed_dir_set = set(changed_dirs)
+    for relative_path in unchanged_files:
+        parent = os.path.dirname(relative_path)
+        if parent in indexed_dirs and parent not in changed_dir_set:
+            yield relative_path
+    for relative_dir in changed_dirs:
+        with os.scandir(os.path.join(source_dir, relative_dir)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                relative_path = os.path.join(relative_dir, entry.name)
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if rules is not None and rules.excluded(relative_path, is_dir):
+                    continue
+                if not is_dir:
+                    yield relative_path
+                elif relative_path not in indexed_dirs:
+                    yield from (path for path, _ in walk_files(source_dir, rules, relative_path))
+
+
+def list_inventory_files(source_dir, inventory, rules=None):
+    """Every source file, from the replicated inventory where possible and by walking the rest."""
+    shards = inventory["shards"]
+    pending_roots = [""]
+    while pending_roots:
+        root = pending_roots.pop()
+        with os.scandir(os.path.join(source_dir, root)) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                relative_path = os.path.join(root, entry.name)
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if rules is not None and rules.excluded(relative_path, is_dir):
+                    continue
+                if not is_dir:
+                    yield relative_path
+                elif relative_path == EBS_BACKUP_DIRECTORY:
+                    pending_roots.append(relative_path)
+                elif shards.get(relative_path, {}).get("per_file") and os.path.exists(
+                    shard_path(source_dir, relative_path)
+                ):
+                    yield from list_shard_files(source_dir, relative_path, rules)
+                else:
+                    # not indexed yet, e.g. a user created after the last inventory run
+                    yield from (path for path, _ in walk_files(source_dir, rules, relative_path))
@@ -0,0 +1,205 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import contextlib
+import json
+import os
+import socket
+import threading
+import time
+
+# Sync state lives on the target EFS under a dot directory, so it is never copied by the
+# `--exclude .*` rule and survives between Fargate tasks.
+STATE_DIR_NAME = ".sagemaker-dr"
+JOURNAL_FILE_NAME = "journal.json"
+LOCK_FILE_NAME = "sync.lock"
+
+
+def state_dir(target_dir):
+    path = os.path.join(target_dir, STATE_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def lock_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lock(target_dir, ttl_seconds, lock_name=LOCK_FILE_NAME):
+    """Create the sync lock on the target EFS, returns False if another sync holds it."""
+    lock_path = os.path.join(state_dir(target_dir), lock_name)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            try:
+                lock_age = time.time() - os.stat(lock_path).st_mtime
+            except FileNotFoundError:
+                continue
+            if lock_age < ttl_seconds:
+                with open(lock_path) as f:
+                    print(f"sync lock held: {f.read()}")
+                return False
+            print(f"removing stale sync lock, age {int(lock_age)}s")
+            os.remove(lock_path)
+            continue
+        with os.fdopen(fd, "w") as f:
+            json.dump({"owner": lock_owner(), "acquired_at": int(time.time())}, f)
+        return True
+    return False
+
+
+def wait_for_lock(target_dir, ttl_seconds, wait_seconds, lock_name=LOCK_FILE_NAME, poll_seconds=30):
+    """Retry acquire_lock until it succeeds or wait_seconds passed, returns whether the lock is held."""
+    deadline = time.monotonic() + wait_seconds
+    while not acquire_lock(target_dir, ttl_seconds, lock_name):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(min(poll_seconds, max(0, deadline - time.monotonic())))
+    return True
+
+
+def refresh_lock(target_dir, lock_name=LOCK_FILE_NAME):
+    """Bump the mtime of a lock this process holds, returns False when it is gone or was taken over."""
+    lock_path = os.path.join(state_dir(target_dir), lock_name)
+    try:
+        with open(lock_path) as f:
+            owner = json.load(f).get("owner")
+    except (FileNotFoundError, ValueError):
+        return False
+    if owner != lock_owner():
+        return False
+    os.utime(lock_path)
+    return True
+
+
+@contextlib.contextmanager
+def lock_heartbeat(target_dir, interval_seconds, lock_name=LOCK_FILE_NAME):
+    # the TTL only has to outlive a killed task, a sync running longer keeps its lock fresh
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(interval_seconds):
+            if not refresh_lock(target_dir, lock_name):
+                print(f"lost {lock_name}, another sync took it over")
+                return
+
+    thread = threading.Thread(target=beat, name="lock-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def release_lock(target_dir, lock_name=LOCK_FILE_NAME):
+    lock_path = os.path.join(state_dir(target_dir), lock_name)
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def load_journal(target_dir):
+    # read without creating the state dir, the failback source replica is read-only
+    journal_path = os.path.join(target_dir, STATE_DIR_NAME, JOURNAL_FILE_NAME)
+    if not os.path.exists(journal_path):
+        return {}
+    with open(journal_path) as f:
+        return json.load(f)
+
+
+def save_journal(target_dir, journal):
+    journal_path = os.path.join(state_dir(target_dir), JOURNAL_FILE_NAME)
+    tmp_path = f"{journal_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(journal, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, journal_path)
+
+
+def walk_files(source_dir, rules=None, start=""):
+    """
+    Yield (relative path, DirEntry) for every file under start. Dot entries are skipped to match
+    the `--exclude .*` rule used by the sync, and excluded directories are not descended into.
+    """
+    pending = [start]
+    while pending:
+        relative_dir = pending.pop()
+        try:
+            entries = os.scandir(os.path.join(source_dir, relative_dir))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                relative_path = os.path.join(relative_dir, entry.name)
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if rules is not None and rules.excluded(relative_path, is_dir):
+                    continue
+                if is_dir:
+                    pending.append(relative_path)
+                else:
+                    yield relative_path, entry
+
+
+def list_changed_files(source_dir, watermark, use_ctime=True, rules=None, seen=None):
+    """
+    Yield paths (relative to source_dir) of files whose mtime or ctime is at or after watermark.
+    ctime catches files that EFS replication landed on the replica after the last sync even when
+    their mtime is older; pass use_ctime=False when the whole replica is newer than the watermark.
+    Every walked path is added to seen, the mirror sync's source listing.
+    """
+    for relative_path, entry in walk_files(source_dir, rules):
+        if seen is not None:
+            seen.add(relative_path)
+        try:
+            stat_info = entry.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue
+        changed_at = max(stat_info.st_mtime, stat_info.st_ctime) if use_ctime else stat_info.st_mtime
+        if changed_at >= watermark:
+            yield relative_path
+
+
+def list_missing_files(source_dir, target_dir, rules=None, source_files=None):
+    # the file list `rsync --ignore-existing` would copy, built up front for dedup and sync rules
+    if source_files is None:
+        source_files = (relative_path for relative_path, _ in walk_files(source_dir, rules))
+    for relative_path in source_files:
+        if not os.path.lexists(os.path.join(target_dir, relative_path)):
+            yield relative_path
+
+
+def list_stale_files(source_dir, target_dir, source_files):
+    # mirror mode: missing files plus files rsync's quick check would update, size or mtime differ
+    for relative_path in source_files:
+        try:
+            target_stat = os.lstat(os.path.join(target_dir, relative_path))
+        except FileNotFoundError:
+            yield relative_path
+            continue
+        try:
+            source_stat = os.lstat(os.path.join(source_dir, relative_path))
+        except FileNotFoundError:
+            continue
+        if (source_stat.st_size, int(source_stat.st_mtime)) != (target_stat.st_size, int(target_stat.st_mtime)):
+            yield relative_path
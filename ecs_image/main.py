@@ -18,18 +18,319 @@
 
 import os
 import subprocess
+import sys
+import tempfile
+import time
+
+from journal import (
+    LOCK_FILE_NAME,
+    acquire_lock,
+    wait_for_lock,
+    lock_heartbeat,
+    release_lock,
+    load_journal,
+    save_journal,
+    list_changed_files,
+    list_missing_files,
+    list_stale_files,
+    walk_files,
+)
+from failback import failback_baseline, plan_failback, write_conflict_report
+from dedup import load_index, save_index, plan_dedup, finish_dedup
+from sync_rules import load_sync_rules
+from inventory import load_inventory, print_inventory_plan, list_inventory_files
+from users_index import load_users_index, rsync_ownership_args
+from qos import FileRateLimiter, rsync_bwlimit_args
+from prehydrate import prehydrate_spaces, drop_archives, invalidate_archives, list_segment_state_files
+from mirror import (
+    tracked,
+    load_manifest,
+    save_manifest,
+    plan_deletions,
+    check_delete_cap,
+    delete_paths,
+)
+from restore_scope import (
+    parse_restore_scope,
+    resolve_restore_roots,
+    restore_lock_name,
+    walk_restore_roots,
+    list_changed_restore_files,
+)
+
+SOURCE_DIR = "/source_efs/"
+TARGET_DIR = "/target_efs/"
+SYNC_MODE = os.environ.get("DR_SYNC_MODE", "full")
+# covers clock skew between the replica's NFS server and this task
+WATERMARK_SKEW_SECONDS = int(os.environ.get("DR_WATERMARK_SKEW_SECONDS", "300"))
+# longer than the state machine timeout, so a lock left by a killed task expires
+LOCK_TTL_SECONDS = int(os.environ.get("DR_LOCK_TTL_SECONDS", "7200"))
+# a running sync refreshes its lock this often, so a sync longer than the TTL is never taken over
+LOCK_HEARTBEAT_SECONDS = int(os.environ.get("DR_LOCK_HEARTBEAT_SECONDS", "300"))
+# how long a full, failback, restore or prehydrate run waits for a busy lock before failing the execution
+LOCK_WAIT_SECONDS = int(os.environ.get("DR_LOCK_WAIT_SECONDS", "3600"))
+# epoch seconds overriding the failover time recorded in the source journal
+FAILBACK_SINCE = os.environ.get("DR_FAILBACK_SINCE", "")
+# hardlink identical large files in the target EFS to one stored copy instead of copying them again
+DEDUP_ENABLED = os.environ.get("DR_DEDUP", "false").lower() == "true"
+DEDUP_MIN_BYTES = int(os.environ.get("DR_DEDUP_MIN_BYTES", str(1024 * 1024)))
+# exclusion/inclusion rules compiled from users.yaml SyncRules at synth time
+SYNC_RULES = load_sync_rules(os.environ.get("DR_SYNC_RULES"))
+# users.yaml index (users, uid -> user, space -> owner) uploaded as an asset at synth time
+USERS_INDEX = load_users_index(os.environ.get("DR_USERS_INDEX_URL"))
+# plan a full sync from the inventory index replicated with the data instead of walking the replica
+USE_INVENTORY = os.environ.get("DR_USE_INVENTORY", "true").lower() == "true"
+# "background" applies the limits below, only the scheduled incremental syncs ask for it
+QOS = os.environ.get("DR_QOS", "full")
+BACKGROUND_LIMITS = QOS != "full"
+BWLIMIT_ARGS = rsync_bwlimit_args(os.environ.get("DR_MAX_MIBPS")) if BACKGROUND_LIMITS else []
+FILE_RATE_LIMITER = (
+    FileRateLimiter(os.environ["DR_MAX_FILES_PER_SECOND"], TARGET_DIR, os.environ.get("DR_LATENCY_BACKOFF_MS"))
+    if BACKGROUND_LIMITS and os.environ.get("DR_MAX_FILES_PER_SECOND")
+    else None
+)
+# propagate modifications and deletions of the source, deletions found by diffing the manifest of the last sync
+MIRROR = os.environ.get("DR_MIRROR", "false").lower() == "true"
+# abort instead of deleting more than this share of the manifest's files
+MIRROR_MAX_DELETE_PERCENT = float(os.environ.get("DR_MIRROR_MAX_DELETE_PERCENT", "10"))
+# rules, dedup, the files per second limit and mirroring need the file list up front instead of a whole-tree rsync
+USE_FILE_LIST = DEDUP_ENABLED or SYNC_RULES is not None or FILE_RATE_LIMITER is not None or MIRROR
+# mirror mode updates files modified in the source instead of keeping the target's copy
+FULL_SYNC_ARGS = ["--exclude", ".*"] if MIRROR else ["--ignore-existing", "--exclude", ".*"]
+# failback writes back to the primary EFS, whose files still carry the source identities
+OWNERSHIP_ARGS = [] if SYNC_MODE == "failback" else rsync_ownership_args(USERS_INDEX)
+# users, spaces or path prefixes selected in the execution input, the whole EFS when empty
+RESTORE_SCOPE = parse_restore_scope(os.environ.get("DR_RESTORE_SCOPE"))
+# spaces packed at once by the prehydrate mode
+PREHYDRATE_WORKERS = int(os.environ.get("DR_PREHYDRATE_WORKERS", "8"))
+# prehydrate only reads the synced target, so it does not block the next scheduled sync
+PREHYDRATE_LOCK_NAME = "prehydrate.lock"
 
 
 def sync_efs():
-    source_dir = f"/source_efs/"
+    source_dir = SOURCE_DIR
     print(f"source_dir_list: {os.listdir(source_dir)}")
-    target_dir = f"/target_efs/"
-    subprocess.run(
-        ["rsync", "-a", "--ignore-existing", "--exclude", ".*", source_dir, target_dir],
-        stdout=subprocess.PIPE
-    )
+    target_dir = TARGET_DIR
+    sync_started_at = time.time()
+    journal = load_journal(target_dir)
+    inventory = load_inventory(source_dir) if USE_INVENTORY else None
+    source_paths = set() if MIRROR else None
+    if inventory is not None:
+        print_inventory_plan(inventory, USERS_INDEX)
+        copy_files(
+            list_full_sync_files(list_inventory_files(source_dir, inventory, SYNC_RULES), source_paths),
+            FULL_SYNC_ARGS,
+            journal
+        )
+    elif USE_FILE_LIST:
+        copy_files(
+            list_full_sync_files((path for path, _ in walk_files(source_dir, SYNC_RULES)), source_paths),
+            FULL_SYNC_ARGS,
+            journal
+        )
+    else:
+        # no file list to tell which space backups change
+        drop_archives(target_dir)
+        subprocess.run(
+            ["rsync", "-a", "--ignore-existing", "--exclude", ".*"] + OWNERSHIP_ARGS + BWLIMIT_ARGS
+            + [source_dir, target_dir],
+            stdout=subprocess.PIPE
+        )
+    # --ignore-existing keeps the first copy of a file, the archive index and marker are rewritten by every backup
+    rsync_batch(list_segment_state_files(source_dir, SYNC_RULES), ["--exclude", ".*"])
+    if MIRROR:
+        propagate_deletions(source_paths, journal)
     print(f"target_dir_list_after_sync: {os.listdir(target_dir)}")
+    # failback baseline, incremental syncs only move last_sync_at
+    journal["failover_at"] = sync_started_at
+    journal["last_sync_at"] = sync_started_at
+    save_journal(target_dir, journal)
+
+
+def list_full_sync_files(source_files, source_paths):
+    if source_paths is None:
+        return list_missing_files(SOURCE_DIR, TARGET_DIR, source_files=source_files)
+    return list_stale_files(SOURCE_DIR, TARGET_DIR, tracked(source_files, source_paths))
+
+
+def propagate_deletions(source_paths, journal):
+    # source_paths is the complete listing the sync just consumed
+    manifest = load_manifest(TARGET_DIR)
+    if manifest is None:
+        # the target may hold files written in the secondary region, only paths a sync listed are ever deleted
+        print("no mirror manifest found, recording this sync's listing without deleting")
+        manifest = set()
+    deletions = plan_deletions(manifest, source_paths, SYNC_RULES)
+    check_delete_cap(deletions, manifest, MIRROR_MAX_DELETE_PERCENT)
+    deletions = list(invalidate_archives(TARGET_DIR, deletions))
+    deleted_count, deleted_bytes = delete_paths(SOURCE_DIR, TARGET_DIR, deletions)
+    save_manifest(TARGET_DIR, source_paths)
+    journal["mirror_deleted_files"] = journal.get("mirror_deleted_files", 0) + deleted_count
+    print(f"mirror_deleted_files: {deleted_count}, deleted_bytes: {deleted_bytes}, manifest_files: {len(source_paths)}")
+
+
+def run_rsync(args):
+    # exit code 24 means source files vanished mid-transfer, expected while users keep writing
+    result = subprocess.run(["rsync", "-a"] + OWNERSHIP_ARGS + BWLIMIT_ARGS + args, stdout=subprocess.PIPE)
+    if result.returncode not in (0, 24):
+        raise RuntimeError(f"rsync failed with exit code {result.returncode}")
+
+
+def rsync_file_list(relative_paths, extra_args=()):
+    if FILE_RATE_LIMITER is None:
+        return rsync_batch(relative_paths, extra_args)
+    count = 0
+    for batch in FILE_RATE_LIMITER.batches(relative_paths):
+        started_at = time.monotonic()
+        count += rsync_batch(batch, extra_args)
+        FILE_RATE_LIMITER.wait(len(batch), time.monotonic() - started_at)
+    return count
+
+
+def rsync_batch(relative_paths, extra_args=()):
+    count = 0
+    with tempfile.NamedTemporaryFile("wb", suffix=".files") as files_from:
+        for relative_path in relative_paths:
+            files_from.write(os.fsencode(relative_path) + b"\0")
+            count += 1
+        files_from.flush()
+        if count:
+            run_rsync(
+                ["--from0", f"--files-from={files_from.name}"] + list(extra_args) + [SOURCE_DIR, TARGET_DIR]
+            )
+    return count
+
+
+def copy_files(relative_paths, extra_args, journal):
+    relative_paths = invalidate_archives(TARGET_DIR, relative_paths)
+    if not DEDUP_ENABLED:
+        return rsync_file_list(relative_paths, extra_args)
+    index = load_index(TARGET_DIR)
+    copy_paths, first_copies, pending_links, bytes_saved = plan_dedup(
+        relative_paths, SOURCE_DIR, TARGET_DIR, index, DEDUP_MIN_BYTES
+    )
+    copied_count = rsync_file_list(copy_paths, extra_args)
+    bytes_saved += finish_dedup(TARGET_DIR, index, first_copies, pending_links)
+    save_index(TARGET_DIR, index)
+    journal["dedup_bytes_saved"] = journal.get("dedup_bytes_saved", 0) + bytes_saved
+    print(f"dedup_bytes_saved: {bytes_saved}, total: {journal['dedup_bytes_saved']}, indexed_files: {len(index)}")
+    return copied_count
+
+
+def sync_efs_incremental():
+    journal = load_journal(TARGET_DIR)
+    sync_started_at = time.time()
+    watermark = journal.get("watermark")
+    source_paths = set() if MIRROR else None
+    if watermark is None and not USE_FILE_LIST:
+        # first cycle: no baseline yet, let rsync quick-check the whole tree
+        print("no sync journal found, running baseline incremental sync")
+        drop_archives(TARGET_DIR)
+        run_rsync(["--exclude", ".*", SOURCE_DIR, TARGET_DIR])
+        changed_count = None
+    else:
+        since = watermark - WATERMARK_SKEW_SECONDS if watermark is not None else 0
+        print(f"syncing files changed since {since}")
+        changed_count = copy_files(
+            list_changed_files(SOURCE_DIR, since, rules=SYNC_RULES, seen=source_paths), ["--exclude", ".*"], journal
+        )
+    if MIRROR:
+        propagate_deletions(source_paths, journal)
+    print(f"changed_files: {changed_count}, elapsed: {int(time.time() - sync_started_at)}s")
+    journal["watermark"] = sync_started_at
+    journal["last_sync_at"] = sync_started_at
+    journal["last_changed_files"] = changed_count
+    save_journal(TARGET_DIR, journal)
+
+
+def sync_efs_restore(roots):
+    # targeted restores leave the journal alone, the watermark still covers the whole EFS
+    journal = load_journal(TARGET_DIR)
+    sync_started_at = time.time()
+    watermark = journal.get("watermark")
+    print(f"restoring {roots}")
+    if SYNC_MODE == "incremental" and watermark is not None:
+        copied_count = copy_files(
+            list_changed_restore_files(SOURCE_DIR, roots, watermark - WATERMARK_SKEW_SECONDS, rules=SYNC_RULES),
+            ["--exclude", ".*"],
+            {}
+        )
+    else:
+        copied_count = copy_files(
+            list_missing_files(SOURCE_DIR, TARGET_DIR, source_files=walk_restore_roots(SOURCE_DIR, roots, SYNC_RULES)),
+            ["--ignore-existing", "--exclude", ".*"],
+            {}
+        )
+    print(f"restored_files: {copied_count}, elapsed: {int(time.time() - sync_started_at)}s")
+
+
+def sync_efs_failback(roots=None):
+    since = failback_baseline(SOURCE_DIR, FAILBACK_SINCE) - WATERMARK_SKEW_SECONDS
+    print(f"failing back files written in the secondary region since {since}")
+    changed_paths = None
+    if roots is not None:
+        changed_paths = list_changed_restore_files(SOURCE_DIR, roots, since, use_ctime=False, rules=SYNC_RULES)
+    copy_paths, conflicts = plan_failback(SOURCE_DIR, TARGET_DIR, since, SYNC_RULES, changed_paths)
+    copied_count = rsync_file_list(copy_paths, ["--exclude", ".*"])
+    print(f"failback_copied_files: {copied_count}, conflicts: {len(conflicts)}")
+    if conflicts:
+        # conflicting files are left untouched in the primary EFS for the owners to reconcile
+        report_path = write_conflict_report(TARGET_DIR, since, conflicts)
+        print(f"failback conflicts written to {report_path}")
+
+
+def prehydrate():
+    if USERS_INDEX is None:
+        raise ValueError("prehydrate needs the users.yaml index, set DR_USERS_INDEX_URL")
+    started_at = time.time()
+    staged = prehydrate_spaces(TARGET_DIR, USERS_INDEX, PREHYDRATE_WORKERS)
+    for space, (archive_bytes, seconds) in sorted(staged.items()):
+        print(f"prehydrated space {space}: {archive_bytes} bytes in {int(seconds)}s")
+    print(f"prehydrated_spaces: {len(staged)}/{len(USERS_INDEX['spaces'])}, elapsed: {int(time.time() - started_at)}s")
+
+
+def main():
+    if RESTORE_SCOPE and not os.environ.get("DR_USERS_INDEX_URL"):
+        # users.yaml only describes the domain deployed from this repository, the scope selects from it
+        print("targeted restore: this domain has no users.yaml index, skipping it")
+        sys.exit(0)
+    restore_roots = resolve_restore_roots(RESTORE_SCOPE, USERS_INDEX) if RESTORE_SCOPE else None
+    if SYNC_MODE == "prehydrate":
+        lock_name = PREHYDRATE_LOCK_NAME
+    elif restore_roots:
+        lock_name = restore_lock_name(restore_roots)
+    else:
+        lock_name = LOCK_FILE_NAME
+    if SYNC_MODE == "incremental" and not restore_roots:
+        # a scheduled cycle, the next one picks up what this one would have copied
+        if not acquire_lock(TARGET_DIR, LOCK_TTL_SECONDS, lock_name):
+            print("another sync is running, skipping this execution")
+            sys.exit(0)
+    elif not wait_for_lock(TARGET_DIR, LOCK_TTL_SECONDS, LOCK_WAIT_SECONDS, lock_name):
+        # a recovery that copied nothing must not report success
+        print(f"another sync still holds {lock_name} after {LOCK_WAIT_SECONDS}s, failing this execution")
+        sys.exit(1)
+    try:
+        if SYNC_MODE not in ("incremental", "full", "failback", "prehydrate"):
+            raise ValueError(
+                f"Unsupported DR_SYNC_MODE {SYNC_MODE}, valid modes are full, incremental, failback or prehydrate"
+            )
+        with lock_heartbeat(TARGET_DIR, LOCK_HEARTBEAT_SECONDS, lock_name):
+            if SYNC_MODE == "prehydrate":
+                prehydrate()
+            elif restore_roots and SYNC_MODE == "failback":
+                sync_efs_failback(restore_roots)
+            elif restore_roots:
+                sync_efs_restore(restore_roots)
+            elif SYNC_MODE == "incremental":
+                sync_efs_incremental()
+            elif SYNC_MODE == "full":
+                sync_efs()
+            else:
+                sync_efs_failback()
+    finally:
+        release_lock(TARGET_DIR, lock_name)
 
 
 if __name__ == "__main__":
-    sync_efs()
+    main()
@@ -0,0 +1,100 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gzip
+import os
+
+from journal import STATE_DIR_NAME, state_dir
+
+# every file the mirror sync left in the target, diffed against the next sync's source listing to find deletions
+MANIFEST_FILE_NAME = "mirror-manifest.gz"
+
+
+def tracked(relative_paths, seen):
+    # records the source listing while the sync consumes it, so finding deletions needs no second walk
+    for relative_path in relative_paths:
+        seen.add(relative_path)
+        yield relative_path
+
+
+def load_manifest(target_dir):
+    manifest_path = os.path.join(target_dir, STATE_DIR_NAME, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with gzip.open(manifest_path, "rb") as f:
+        return {os.fsdecode(path) for path in f.read().split(b"\0") if path}
+
+
+def save_manifest(target_dir, relative_paths):
+    manifest_path = os.path.join(state_dir(target_dir), MANIFEST_FILE_NAME)
+    tmp_path = f"{manifest_path}.tmp"
+    with gzip.open(tmp_path, "wb") as f:
+        f.write(b"\0".join(os.fsencode(path) for path in sorted(relative_paths)))
+    os.replace(tmp_path, manifest_path)
+
+
+def excluded_by_rules(rules, relative_path):
+    parts = relative_path.split("/")
+    for depth in range(1, len(parts)):
+        if rules.excluded("/".join(parts[:depth]), True):
+            return True
+    return rules.excluded(relative_path, False)
+
+
+def plan_deletions(manifest, source_paths, rules=None):
+    """
+    Manifest paths gone from the source. Paths excluded by the sync rules are not in the listing but
+    were not deleted in the source either, so they are left alone.
+    """
+    return sorted(
+        relative_path for relative_path in manifest - source_paths
+        if rules is None or not excluded_by_rules(rules, relative_path)
+    )
+
+
+def check_delete_cap(deletions, manifest, max_percent):
+    # an empty or half-mounted replica looks like mass deletion, refuse before touching the target
+    if manifest and len(deletions) * 100 > len(manifest) * max_percent:
+        raise RuntimeError(
+            f"mirror sync would delete {len(deletions)} of {len(manifest)} files, more than {max_percent}%. "
+            f"Check the replica, or raise mirror_max_delete_percent in the execution input to delete them"
+        )
+
+
+def delete_paths(source_dir, target_dir, deletions):
+    """Remove deleted files and the directories they leave empty in the source too, returns (files, bytes)."""
+    deleted_count = deleted_bytes = 0
+    emptied_dirs = set()
+    for relative_path in deletions:
+        path = os.path.join(target_dir, relative_path)
+        try:
+            deleted_bytes += os.lstat(path).st_size
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        deleted_count += 1
+        emptied_dirs.add(os.path.dirname(relative_path))
+    # deepest first, stops at the first directory still holding entries or still in the source
+    for relative_dir in sorted(emptied_dirs, key=lambda d: -d.count("/")):
+        while relative_dir and not os.path.isdir(os.path.join(source_dir, relative_dir)):
+            try:
+                os.rmdir(os.path.join(target_dir, relative_dir))
+            except OSError:
+                break
+            relative_dir = os.path.dirname(relative_dir)
+    return deleted_count, deleted_bytes
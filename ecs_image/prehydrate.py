@@ -0,0 +1,127 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from journal import STATE_DIR_NAME, state_dir
+from mirror import excluded_by_rules
+from sync_rules import EBS_BACKUP_DIRECTORY
+
+PREHYDRATED_DIR_NAME = "prehydrated"
+ARCHIVE_EXTENSIONS = ("tar.zst", "tar.gz")
+# rewritten in place by every archive format backup run, unlike the segments which are never modified
+SEGMENT_STATE_FILES = ("index.tsv", "last-backup")
+
+
+def archive_settings():
+    # restore.sh picks the decompressor from the extension
+    if shutil.which("zstd"):
+        return ["-I", "zstd -q -T0"], "tar.zst"
+    return ["-z"], "tar.gz"
+
+
+def stage_space(target_dir, space, owner_ids):
+    """Pack one space backup into a single name-sorted archive readable by the space owner only."""
+    backup_dir = os.path.join(target_dir, EBS_BACKUP_DIRECTORY, space)
+    if not os.path.isdir(backup_dir):
+        return space, None
+    if os.path.exists(os.path.join(backup_dir, "segments", "index.tsv")):
+        # archive format backups are already a few packed segments
+        return space, None
+    compress_args, extension = archive_settings()
+    archive_path = os.path.join(state_dir(target_dir), PREHYDRATED_DIR_NAME, f"{space}.{extension}")
+    tmp_path = f"{archive_path}.tmp"
+    started_at = time.time()
+    result = subprocess.run(
+        ["tar", "--sort=name"] + compress_args + ["-C", backup_dir, "-cf", tmp_path, "."],
+        stdout=subprocess.PIPE
+    )
+    # exit code 1 means files changed while being read, the next sync stages them again
+    if result.returncode not in (0, 1):
+        raise RuntimeError(f"tar failed for space {space} with exit code {result.returncode}")
+    if owner_ids is not None:
+        os.chown(tmp_path, *owner_ids)
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, archive_path)
+    return space, (os.path.getsize(archive_path), time.time() - started_at)
+
+
+def drop_archives(target_dir, spaces=None):
+    """Remove the staged archives of spaces, or every staged archive when spaces is None."""
+    prehydrated_dir = os.path.join(target_dir, STATE_DIR_NAME, PREHYDRATED_DIR_NAME)
+    if spaces is None:
+        names = os.listdir(prehydrated_dir) if os.path.isdir(prehydrated_dir) else []
+    else:
+        names = [f"{space}.{extension}" for space in spaces for extension in ARCHIVE_EXTENSIONS]
+    for name in names:
+        try:
+            os.remove(os.path.join(prehydrated_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def invalidate_archives(target_dir, relative_paths):
+    """
+    Pass the paths a sync is about to write or delete through, dropping the archive of every space
+    backup among them first, so restore.sh never extracts a snapshot older than the backup.
+    """
+    prefix = f"{EBS_BACKUP_DIRECTORY}/"
+    dropped = set()
+    for relative_path in relative_paths:
+        if relative_path.startswith(prefix):
+            space = relative_path[len(prefix):].split("/", 1)[0]
+            if space not in dropped:
+                dropped.add(space)
+                drop_archives(target_dir, [space])
+        yield relative_path
+
+
+def list_segment_state_files(source_dir, rules=None):
+    """Index and marker files of every archive format space backup in source_dir, relative to it."""
+    backup_root = os.path.join(source_dir, EBS_BACKUP_DIRECTORY)
+    try:
+        spaces = sorted(os.listdir(backup_root))
+    except FileNotFoundError:
+        return
+    for space in spaces:
+        for name in SEGMENT_STATE_FILES:
+            relative_path = f"{EBS_BACKUP_DIRECTORY}/{space}/segments/{name}"
+            if os.path.isfile(os.path.join(source_dir, relative_path)) and (
+                rules is None or not excluded_by_rules(rules, relative_path)
+            ):
+                yield relative_path
+
+
+def prehydrate_spaces(target_dir, users_index, workers):
+    """Stage every users.yaml space backup in parallel, returns {space: (archive bytes, seconds)}."""
+    prehydrated_dir = os.path.join(state_dir(target_dir), PREHYDRATED_DIR_NAME)
+    os.makedirs(prehydrated_dir, exist_ok=True)
+    # owners read their own archive by name but cannot list the others
+    os.chmod(prehydrated_dir, 0o711)
+    os.chmod(state_dir(target_dir), 0o711)
+    owners = {
+        space: (users_index["users"][owner]["uid"], users_index["users"][owner]["gid"])
+        for space, owner in users_index["spaces"].items()
+    }
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        staged = executor.map(lambda space: stage_space(target_dir, space, owners[space]), sorted(owners))
+        return {space: result for space, result in staged if result is not None}
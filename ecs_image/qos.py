@@ -0,0 +1,79 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import time
+
+from journal import state_dir
+
+# one rsync per batch of files, so the limiter reacts every few seconds without paying an rsync start per file
+BATCH_SECONDS = 10
+# the dynamic backoff never slows a sync below this share of the configured rate
+MIN_RATE_FRACTION = 1 / 16
+
+
+def rsync_bwlimit_args(max_mibps):
+    return [f"--bwlimit={int(float(max_mibps) * 1024)}"] if max_mibps else []
+
+
+def probe_latency(target_dir):
+    # a small synced write, the same path a user's notebook save takes through the EFS
+    probe_path = os.path.join(state_dir(target_dir), "qos-probe")
+    started_at = time.monotonic()
+    with open(probe_path, "w") as f:
+        f.write(str(time.time()))
+        f.flush()
+        os.fsync(f.fileno())
+    return time.monotonic() - started_at
+
+
+class FileRateLimiter:
+    """
+    Token bucket on files per second over rsync batches. With a latency limit, the target EFS is probed after
+    every batch: the rate halves while a probe is slower than the limit and grows back by a quarter otherwise.
+    """
+
+    def __init__(self, files_per_second, target_dir, latency_limit_ms=None):
+        self.max_rate = float(files_per_second)
+        self.rate = self.max_rate
+        self.target_dir = target_dir
+        self.latency_limit = float(latency_limit_ms) / 1000 if latency_limit_ms else None
+
+    def batches(self, relative_paths):
+        batch = []
+        for relative_path in relative_paths:
+            batch.append(relative_path)
+            if len(batch) >= max(1, int(self.rate * BATCH_SECONDS)):
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def wait(self, count, elapsed):
+        # sleep off whatever the batch finished ahead of its token budget
+        delay = count / self.rate - elapsed
+        if delay > 0:
+            time.sleep(delay)
+        if self.latency_limit is None:
+            return
+        latency = probe_latency(self.target_dir)
+        if latency > self.latency_limit:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            print(f"target EFS latency {int(latency * 1000)}ms, slowing sync to {self.rate:.1f} files/s")
+        elif self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate * 1.25)
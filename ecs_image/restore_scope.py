@@ -0,0 +1,113 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+
+from journal import walk_files
+from sync_rules import EBS_BACKUP_DIRECTORY
+from users_index import owner_of
+
+
+def parse_restore_scope(scope_json):
+    """Execution input {"users": [...], "spaces": [...], "paths": [...]}, None when nothing is selected."""
+    if not scope_json:
+        return None
+    scope = json.loads(scope_json)
+    if not isinstance(scope, dict):
+        raise ValueError(f"Restore scope must be an object with users, spaces or paths, got {scope_json}")
+    unknown_keys = set(scope) - {"users", "spaces", "paths"}
+    if unknown_keys:
+        raise ValueError(f"Unsupported restore scope keys {sorted(unknown_keys)}, valid keys are users, spaces and paths")
+    scope = {key: scope.get(key) or [] for key in ("users", "spaces", "paths")}
+    if not any(scope.values()):
+        return None
+    return scope
+
+
+def resolve_restore_roots(scope, users_index):
+    """
+    Validate a restore scope against the users.yaml index and return the subtrees to sync, relative
+    to the EFS root. Every invalid entry is reported at once so one execution fixes the whole input.
+    """
+    if users_index is None:
+        raise ValueError("Targeted restores need the users.yaml index, DR_USERS_INDEX_URL is not set or not readable")
+    errors = []
+    roots = []
+    for user in scope["users"]:
+        if user in users_index["users"]:
+            roots.append(user)
+        else:
+            errors.append(f"user {user!r} is not defined in users.yaml")
+    for space in scope["spaces"]:
+        if space in users_index["spaces"]:
+            roots.append(f"{EBS_BACKUP_DIRECTORY}/{space}")
+        else:
+            errors.append(f"space {space!r} is not defined in users.yaml")
+    for path in scope["paths"]:
+        relative_path = posixpath.normpath(str(path).strip("/"))
+        if relative_path.startswith("..") or relative_path == "." or any(
+            part.startswith(".") for part in relative_path.split("/")
+        ):
+            errors.append(f"path {path!r} must name a file or directory below the EFS root outside dot directories")
+        elif owner_of(users_index, relative_path) is None:
+            errors.append(f"path {path!r} is not inside a user or space directory defined in users.yaml")
+        else:
+            roots.append(relative_path)
+    if errors:
+        raise ValueError("Invalid restore scope: " + "; ".join(errors))
+    # a root nested in another selected root would be synced twice
+    roots = sorted(set(roots))
+    return [root for i, root in enumerate(roots) if not any(root.startswith(f"{other}/") for other in roots[:i])]
+
+
+def restore_lock_name(roots):
+    # one lock per scope, so different targeted restores and the full sync do not block each other
+    return f"restore-{hashlib.sha256(json.dumps(roots).encode()).hexdigest()[:16]}.lock"
+
+
+def walk_restore_roots(source_dir, roots, rules=None):
+    """Yield paths (relative to source_dir) of the selected roots and every file below them."""
+    for root in roots:
+        if not os.path.lexists(os.path.join(source_dir, root)):
+            print(f"restore root {root} not found in the source EFS")
+            continue
+        if rules is not None and rules.excluded(root, os.path.isdir(os.path.join(source_dir, root))):
+            print(f"restore root {root} is excluded by the sync rules")
+            continue
+        # listing the root itself lets rsync create it with the source owner and mode
+        yield root
+        for relative_path, _ in walk_files(source_dir, rules, root):
+            yield relative_path
+
+
+def list_changed_restore_files(source_dir, roots, since, use_ctime=True, rules=None):
+    # same change test as journal.list_changed_files, limited to the selected roots
+    for relative_path in walk_restore_roots(source_dir, roots, rules):
+        if relative_path in roots:
+            yield relative_path
+            continue
+        try:
+            stat_info = os.lstat(os.path.join(source_dir, relative_path))
+        except FileNotFoundError:
+            continue
+        changed_at = max(stat_info.st_mtime, stat_info.st_ctime) if use_ctime else stat_info.st_mtime
+        if changed_at >= since:
+            yield relative_path
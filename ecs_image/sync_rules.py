@@ -0,0 +1,123 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import re
+
+EBS_BACKUP_DIRECTORY = "space_ebs_backup"
+
+
+def translate_pattern(pattern):
+    # gitignore pattern -> (regex source, negate, dir_only)
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    regex = ""
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            regex += "(?:.*/)?"
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex += "/.*"
+            i += 3
+        elif pattern.startswith("**", i):
+            regex += ".*"
+            i += 2
+        elif pattern[i] == "*":
+            regex += "[^/]*"
+            i += 1
+        elif pattern[i] == "?":
+            regex += "[^/]"
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            char_class = pattern[i + 1:end]
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex += f"[{char_class}]"
+            i = end + 1
+        else:
+            regex += re.escape(pattern[i])
+            i += 1
+    prefix = "" if anchored else "(?:.*/)?"
+    return f"{prefix}{regex}", negate, dir_only
+
+
+class RuleSet:
+    """Compiled gitignore-style rules, the last matching rule decides."""
+
+    def __init__(self, patterns):
+        self.rules = []
+        for pattern in patterns:
+            regex, negate, dir_only = translate_pattern(pattern)
+            self.rules.append((re.compile(f"^{regex}$"), negate, dir_only))
+        # one combined regex per entry type rejects the common "no rule matches" case in a single scan
+        self.any_dir_rule = self._combine(self.rules)
+        self.any_file_rule = self._combine([rule for rule in self.rules if not rule[2]])
+
+    @staticmethod
+    def _combine(rules):
+        if not rules:
+            return None
+        return re.compile("|".join(f"(?:{rule[0].pattern})" for rule in rules))
+
+    def excluded(self, relative_path, is_dir):
+        quick_check = self.any_dir_rule if is_dir else self.any_file_rule
+        if quick_check is None or not quick_check.match(relative_path):
+            return False
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                return not negate
+        return False
+
+
+class SyncRules:
+    """
+    Rules compiled at synth time from users.yaml: domain defaults plus per-user overrides,
+    evaluated relative to a user's EFS directory or the space's `space_ebs_backup` directory.
+    """
+
+    def __init__(self, config):
+        self.default = RuleSet(config.get("default", []))
+        self.users = {user: RuleSet(patterns) for user, patterns in config.get("users", {}).items()}
+        self.spaces = config.get("spaces", {})
+
+    def excluded(self, relative_path, is_dir):
+        parts = relative_path.split("/", 2)
+        if parts[0] == EBS_BACKUP_DIRECTORY:
+            if len(parts) < 3:
+                return False
+            rules = self.users.get(self.spaces.get(parts[1]), self.default)
+            return rules.excluded(parts[2], is_dir)
+        parts = relative_path.split("/", 1)
+        if len(parts) == 2:
+            return self.users.get(parts[0], self.default).excluded(parts[1], is_dir)
+        return self.default.excluded(relative_path, is_dir)
+
+
+def load_sync_rules(config_json):
+    if not config_json:
+        return None
+    return SyncRules(json.loads(config_json))
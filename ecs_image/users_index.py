@@ -0,0 +1,58 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+from urllib.parse import urlparse
+
+import boto3
+
+from sync_rules import EBS_BACKUP_DIRECTORY
+
+
+def load_users_index(url):
+    # compiled from users.yaml at synth time, optional: runs without it treat every path as unowned
+    if not url:
+        return None
+    parsed = urlparse(url)
+    try:
+        response = boto3.client("s3").get_object(Bucket=parsed.netloc, Key=parsed.path.lstrip("/"))
+    except Exception as e:
+        print(f"users index {url} not loaded: {e}")
+        return None
+    return json.loads(response["Body"].read())
+
+
+def owner_of(users_index, relative_path):
+    """User profile owning a path relative to the EFS root, None when users.yaml does not define it."""
+    if users_index is None:
+        return None
+    parts = relative_path.strip("/").split("/")
+    if parts[0] == EBS_BACKUP_DIRECTORY:
+        return users_index["spaces"].get(parts[1]) if len(parts) > 1 else None
+    return parts[0] if parts[0] in users_index["users"] else None
+
+
+def rsync_ownership_args(users_index):
+    # users.yaml SourcePosix -> CustomPosix, applied by rsync as it writes each file instead of a chown pass
+    ownership = (users_index or {}).get("ownership") or {}
+    args = []
+    if ownership.get("uids"):
+        args.append("--usermap=" + ",".join(f"{source}:{target}" for source, target in ownership["uids"].items()))
+    if ownership.get("gids"):
+        args.append("--groupmap=" + ",".join(f"{source}:{target}" for source, target in ownership["gids"].items()))
+    return args
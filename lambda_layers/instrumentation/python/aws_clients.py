@@ -0,0 +1,64 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from instrumentation import increment, instrument_client
+
+# adaptive mode: exponential backoff with full jitter plus a client-side token bucket that slows down every
+# call of the client once the control plane throttles, so a regional failover does not retry in lockstep
+CLIENT_CONFIG = {
+    "retries": {"mode": "adaptive", "max_attempts": 8},
+    "max_pool_connections": 10,
+    "connect_timeout": 5,
+    "read_timeout": 30,
+}
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestLimitExceeded",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "TooManyRequestsException",
+    "TooManyRequests",
+}
+_clients = {}
+
+
+def count_throttle(response, operation, **kwargs):
+    # runs ahead of botocore's retry handler for every attempt, never changes the retry decision
+    if response is None:
+        return None
+    error_code = response[1].get("Error", {}).get("Code")
+    if error_code in THROTTLING_ERROR_CODES:
+        increment(f"{operation.service_model.service_name}.{operation.name}.Throttles")
+    return None
+
+
+def client(service_name):
+    """
+    Instrumented boto3 client, created on first use and reused by warm invocations. boto3 is only
+    imported here, so a Lambda pays for it on the first API call instead of at import.
+    """
+    if service_name not in _clients:
+        import boto3
+        from botocore.config import Config
+
+        service_client = instrument_client(boto3.client(service_name, config=Config(**CLIENT_CONFIG)))
+        service_client.meta.events.register_first("needs-retry.*.*", count_throttle)
+        _clients[service_name] = service_client
+    return _clients[service_name]
@@ -0,0 +1,138 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import functools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+METRIC_NAMESPACE = os.environ.get("METRIC_NAMESPACE", "SagemakerDomainDR")
+FUNCTION_NAME = os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+# span name -> [calls, total milliseconds, errors] for the current invocation
+_spans = {}
+# counter name -> count for the current invocation
+_counters = {}
+
+
+def log(message, level=logging.INFO, **fields):
+    # one compact JSON line per event, list sizes and identifiers instead of whole responses
+    logger.log(level, json.dumps({"message": message, **fields}, default=str, separators=(",", ":")))
+
+
+def record_span(name, duration_ms, error=None):
+    stats = _spans.setdefault(name, [0, 0.0, 0])
+    stats[0] += 1
+    stats[1] += duration_ms
+    stats[2] += error is not None
+
+
+def increment(name, count=1):
+    _counters[name] = _counters.get(name, 0) + count
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a block, fields added to the yielded dict inside the block are logged with the duration."""
+    started_at = time.perf_counter()
+    error = None
+    try:
+        yield fields
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started_at) * 1000
+        record_span(name, duration_ms, error)
+        if error is not None:
+            fields["error"] = error
+        log(name, duration_ms=round(duration_ms, 1), **fields)
+
+
+def instrument_client(client):
+    """Time every API call of a boto3 client as a `<service>.<operation>` span."""
+    service_name = client.meta.service_model.service_name
+
+    def before_call(model, context, **kwargs):
+        context["instrumentation_started_at"] = time.perf_counter()
+
+    def after_call(model, context, exception=None, parsed=None, **kwargs):
+        started_at = context.get("instrumentation_started_at")
+        if started_at is None:
+            return
+        duration_ms = (time.perf_counter() - started_at) * 1000
+        # service errors arrive as a parsed error response, only connection failures as an exception
+        if exception is not None:
+            error = type(exception).__name__
+        else:
+            error = (parsed or {}).get("Error", {}).get("Code") or None
+        record_span(f"{service_name}.{model.name}", duration_ms, error)
+        log("api_call", operation=f"{service_name}.{model.name}", duration_ms=round(duration_ms, 1),
+            **({"error": error} if error else {}))
+
+    # same specificity as botocore's Stubber, so before_call still runs first under the offline harness
+    client.meta.events.register("before-call.*.*", before_call)
+    client.meta.events.register("after-call.*.*", after_call)
+    client.meta.events.register("after-call-error.*.*", after_call)
+    return client
+
+
+def emit_metrics():
+    # CloudWatch embedded metric format, extracted from the log line without PutMetricData calls
+    if not _spans and not _counters:
+        return
+    metrics = []
+    values = {}
+    for name, (calls, total_ms, errors) in _spans.items():
+        metrics += [
+            {"Name": f"{name}.Duration", "Unit": "Milliseconds"},
+            {"Name": f"{name}.Calls", "Unit": "Count"},
+            {"Name": f"{name}.Errors", "Unit": "Count"},
+        ]
+        values.update({f"{name}.Duration": round(total_ms, 1), f"{name}.Calls": calls, f"{name}.Errors": errors})
+    for name, count in _counters.items():
+        metrics.append({"Name": name, "Unit": "Count"})
+        values[name] = count
+    # a metric directive takes at most 100 metrics
+    directives = [
+        {"Namespace": METRIC_NAMESPACE, "Dimensions": [["FunctionName"]], "Metrics": metrics[i:i + 99]}
+        for i in range(0, len(metrics), 99)
+    ]
+    print(json.dumps({
+        "_aws": {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": directives},
+        "FunctionName": FUNCTION_NAME,
+        **values,
+    }, separators=(",", ":")))
+    _spans.clear()
+    _counters.clear()
+
+
+def instrument_handler(handler):
+    """Run a Lambda handler in a `handler` span and emit the invocation's span metrics."""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        try:
+            with span("handler"):
+                return handler(event, context)
+        finally:
+            emit_metrics()
+    return wrapper
@@ -0,0 +1,243 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import collections
+import json
+import os
+import socket
+import threading
+import time
+
+# Re-ownership jobs checkpoint next to the sync state, a job interrupted by the Lambda timeout
+# or a stopped task resumes from the directories it had not finished
+STATE_DIR_NAME = ".sagemaker-dr"
+CHECKPOINT_SECONDS = 30
+# one runner per job: the lock is refreshed with every checkpoint, so it only outlives a killed runner by this long,
+# longer than the Lambda timeout
+JOB_LOCK_TTL_SECONDS = 20 * 60
+
+
+def checkpoint_path(efs_root, user_profile_name):
+    return os.path.join(efs_root, STATE_DIR_NAME, f"repermission-{user_profile_name}.json")
+
+
+def job_lock_path(efs_root, user_profile_name):
+    return os.path.join(efs_root, STATE_DIR_NAME, f"repermission-{user_profile_name}.lock")
+
+
+def lock_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_job_lock(efs_root, user_profile_name, ttl_seconds=JOB_LOCK_TTL_SECONDS):
+    """Take the user's job lock next to its checkpoint, returns False while another runner holds it."""
+    path = job_lock_path(efs_root, user_profile_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            try:
+                lock_age = time.time() - os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if lock_age < ttl_seconds:
+                return False
+            print(f"removing stale re-ownership lock of {user_profile_name}, age {int(lock_age)}s")
+            os.remove(path)
+            continue
+        with os.fdopen(fd, "w") as f:
+            json.dump({"owner": lock_owner(), "acquired_at": int(time.time())}, f)
+        return True
+    return False
+
+
+def refresh_job_lock(efs_root, user_profile_name):
+    try:
+        os.utime(job_lock_path(efs_root, user_profile_name))
+    except FileNotFoundError:
+        pass
+
+
+def release_job_lock(efs_root, user_profile_name):
+    # a lock taken over after it expired belongs to the new runner
+    path = job_lock_path(efs_root, user_profile_name)
+    try:
+        with open(path) as f:
+            owner = json.load(f).get("owner")
+    except (FileNotFoundError, ValueError):
+        return
+    if owner == lock_owner():
+        os.remove(path)
+
+
+def load_checkpoint(efs_root, user_profile_name):
+    try:
+        with open(checkpoint_path(efs_root, user_profile_name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(efs_root, job):
+    path = checkpoint_path(efs_root, job["user"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def reown(path, uid, gid, stat_info=None):
+    # only entries with a different owner are written, re-running a finished walk is read-only
+    if stat_info is None:
+        stat_info = os.lstat(path)
+    if (stat_info.st_uid, stat_info.st_gid) == (uid, gid):
+        return False
+    os.lchown(path, uid, gid)
+    return True
+
+
+def reown_entries(efs_root, relative_dir, uid, gid):
+    """Re-own the entries of one directory, returns its subdirectories and the scanned, changed and failed counts."""
+    subdirs = []
+    scanned = changed = errors = 0
+    try:
+        entries = os.scandir(os.path.join(efs_root, relative_dir))
+    except (FileNotFoundError, NotADirectoryError):
+        return subdirs, scanned, changed, errors
+    with entries:
+        for entry in entries:
+            scanned += 1
+            try:
+                changed += reown(entry.path, uid, gid, entry.stat(follow_symlinks=False))
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(os.path.join(relative_dir, entry.name))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                errors += 1
+                print(f"repermission {entry.path}: {e}")
+    return subdirs, scanned, changed, errors
+
+
+def start_job(efs_root, user_profile_name, uid, gid, roots):
+    """
+    Checkpoint a new re-ownership job of roots (paths relative to efs_root) for uid:gid. A newer
+    POSIX change of the same user replaces an unfinished job, the walk starts over at the roots.
+    The caller holds the user's job lock.
+    """
+    pending = [root for root in roots if os.path.lexists(os.path.join(efs_root, root))]
+    job = {
+        "user": user_profile_name,
+        "uid": uid,
+        "gid": gid,
+        "pending": pending,
+        "scanned": 0,
+        "changed": 0,
+        "errors": 0,
+        "started_at": int(time.time()),
+    }
+    # checkpointed before the roots change owner, so a runner killed in between still resumes the walk
+    save_checkpoint(efs_root, job)
+    for root in pending:
+        try:
+            reown(os.path.join(efs_root, root), uid, gid)
+        except FileNotFoundError:
+            continue
+    return job
+
+
+def run_job(efs_root, user_profile_name, workers, deadline=None):
+    """
+    Resume the user's checkpointed job with parallel directory workers until it is done or
+    time.time() passes deadline. The caller holds the user's job lock. The checkpoint is removed once nothing is pending, otherwise
+    it keeps the directories left for the next run. Returns the job, None if there is none.
+    """
+    job = load_checkpoint(efs_root, user_profile_name)
+    if job is None:
+        return None
+    uid, gid = job["uid"], job["gid"]
+    pending = collections.deque(job["pending"])
+    in_progress = collections.Counter()
+    condition = threading.Condition()
+    saved_at = [time.monotonic()]
+
+    def snapshot():
+        return dict(job, pending=list(in_progress.elements()) + list(pending))
+
+    def work():
+        while True:
+            with condition:
+                while not pending and in_progress:
+                    condition.wait()
+                if not pending or (deadline is not None and time.time() >= deadline):
+                    condition.notify_all()
+                    return
+                relative_dir = pending.popleft()
+                in_progress[relative_dir] += 1
+            subdirs, scanned, changed, errors = [], 0, 0, 0
+            try:
+                subdirs, scanned, changed, errors = reown_entries(efs_root, relative_dir, uid, gid)
+            finally:
+                with condition:
+                    in_progress[relative_dir] -= 1
+                    if not in_progress[relative_dir]:
+                        del in_progress[relative_dir]
+                    pending.extend(subdirs)
+                    job["scanned"] += scanned
+                    job["changed"] += changed
+                    job["errors"] += errors
+                    if time.monotonic() - saved_at[0] >= CHECKPOINT_SECONDS:
+                        save_checkpoint(efs_root, snapshot())
+                        refresh_job_lock(efs_root, user_profile_name)
+                        saved_at[0] = time.monotonic()
+                    condition.notify_all()
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    job = snapshot()
+    if job["pending"]:
+        save_checkpoint(efs_root, job)
+    else:
+        try:
+            os.remove(checkpoint_path(efs_root, user_profile_name))
+        except FileNotFoundError:
+            pass
+    return job
+
+
+if __name__ == "__main__":
+    # Fargate entry point for trees the Lambda could not finish before its timeout
+    user = os.environ["REPERMISSION_USER"]
+    efs_root = os.environ.get("REPERMISSION_EFS_ROOT", "/mnt/efs")
+    if not acquire_job_lock(efs_root, user):
+        # the Lambda resumed the job again, it hands off once more if it cannot finish
+        print(f"re-ownership job for {user} is running elsewhere")
+        raise SystemExit(0)
+    try:
+        result = run_job(efs_root, user, int(os.environ.get("REPERMISSION_WORKERS", "32")))
+    finally:
+        release_job_lock(efs_root, user)
+    if result is None:
+        print(f"no re-ownership job for {user}")
+    else:
+        print(json.dumps({key: value for key, value in result.items() if key != "pending"}))
@@ -21,13 +21,58 @@ import logging
 import os
 import shutil
 import subprocess
+import time
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+from aws_clients import client
+from instrumentation import instrument_handler, log, span
+from repermission import acquire_job_lock, load_checkpoint, release_job_lock, run_job, start_job
 
 MOUNT_POINT = '/mnt/efs/'
 DELETED_DIRECTORY = os.path.join(MOUNT_POINT, "deleted")
 EBS_BACKUP_DIRECTORY = os.path.join(MOUNT_POINT, "space_ebs_backup")
+# users.yaml index shipped in a layer
+USERS_INDEX_PATH = "/opt/users-index.json"
+NON_RECURSIVE_USER_DIRECTORIES = os.environ.get("NON_RECURSIVE_USER_DIRECTORIES", "false").lower() == "true"
+REPERMISSION_WORKERS = int(os.environ.get("REPERMISSION_WORKERS", "16"))
+# the Fargate task that finishes re-ownership jobs, not set when the handoff is disabled
+REPERMISSION_CLUSTER_ARN = os.environ.get("REPERMISSION_CLUSTER_ARN")
+REPERMISSION_TASK_DEFINITION_ARN = os.environ.get("REPERMISSION_TASK_DEFINITION_ARN")
+REPERMISSION_SUBNETS = os.environ.get("REPERMISSION_SUBNETS", "")
+REPERMISSION_SECURITY_GROUP = os.environ.get("REPERMISSION_SECURITY_GROUP")
+# stop the walk this long before the Lambda timeout to checkpoint and start the Fargate task
+REPERMISSION_HANDOFF_MARGIN_SECONDS = 60
+
+
+def load_users_index():
+    if not os.path.exists(USERS_INDEX_PATH):
+        return None
+    with open(USERS_INDEX_PATH) as f:
+        return json.load(f)
+
+
+USERS_INDEX = load_users_index()
+
+
+def check_posix_identity(user_profile_name, user_uid, user_gid):
+    # profiles created outside the stack are not in the index and keep the identity from the event
+    if USERS_INDEX is None:
+        return
+    user = USERS_INDEX["users"].get(user_profile_name)
+    if user is None:
+        log("user_not_in_users_yaml", user_profile_name=user_profile_name)
+        return
+    if (user["uid"], user["gid"]) != (int(user_uid), int(user_gid)):
+        log(
+            "posix_identity_mismatch",
+            level=logging.WARNING,
+            user_profile_name=user_profile_name,
+            event_identity=f"{user_uid}:{user_gid}",
+            users_yaml_identity=f"{user['uid']}:{user['gid']}",
+        )
+    owner = USERS_INDEX["uids"].get(str(user_uid))
+    if owner not in (None, user_profile_name):
+        log("uid_owned_by_other_user", level=logging.WARNING, uid=user_uid, user_profile_name=user_profile_name,
+            owner=owner)
 
 
 def create_user_efs_dir(event):
@@ -36,37 +81,131 @@ def create_user_efs_dir(event):
     user_uid = event['detail']['requestParameters']['userSettings']['customPosixUserConfig']['uid']
     user_gid = event['detail']['requestParameters']['userSettings']['customPosixUserConfig']['gid']
 
-    logger.info(
-        f"domainId: {domain_id}; "
-        f"userProfileName: {user_profile_name}; "
-        f"event_uid: {user_uid} event_gid: {user_gid}"
-    )
+    log("create_user_profile", domain_id=domain_id, user_profile_name=user_profile_name, uid=user_uid, gid=user_gid)
+    check_posix_identity(user_profile_name, user_uid, user_gid)
+    if NON_RECURSIVE_USER_DIRECTORIES and USERS_INDEX is not None and user_profile_name in USERS_INDEX["users"]:
+        return create_user_root(user_profile_name)
 
     # Create the mount point directory if it doesn't exist
     if not os.path.exists(MOUNT_POINT):
         os.makedirs(MOUNT_POINT)
-        logger.info(f'Created mount point directory: {MOUNT_POINT}')
-    else:
-        logger.info(f'Mount point directory already exists: {MOUNT_POINT}')
+        log("created_mount_point", path=MOUNT_POINT)
 
     # Create directories in the mounted EFS file system
     directory_path = os.path.join(MOUNT_POINT, user_profile_name)
-    os.makedirs(directory_path, exist_ok=True)
-    logger.info(f'Created directory: {directory_path}')
-    logger.info(f"Directories in {MOUNT_POINT}: {os.listdir(MOUNT_POINT)}")
+    with span("create_directory", path=directory_path):
+        os.makedirs(directory_path, exist_ok=True)
     # input validation check
     if os.path.isdir(directory_path):
-        logger.info(f'Running chown on {directory_path} to {user_uid}')
-        subprocess.call(["chown", "-R", str(user_uid), directory_path])
+        with span("chown_recursive", path=directory_path, uid=user_uid) as fields:
+            fields["exit_code"] = subprocess.call(["chown", "-R", str(user_uid), directory_path])
         stat_info = os.stat(directory_path)
-        uid = stat_info.st_uid
-        gid = stat_info.st_gid
-        mode = stat_info.st_mode
-        logger.info(f"uid: {uid}, gid: {gid}, mode: {mode}")
+        log("directory_owner", path=directory_path, uid=stat_info.st_uid, gid=stat_info.st_gid,
+            mode=oct(stat_info.st_mode))
+        with span("chmod_recursive", path=directory_path, mode="770") as fields:
+            fields["exit_code"] = subprocess.call(["chmod", "-R", "770", directory_path])
+        return directory_path
+
 
-        logger.info(f'Running chmod on {directory_path} with 770 permission')
-        subprocess.call(["chmod", "-R", "770", directory_path])
+def create_user_root(user_profile_name):
+    # the users.yaml identity applied to the directory itself only: everything below it is created by the user,
+    # so an existing directory needs no permission walk
+    user = USERS_INDEX["users"][user_profile_name]
+    directory_path = os.path.join(MOUNT_POINT, user_profile_name)
+    try:
+        os.mkdir(directory_path, 0o770)
+    except FileExistsError:
+        log("directory_exists", path=directory_path)
         return directory_path
+    os.chown(directory_path, user["uid"], user["gid"])
+    os.chmod(directory_path, 0o770)
+    log("created_directory", path=directory_path, uid=user["uid"], gid=user["gid"])
+    return directory_path
+
+
+def update_user_efs_owner(event, context):
+    user_profile_name = event['detail']['requestParameters']['userProfileName']
+    posix_config = (event['detail']['requestParameters'].get('userSettings') or {}).get('customPosixUserConfig')
+    if not posix_config:
+        log("no_posix_change", user_profile_name=user_profile_name)
+        return None
+    user_uid, user_gid = int(posix_config['uid']), int(posix_config['gid'])
+    log("update_user_profile", user_profile_name=user_profile_name, uid=user_uid, gid=user_gid)
+    check_posix_identity(user_profile_name, user_uid, user_gid)
+
+    # the user's directory and the EBS backups of the spaces users.yaml assigns to the user
+    spaces = []
+    if USERS_INDEX is not None and user_profile_name in USERS_INDEX["users"]:
+        spaces = USERS_INDEX["users"][user_profile_name]["spaces"]
+    roots = [user_profile_name] + [os.path.join("space_ebs_backup", space) for space in spaces]
+    # the Fargate handoff and a retried or newer update must not walk the same checkpoint at once
+    if not acquire_job_lock(MOUNT_POINT, user_profile_name):
+        job = load_checkpoint(MOUNT_POINT, user_profile_name)
+        if job is not None and (job["uid"], job["gid"]) == (user_uid, user_gid):
+            log("repermission_running", user_profile_name=user_profile_name, uid=user_uid, gid=user_gid)
+            return None
+        # a different identity must not be dropped, the failed invocation is retried
+        raise RuntimeError(f"Re-ownership job for {user_profile_name} is running, retry {user_uid}:{user_gid} later")
+    try:
+        # stack updates send the full user settings again, an unchanged identity must not walk the tree
+        job = load_checkpoint(MOUNT_POINT, user_profile_name)
+        if job is None and roots_owned_by(roots, user_uid, user_gid):
+            log("posix_identity_unchanged", user_profile_name=user_profile_name, uid=user_uid, gid=user_gid)
+            return None
+        # an unfinished job for the same identity resumes from its checkpoint
+        if job is None or (job["uid"], job["gid"]) != (user_uid, user_gid):
+            start_job(MOUNT_POINT, user_profile_name, user_uid, user_gid, roots)
+        deadline = time.time() + context.get_remaining_time_in_millis() / 1000 - REPERMISSION_HANDOFF_MARGIN_SECONDS
+        with span("reown_tree", user_profile_name=user_profile_name, uid=user_uid, gid=user_gid) as fields:
+            job = run_job(MOUNT_POINT, user_profile_name, REPERMISSION_WORKERS, deadline)
+            fields.update(scanned=job["scanned"], changed=job["changed"], errors=job["errors"],
+                          pending=len(job["pending"]))
+    finally:
+        release_job_lock(MOUNT_POINT, user_profile_name)
+    if job["pending"]:
+        hand_off_repermission(user_profile_name)
+    return job
+
+
+def roots_owned_by(roots, uid, gid):
+    # the user directory and every space backup, a job interrupted after some roots left the others behind
+    for root in roots:
+        try:
+            stat_info = os.lstat(os.path.join(MOUNT_POINT, root))
+        except FileNotFoundError:
+            continue
+        if (stat_info.st_uid, stat_info.st_gid) != (uid, gid):
+            return False
+    return True
+
+
+def hand_off_repermission(user_profile_name):
+    # the checkpoint on EFS carries the job, the task only needs to know whose
+    if not REPERMISSION_TASK_DEFINITION_ARN:
+        log("repermission_incomplete", level=logging.WARNING, user_profile_name=user_profile_name)
+        return
+    with span("run_repermission_task", user_profile_name=user_profile_name) as fields:
+        response = client("ecs").run_task(
+            cluster=REPERMISSION_CLUSTER_ARN,
+            taskDefinition=REPERMISSION_TASK_DEFINITION_ARN,
+            launchType="FARGATE",
+            networkConfiguration={
+                "awsvpcConfiguration": {
+                    "subnets": REPERMISSION_SUBNETS.split(","),
+                    "securityGroups": [REPERMISSION_SECURITY_GROUP],
+                    "assignPublicIp": "ENABLED",
+                }
+            },
+            overrides={
+                "containerOverrides": [{
+                    "name": "RepermissionContainer",
+                    "environment": [{"name": "REPERMISSION_USER", "value": user_profile_name}],
+                }]
+            },
+        )
+        if response.get("failures"):
+            raise RuntimeError(f"Re-ownership task for {user_profile_name} failed to start: {response['failures']}")
+        fields["task_arn"] = response["tasks"][0]["taskArn"]
 
 
 def delete_user_efs_dir(event):
@@ -74,46 +213,37 @@ def delete_user_efs_dir(event):
 
     if not os.path.exists(DELETED_DIRECTORY):
         os.makedirs(DELETED_DIRECTORY)
-        logger.info(f'Created deleted directory: {DELETED_DIRECTORY}')
-    else:
-        logger.info(f'deleted directory already exists: {MOUNT_POINT}')
+        log("created_deleted_directory", path=DELETED_DIRECTORY)
 
     source_dir = os.path.join(MOUNT_POINT, user_profile_name)
     destination_dir = os.path.join(DELETED_DIRECTORY, user_profile_name)
-    logger.info(f"Moving: {source_dir}, to: {destination_dir}")
-    dest = shutil.move(source_dir, destination_dir)
-    logger.info(f"Output: {dest}")
-
-    logger.info(f"Directories in {MOUNT_POINT}: {os.listdir(MOUNT_POINT)}")
-    logger.info(f"Directories in {DELETED_DIRECTORY}: {os.listdir(DELETED_DIRECTORY)}")
+    with span("move_to_deleted", source=source_dir) as fields:
+        fields["destination"] = shutil.move(source_dir, destination_dir)
 
 
 def create_ebs_backup_dir():
     if not os.path.exists(EBS_BACKUP_DIRECTORY):
         os.makedirs(EBS_BACKUP_DIRECTORY)
-        logger.info(f'Created ebs backup directory: {EBS_BACKUP_DIRECTORY}')
         subprocess.call(["chmod", "-R", "777", EBS_BACKUP_DIRECTORY])
-    else:
-        logger.info('ebs backup directory already exists.')
+        log("created_ebs_backup_directory", path=EBS_BACKUP_DIRECTORY)
 
 
+@instrument_handler
 def lambda_handler(event, context):
-    logger.info(f"event: {event}")
     event_type = event['detail']['eventName']
-    logger.info(f"event_type: {event_type}")  # DeleteUserProfile, CreateUserProfile
-    logger.info(f"context: {context}")
+    # DeleteUserProfile, CreateUserProfile, UpdateUserProfile
+    log("event", event_type=event_type, event_id=event.get("id"), request_id=context.aws_request_id)
 
     create_ebs_backup_dir()
-    logger.info(f"Directories in /mnt/: {os.listdir('/mnt/')}")
-    logger.info(f"Directories in /mnt/efs/: {os.listdir('/mnt/efs/')}")
 
     if event_type == "DeleteUserProfile":
         delete_user_efs_dir(event)
     elif event_type == "CreateUserProfile":
-        user_efs_dir = create_user_efs_dir(event)
-        logger.info(f"EFS new dir {user_efs_dir} created.")
+        create_user_efs_dir(event)
+    elif event_type == "UpdateUserProfile":
+        update_user_efs_owner(event, context)
     else:
-        raise ValueError("Valid Events are DeleteUserProfile or CreateUserProfile")
+        raise ValueError("Valid Events are DeleteUserProfile, CreateUserProfile or UpdateUserProfile")
 
     return {
         'statusCode': 200,
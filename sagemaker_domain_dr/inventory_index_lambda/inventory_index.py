@@ -0,0 +1,200 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gzip
+import json
+import os
+import time
+from urllib.parse import quote
+
+from instrumentation import instrument_handler, log, span
+
+MOUNT_POINT = '/mnt/efs/'
+EBS_BACKUP_DIRECTORY_NAME = "space_ebs_backup"
+# lives next to the data so it replicates to the DR region with it
+INVENTORY_DIRECTORY = os.path.join(MOUNT_POINT, ".sagemaker-dr", "inventory")
+SUMMARY_FILE = os.path.join(INVENTORY_DIRECTORY, "summary.json")
+INVENTORY_PER_FILE = os.environ.get("INVENTORY_PER_FILE", "true").lower() == "true"
+# stop starting new shards when less than this is left of the invocation
+SHARD_TIME_RESERVE_MS = 120 * 1000
+
+
+def shard_file(shard):
+    return os.path.join(INVENTORY_DIRECTORY, f"{quote(shard, safe='')}.tsv.gz")
+
+
+def list_shards():
+    # one shard per user directory and per space backup, so a run can refresh them independently
+    shards = []
+    for entry in os.scandir(MOUNT_POINT):
+        if entry.name.startswith(".") or not entry.is_dir(follow_symlinks=False):
+            continue
+        if entry.name == EBS_BACKUP_DIRECTORY_NAME:
+            for space_entry in os.scandir(entry.path):
+                if not space_entry.name.startswith(".") and space_entry.is_dir(follow_symlinks=False):
+                    shards.append(f"{EBS_BACKUP_DIRECTORY_NAME}/{space_entry.name}")
+        else:
+            shards.append(entry.name)
+    return shards
+
+
+def read_shard_rows(shard):
+    """Rows of the shard's previous index grouped by parent directory, with the indexed directory mtimes."""
+    dir_mtimes = {}
+    children = {}
+    if not INVENTORY_PER_FILE or not os.path.exists(shard_file(shard)):
+        return dir_mtimes, children
+    with gzip.open(shard_file(shard), "rb") as f:
+        buffer = b""
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            records = (buffer + chunk).split(b"\0")
+            buffer = records.pop()
+            for record in records:
+                kind, mtime_ns, size, path = record.split(b"\t", 3)
+                relative_path = os.fsdecode(path)
+                if kind == b"d":
+                    dir_mtimes[relative_path] = int(mtime_ns)
+                if relative_path != shard:
+                    children.setdefault(relative_path.rsplit("/", 1)[0], []).append(
+                        (kind.decode(), int(mtime_ns), int(size), relative_path)
+                    )
+    return dir_mtimes, children
+
+
+def list_entries(relative_dir, dir_mtime_ns, previous):
+    """
+    (kind, mtime_ns, size, path) of a directory's entries. A directory whose mtime is the one
+    indexed last time has the same entries, its files come from the previous index without a
+    stat and only its subdirectories are stat'ed to find the changed ones below it. The size and
+    mtime of a file rewritten in place are refreshed once its directory changes.
+    """
+    dir_mtimes, children = previous
+    if dir_mtimes.get(relative_dir) == dir_mtime_ns:
+        for kind, mtime_ns, size, relative_path in children.get(relative_dir, []):
+            if kind == "d":
+                try:
+                    mtime_ns = os.stat(os.path.join(MOUNT_POINT, relative_path), follow_symlinks=False).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+            yield kind, mtime_ns, size, relative_path
+        return
+    try:
+        entries = os.scandir(os.path.join(MOUNT_POINT, relative_dir))
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat_info = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            kind = "d" if entry.is_dir(follow_symlinks=False) else "f"
+            yield kind, stat_info.st_mtime_ns, stat_info.st_size, f"{relative_dir}/{entry.name}"
+
+
+def scan_shard(shard, deadline):
+    """
+    Walk one shard and write its rows, `<kind>\\t<mtime_ns>\\t<size>\\t<path>` separated by NUL,
+    with each directory row ahead of its children. Directories unchanged since the previous
+    index are not re-listed, see list_entries. Returns the shard summary, or None when the
+    deadline passed before the walk finished.
+    """
+    summary = {"files": 0, "bytes": 0, "last_modified": 0, "directories": 0, "per_file": INVENTORY_PER_FILE}
+    previous = read_shard_rows(shard)
+    tmp_path = f"{shard_file(shard)}.tmp"
+    with gzip.open(tmp_path, "wb", compresslevel=1) as out:
+        root_mtime_ns = os.stat(os.path.join(MOUNT_POINT, shard)).st_mtime_ns
+        if INVENTORY_PER_FILE:
+            out.write(f"d\t{root_mtime_ns}\t0\t".encode() + os.fsencode(shard) + b"\0")
+        pending = [(shard, root_mtime_ns)]
+        while pending:
+            if time.time() > deadline:
+                out.close()
+                os.remove(tmp_path)
+                return None
+            relative_dir, dir_mtime_ns = pending.pop()
+            for kind, mtime_ns, size, relative_path in list_entries(relative_dir, dir_mtime_ns, previous):
+                if kind == "d":
+                    summary["directories"] += 1
+                    pending.append((relative_path, mtime_ns))
+                else:
+                    summary["files"] += 1
+                    summary["bytes"] += size
+                    summary["last_modified"] = max(summary["last_modified"], mtime_ns / 1e9)
+                if INVENTORY_PER_FILE:
+                    out.write(f"{kind}\t{mtime_ns}\t{size}\t".encode() + os.fsencode(relative_path) + b"\0")
+    os.replace(tmp_path, shard_file(shard))
+    return summary
+
+
+def load_summary():
+    if not os.path.exists(SUMMARY_FILE):
+        return {"shards": {}}
+    with open(SUMMARY_FILE) as f:
+        return json.load(f)
+
+
+def save_summary(summary):
+    summary["updated_at"] = time.time()
+    tmp_path = f"{SUMMARY_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(summary, f)
+    os.replace(tmp_path, SUMMARY_FILE)
+
+
+@instrument_handler
+def lambda_handler(event, context):
+    os.makedirs(INVENTORY_DIRECTORY, exist_ok=True)
+    summary = load_summary()
+    with span("list_shards") as fields:
+        shards = list_shards()
+        fields["shards"] = len(shards)
+    for removed_shard in set(summary["shards"]) - set(shards):
+        del summary["shards"][removed_shard]
+        if os.path.exists(shard_file(removed_shard)):
+            os.remove(shard_file(removed_shard))
+
+    # never scanned shards first, then the stalest, so repeated runs cycle through every shard
+    shards.sort(key=lambda shard: summary["shards"].get(shard, {}).get("scanned_at", 0))
+    deadline = time.time() + (context.get_remaining_time_in_millis() - SHARD_TIME_RESERVE_MS) / 1000
+    scanned_shards = 0
+    for shard in shards:
+        if time.time() > deadline:
+            break
+        scan_started_at = time.time()
+        with span("scan_shard", shard=shard) as fields:
+            shard_summary = scan_shard(shard, deadline)
+            fields["completed"] = shard_summary is not None
+            if shard_summary is not None:
+                fields.update(files=shard_summary["files"], bytes=shard_summary["bytes"])
+        if shard_summary is None:
+            # retried first on the next run
+            break
+        shard_summary["scanned_at"] = scan_started_at
+        summary["shards"][shard] = shard_summary
+        save_summary(summary)
+        scanned_shards += 1
+    save_summary(summary)
+    log("inventory_run", scanned_shards=scanned_shards, total_shards=len(shards))
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({"scanned_shards": scanned_shards, "total_shards": len(shards)})
+    }
@@ -13,5 +13,113 @@ echo ${time_now}
 
 printenv > env.log
 
-mkdir -p custom-file-systems/efs/${efs_id}/space_ebs_backup/${SAGEMAKER_SPACE_NAME}
-rsync -a --ignore-existing --exclude custom-file-systems ./ custom-file-systems/efs/${efs_id}/space_ebs_backup/${SAGEMAKER_SPACE_NAME}/
\ No newline at end of file
+# rendered at deploy time from constants.py
+backup_format=files
+segment_files=20000
+full_backup_every=30
+max_kbps=0
+max_files_per_second=0
+
+sync_filter=$(mktemp)
+echo "- custom-file-systems" > ${sync_filter}
+# SYNC_RULES_BEGIN
+# rendered at deploy time from the SyncRules in users.yaml
+# SYNC_RULES_END
+
+bwlimit=""
+if [ "${max_kbps}" -gt 0 ]; then
+    bwlimit="--bwlimit=${max_kbps}"
+fi
+
+throttle() {
+    # sleep off whatever a batch of $1 files and $2 bytes started at $3 finished ahead of the limits
+    local budget=0
+    local elapsed=$(( $(date +%s) - $3 ))
+    if [ "${max_files_per_second}" -gt 0 ]; then
+        budget=$(( $1 / max_files_per_second ))
+    fi
+    if [ "${max_kbps}" -gt 0 ] && [ $(( $2 / 1024 / max_kbps )) -gt ${budget} ]; then
+        budget=$(( $2 / 1024 / max_kbps ))
+    fi
+    if [ ${budget} -gt ${elapsed} ]; then
+        sleep $(( budget - elapsed ))
+    fi
+}
+
+backup_dir=custom-file-systems/efs/${efs_id}/space_ebs_backup/${SAGEMAKER_SPACE_NAME}
+mkdir -p ${backup_dir}
+if [ "${backup_format}" != "archive" ] && [ "${max_files_per_second}" -eq 0 ]; then
+    rsync -a --ignore-existing ${bwlimit} --filter="merge ${sync_filter}" ./ ${backup_dir}/
+    exit 0
+fi
+if [ "${backup_format}" != "archive" ]; then
+    # files per second limit: copy what the dry run selects in batches of about ten seconds each
+    batch_dir=$(mktemp -d)
+    rsync -a --dry-run --ignore-existing --out-format='%n' --filter="merge ${sync_filter}" ./ ${backup_dir}/ \
+        | grep -v '^\./$' > ${batch_dir}/files || true
+    split -l $(( max_files_per_second * 10 )) -d -a 6 ${batch_dir}/files ${batch_dir}/batch-
+    for batch in $(ls ${batch_dir} | grep "^batch-"); do
+        batch_started_at=$(date +%s)
+        rsync -a --ignore-existing ${bwlimit} --files-from=${batch_dir}/${batch} ./ ${backup_dir}/
+        throttle $(wc -l < ${batch_dir}/${batch}) 0 ${batch_started_at}
+    done
+    rm -rf ${batch_dir}
+    exit 0
+fi
+
+# archive format: compressed tar segments of at most segment_files entries, plus index.tsv mapping
+# every path to its segment and tar block, so replication and recovery move a handful of files
+segment_dir=${backup_dir}/segments
+mkdir -p ${segment_dir}
+if command -v zstd > /dev/null; then
+    compress="zstd -q -T0"
+    extension=tar.zst
+else
+    compress="gzip"
+    extension=tar.gz
+fi
+last_backup=$(cat ${segment_dir}/last-backup 2> /dev/null || echo 0)
+backup_runs=$( (ls ${segment_dir} | grep -E '\.tar\.(zst|gz)$' | cut -d- -f1 | sort -u | wc -l) || echo 0)
+newer=""
+if [ "${last_backup}" != 0 ] && [ "${backup_runs}" -lt "${full_backup_every}" ]; then
+    # incremental run appends a segment with the files changed since the last backup
+    newer="--newer=@${last_backup}"
+fi
+
+work_dir=$(mktemp -d)
+empty_dir=$(mktemp -d)
+# a dry run into an empty directory lists exactly what the rsync filter rules select
+rsync -a --dry-run --out-format='%n' --filter="merge ${sync_filter}" ./ ${empty_dir}/ | grep -v '^\./$' > ${work_dir}/files || true
+split -l ${segment_files} -d -a 4 ${work_dir}/files ${work_dir}/chunk-
+touch ${work_dir}/index.tsv
+for chunk in $(ls ${work_dir} | grep "^chunk-[0-9]*$"); do
+    segment=${time_now}-${chunk#chunk-}.${extension}
+    chunk_started_at=$(date +%s)
+    tar -c -v -R --index-file=${work_dir}/${chunk}.blocks --no-recursion --verbatim-files-from \
+        -T ${work_dir}/${chunk} ${newer} -f - | ${compress} > ${segment_dir}/${segment}.tmp
+    if ! grep -q -v '/$' ${work_dir}/${chunk}.blocks; then
+        # nothing but directories changed in this chunk
+        rm ${segment_dir}/${segment}.tmp
+        continue
+    fi
+    mv ${segment_dir}/${segment}.tmp ${segment_dir}/${segment}
+    throttle $(wc -l < ${work_dir}/${chunk}.blocks) $(stat -c %s ${segment_dir}/${segment}) ${chunk_started_at}
+    awk -v segment=${segment} '/^block [0-9]+: / {
+        block = $2; sub(/:$/, "", block); path = $0; sub(/^block [0-9]+: /, "", path)
+        print segment "\t" block "\t" path
+    }' ${work_dir}/${chunk}.blocks >> ${work_dir}/index.tsv
+done
+
+if [ -z "${newer}" ]; then
+    # a full run replaces every older segment
+    for segment in $(ls ${segment_dir} | grep -E '\.tar\.(zst|gz)$' | grep -v "^${time_now}-"); do
+        rm ${segment_dir}/${segment}
+    done
+else
+    cat ${segment_dir}/index.tsv ${work_dir}/index.tsv > ${work_dir}/index.merged
+    mv ${work_dir}/index.merged ${work_dir}/index.tsv
+fi
+cp ${work_dir}/index.tsv ${segment_dir}/index.tsv.tmp
+mv ${segment_dir}/index.tsv.tmp ${segment_dir}/index.tsv
+echo ${time_now} > ${segment_dir}/last-backup
+rm -rf ${work_dir} ${empty_dir}
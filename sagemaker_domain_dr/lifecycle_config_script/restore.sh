@@ -1,4 +1,5 @@
 #!/bin/bash
+# restores the whole space backup, or only the given paths from an archive backup: restore.sh [path ...]
 
 set -eux
 
@@ -13,4 +14,65 @@ echo ${time_now}
 
 printenv > env.log
 
-rsync -a --ignore-existing custom-file-systems/efs/${efs_id}/space_ebs_backup/${SAGEMAKER_SPACE_NAME}/ ./recovery/
\ No newline at end of file
+backup_dir=custom-file-systems/efs/${efs_id}/space_ebs_backup/${SAGEMAKER_SPACE_NAME}
+segment_dir=${backup_dir}/segments
+# the staging directory is not listable, so look the archive up by name
+prehydrated=""
+for extension in tar.zst tar.gz; do
+    staged=custom-file-systems/efs/${efs_id}/.sagemaker-dr/prehydrated/${SAGEMAKER_SPACE_NAME}.${extension}
+    if [ -z "${prehydrated}" ] && [ -r ${staged} ]; then
+        prehydrated=${staged}
+    fi
+done
+# the archive is a snapshot of one recovery: a backup directory changed since (a later sync, a backup taken in this
+# domain) holds files the archive is missing or has older copies of
+if [ -n "${prehydrated}" ] \
+    && [ -n "$(find ${backup_dir} -type d -cnewer ${prehydrated} -print -quit 2>/dev/null)" ]; then
+    echo "prehydrated archive is older than the backup, copying the backup instead"
+    prehydrated=""
+fi
+
+decompress() {
+    case "$1" in
+        *.zst) zstd -dc "$1" ;;
+        *) gzip -dc "$1" ;;
+    esac
+}
+
+if [ $# -eq 0 ] && [ -n "${prehydrated}" ]; then
+    # staged by the recovery state machine: one sequential read instead of a per-file copy
+    mkdir -p ./recovery
+    decompress ${prehydrated} | tar -x --skip-old-files -C ./recovery -f -
+    exit 0
+fi
+
+if [ ! -f ${segment_dir}/index.tsv ]; then
+    rsync -a --ignore-existing ${backup_dir}/ ./recovery/
+    exit 0
+fi
+
+# keep the extractor next to the recovered files for later single file restores
+cp "$0" ./.sagemaker-dr-restore.sh || true
+mkdir -p ./recovery
+
+if [ $# -eq 0 ]; then
+    # newest segments first, --skip-old-files then keeps the latest copy of every path
+    for segment in $(ls -r ${segment_dir} | grep -E '\.tar\.(zst|gz)$'); do
+        decompress ${segment_dir}/${segment} | tar -x --skip-old-files -C ./recovery -f -
+    done
+    exit 0
+fi
+
+for path in "$@"; do
+    path=${path#./}
+    # the last index entry is the newest copy
+    entry=$(awk -F '\t' -v path="${path}" '$3 == path { entry = $1 " " $2 } END { print entry }' ${segment_dir}/index.tsv)
+    if [ -z "${entry}" ]; then
+        echo "${path} is not in the backup index"
+        exit 1
+    fi
+    read segment block <<< "${entry}"
+    # start tar at the indexed header block instead of scanning the segment from the beginning
+    decompress ${segment_dir}/${segment} | tail -c +$((block * 512 + 1)) \
+        | tar -x --occurrence=1 -C ./recovery -f - -- "${path}"
+done
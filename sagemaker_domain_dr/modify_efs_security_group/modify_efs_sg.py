@@ -16,54 +16,49 @@
  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import json
-import logging
 import os
 
-import boto3
-
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+from aws_clients import client
+from instrumentation import instrument_handler, log
 
 EFS_ID = os.environ["EFS_ID"]
 DOMAIN_ID = os.environ["DOMAIN_ID"]
 
 
 def get_sagemaker_domain_security_group_id():
-    ec2 = boto3.client("ec2")
     group_name = f"security-group-for-inbound-nfs-{DOMAIN_ID}"
-    response = ec2.describe_security_groups(
+    response = client("ec2").describe_security_groups(
         Filters=[
             dict(Name="group-name", Values=[group_name])
         ]
     )
     group_id = response["SecurityGroups"][0]["GroupId"]
-    logger.info(f"Sagemaker Domain {DOMAIN_ID} SG: {group_id}")
+    log("domain_security_group", domain_id=DOMAIN_ID, security_group_id=group_id)
     return group_id
 
 
+@instrument_handler
 def lambda_handler(event, context):
-    efs_client = boto3.client("efs")
+    efs_client = client("efs")
     mount_target_list = efs_client.describe_mount_targets(
         FileSystemId=EFS_ID
     )["MountTargets"]
-    logger.info(f"MountTargets: {mount_target_list}")
+    log("mount_targets", file_system_id=EFS_ID, mount_target_ids=[mt["MountTargetId"] for mt in mount_target_list])
+    # one domain security group for every mount target
+    new_sg = get_sagemaker_domain_security_group_id() if mount_target_list else None
     for mount_target in mount_target_list:
         mount_target_id = mount_target["MountTargetId"]
         existing_sg_list = efs_client.describe_mount_target_security_groups(
             MountTargetId=mount_target_id
         )["SecurityGroups"]
-        logger.info(f"Existing SG list: {existing_sg_list}")
-        new_sg = get_sagemaker_domain_security_group_id()
         if new_sg not in existing_sg_list:
-            logger.info(f"SG {new_sg} needs to be added to {mount_target_id}")
             modified_security_group_ids = existing_sg_list + [new_sg]
-            logger.info(f"Modified SG list: {modified_security_group_ids}")
-            response = efs_client.modify_mount_target_security_groups(
+            efs_client.modify_mount_target_security_groups(
                 MountTargetId=mount_target_id,
                 SecurityGroups=modified_security_group_ids
             )
-        logger.info(f"Security groups {new_sg} added successfully.")
+        log("mount_target_security_groups", mount_target_id=mount_target_id, security_group_ids=existing_sg_list,
+            added=new_sg not in existing_sg_list)
     return {
         "statusCode": 200,
     }
@@ -0,0 +1,87 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+
+from aws_clients import client
+from instrumentation import instrument_handler, log
+
+EFS_ID_PARAMETER = os.environ.get("EFS_ID_PARAMETER")
+METRIC_NAMESPACE = os.environ.get("METRIC_NAMESPACE", "SagemakerDomainDR")
+
+
+def measure_replication_lag(efs_client, file_system_id, now=None):
+    """
+    Replication lag per destination of file_system_id, in seconds since the last replication that completed.
+    Files changed after it are not on the replica yet, i.e. the data a recovery started now would lose.
+    """
+    now = now or datetime.now(timezone.utc)
+    replications = efs_client.describe_replication_configurations(
+        FileSystemId=file_system_id
+    )["Replications"]
+    measurements = []
+    for replication in replications:
+        for destination in replication["Destinations"]:
+            last_replicated_at = destination.get("LastReplicatedTimestamp")
+            measurements.append({
+                "destination_file_system_id": destination["FileSystemId"],
+                "destination_region": destination["Region"],
+                "status": destination["Status"],
+                # no timestamp until the initial copy finished, the replica has no consistent point yet
+                "lag_seconds": (now - last_replicated_at).total_seconds() if last_replicated_at else None,
+            })
+    return measurements
+
+
+def metric_data(file_system_id, measurements):
+    data = []
+    for measurement in measurements:
+        dimensions = [
+            {"Name": "FileSystemId", "Value": file_system_id},
+            {"Name": "DestinationRegion", "Value": measurement["destination_region"]},
+        ]
+        data.append({
+            "MetricName": "ReplicationHealthy",
+            "Dimensions": dimensions,
+            "Value": 1 if measurement["status"] == "ENABLED" and measurement["lag_seconds"] is not None else 0,
+            "Unit": "Count",
+        })
+        if measurement["lag_seconds"] is not None:
+            data.append({
+                "MetricName": "ReplicationLagSeconds",
+                "Dimensions": dimensions,
+                "Value": measurement["lag_seconds"],
+                "Unit": "Seconds",
+            })
+    return data
+
+
+@instrument_handler
+def lambda_handler(event, context):
+    file_system_id = client("ssm").get_parameter(Name=EFS_ID_PARAMETER)["Parameter"]["Value"]
+    measurements = measure_replication_lag(client("efs"), file_system_id)
+    log("replication_lag", file_system_id=file_system_id, destinations=measurements)
+    data = metric_data(file_system_id, measurements)
+    if data:
+        client("cloudwatch").put_metric_data(Namespace=METRIC_NAMESPACE, MetricData=data)
+    return {
+        "statusCode": 200,
+        "body": json.dumps(measurements)
+    }
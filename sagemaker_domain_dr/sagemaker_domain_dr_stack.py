@@ -16,11 +16,8 @@
  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import base64
 import time
-import os
-import yaml
-
+from typing import Optional
 
 from constructs import Construct
 from aws_cdk import (
@@ -28,38 +25,97 @@ from aws_cdk import (
     aws_events as events,
     aws_events_targets as targets,
     aws_iam as iam,
+    aws_cloudwatch as cloudwatch,
     aws_ec2 as ec2,
+    aws_ecs as ecs,
     aws_efs as efs,
     aws_sagemaker as sagemaker,
     aws_ssm as ssm,
     Stack,
     Duration,
     RemovalPolicy,
+    Size,
     custom_resources as cr,
 )
-from aws_cdk import Environment
 
-from constants import PRIMARY_REGION, SECONDARY_REGION
+from constants import (
+    PRIMARY_REGION,
+    SECONDARY_REGIONS,
+    INVENTORY_INDEX_SCHEDULE,
+    USER_PROVISIONING_SHARDS,
+    NON_RECURSIVE_USER_DIRECTORIES,
+    REPERMISSION_WORKERS,
+    REPERMISSION_FARGATE_HANDOFF,
+    CUSTOM_EFS_THROUGHPUT_MODE,
+    CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS,
+    CUSTOM_EFS_PERFORMANCE_MODE,
+    REPLICATION_MONITOR_SCHEDULE,
+    RPO_ALARM_THRESHOLD_SECONDS,
+    LAMBDA_ARCHITECTURE,
+    SPACE_BACKUP_FORMAT,
+    SPACE_BACKUP_SEGMENT_FILES,
+    SPACE_BACKUP_FULL_EVERY,
+    BACKGROUND_SYNC_MAX_MIBPS,
+    BACKGROUND_SYNC_MAX_FILES_PER_SECOND,
+    SSM_PARAMETER_PREFIX,
+    DEPLOYMENT_NAME_SUFFIX,
+)
+from schedules import alarm_period_seconds
+from users_config import load_users_config, lifecycle_config_content, users_index_asset_dir
+from sagemaker_domain_dr.user_provisioning import provision_users, shard_users, UserProvisioningShardStack
+
+
+def custom_efs_performance_settings() -> dict:
+    # only set what constants.py overrides, adding an unchanged performance mode would still replace the EFS
+    settings = {}
+    if CUSTOM_EFS_THROUGHPUT_MODE is not None:
+        if CUSTOM_EFS_THROUGHPUT_MODE not in ("bursting", "elastic", "provisioned"):
+            raise ValueError("CUSTOM_EFS_THROUGHPUT_MODE must be bursting, elastic or provisioned.")
+        settings["throughput_mode"] = efs.ThroughputMode[CUSTOM_EFS_THROUGHPUT_MODE.upper()]
+    if CUSTOM_EFS_THROUGHPUT_MODE == "provisioned":
+        if not CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS:
+            raise ValueError("Provisioned throughput requires CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS.")
+        settings["provisioned_throughput_per_second"] = Size.mebibytes(CUSTOM_EFS_PROVISIONED_THROUGHPUT_MIBPS)
+    if CUSTOM_EFS_PERFORMANCE_MODE is not None:
+        if CUSTOM_EFS_PERFORMANCE_MODE not in ("generalPurpose", "maxIO"):
+            raise ValueError("CUSTOM_EFS_PERFORMANCE_MODE must be generalPurpose or maxIO.")
+        if CUSTOM_EFS_PERFORMANCE_MODE == "maxIO" and CUSTOM_EFS_THROUGHPUT_MODE == "elastic":
+            raise ValueError("Elastic throughput requires the generalPurpose performance mode.")
+        settings["performance_mode"] = efs.PerformanceMode[
+            "MAX_IO" if CUSTOM_EFS_PERFORMANCE_MODE == "maxIO" else "GENERAL_PURPOSE"
+        ]
+    return settings
 
 
 class SagemakerDomainDrStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, replica_region: Optional[str] = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         flag = "Primary" if self.region == PRIMARY_REGION else "Secondary"
+        # IAM names are global, secondary regions after the first one add their region
+        global_name_suffix = DEPLOYMENT_NAME_SUFFIX + (
+            "" if self.region in (PRIMARY_REGION, SECONDARY_REGIONS[0]) else f"-{self.region}"
+        )
 
         # Default VPC
         default_vpc = ec2.Vpc.from_lookup(self, id="DefaultVPC", is_default=True)
 
+        users_config = load_users_config()
+
         # Studio Lifecycle Config
         def get_studio_lifecycle_config():
             if self.region == PRIMARY_REGION:
-                with open("sagemaker_domain_dr/lifecycle_config_script/backup.sh") as f:
-                    script = f.read()
-            else:
-                with open("sagemaker_domain_dr/lifecycle_config_script/restore.sh") as f:
-                    script = f.read()
-            script_content = base64.b64encode(script.encode("utf-8")).decode("utf-8")
-            return script_content
+                return lifecycle_config_content(
+                    "sagemaker_domain_dr/lifecycle_config_script/backup.sh",
+                    render_rules=True,
+                    settings=(
+                        ("backup_format", SPACE_BACKUP_FORMAT),
+                        ("segment_files", SPACE_BACKUP_SEGMENT_FILES),
+                        ("full_backup_every", SPACE_BACKUP_FULL_EVERY),
+                        ("max_kbps", int(BACKGROUND_SYNC_MAX_MIBPS * 1024) if BACKGROUND_SYNC_MAX_MIBPS else 0),
+                        ("max_files_per_second", int(BACKGROUND_SYNC_MAX_FILES_PER_SECOND or 0)),
+                    ),
+                )
+            return lifecycle_config_content("sagemaker_domain_dr/lifecycle_config_script/restore.sh")
 
         jupyterlab_lifecycle_config_custom_resource = cr.AwsCustomResource(
             self,
@@ -133,7 +189,7 @@ class SagemakerDomainDrStack(Stack):
             self,
             f"RoleFor{flag}SagemakerStudioUsersNEW",
             assumed_by=iam.ServicePrincipal("sagemaker.amazonaws.com"),
-            role_name=f"Role{flag}SagemakerStudioUsersNEW",
+            role_name=f"Role{flag}SagemakerStudioUsersNEW{global_name_suffix}",
             managed_policies=[
                 iam.ManagedPolicy.from_managed_policy_arn(
                     self,
@@ -158,25 +214,22 @@ class SagemakerDomainDrStack(Stack):
         )
 
         # EFS & Replica
-        if self.region == PRIMARY_REGION:
-            custom_efs = efs.FileSystem(
-                self, "SageMakerDomainCustomEfs",
-                vpc=default_vpc,
-                file_system_policy=None,
-                replication_configuration=efs.ReplicationConfiguration.regional_file_system(SECONDARY_REGION),
-                removal_policy=RemovalPolicy.DESTROY
-            )
-        else:
-            custom_efs = efs.FileSystem(
-                self, "SageMakerDomainCustomEfs",
-                vpc=default_vpc,
-                file_system_policy=None,
-                removal_policy=RemovalPolicy.DESTROY
-            )
+        # EFS replicates a file system to one region only, app.py chains the secondary regions
+        replicate_custom_efs = replica_region is not None
+        custom_efs = efs.FileSystem(
+            self, "SageMakerDomainCustomEfs",
+            vpc=default_vpc,
+            file_system_policy=None,
+            replication_configuration=efs.ReplicationConfiguration.regional_file_system(
+                replica_region
+            ) if replicate_custom_efs else None,
+            removal_policy=RemovalPolicy.DESTROY,
+            **custom_efs_performance_settings()
+        )
         ssm.StringParameter(
             self,
             f"{flag}CustomEfsDefaultSecurityGroup",
-            parameter_name=f"/SagemakerDomain/{flag}/CustomEfsDefaultSecurityGroup",
+            parameter_name=f"{SSM_PARAMETER_PREFIX}/{flag}/CustomEfsDefaultSecurityGroup",
             string_value=custom_efs.connections.security_groups[0].security_group_id
         )
         efs_policy_removal = cr.AwsCustomResource(
@@ -206,14 +259,14 @@ class SagemakerDomainDrStack(Stack):
             # enforce the POSIX identity so lambda function will access with this identity
             posix_user=efs.PosixUser(uid="0", gid="0"),
         )
-        ssm.StringParameter(
+        custom_efs_id_parameter = ssm.StringParameter(
             self,
             f"{flag}CustomEfsId",
-            parameter_name=f"/SagemakerDomain/{flag}/CustomEfsId",
+            parameter_name=f"{SSM_PARAMETER_PREFIX}/{flag}/CustomEfsId",
             string_value=custom_efs.file_system_id
         )
         local_region_efs_id = custom_efs.file_system_id
-        if self.region == PRIMARY_REGION:
+        if replicate_custom_efs:
             replica_efs_id_retrieval = cr.AwsCustomResource(
                 self,
                 id="CustomEfsReplicaSSM",
@@ -236,7 +289,7 @@ class SagemakerDomainDrStack(Stack):
             ssm.StringParameter(
                 self,
                 f"{flag}CustomEfsReplicaId",
-                parameter_name=f"/SagemakerDomain/{flag}/ReplicaEfsId",
+                parameter_name=f"{SSM_PARAMETER_PREFIX}/{flag}/ReplicaEfsId",
                 string_value=replica_efs_id_retrieval.get_response_field(
                     'Replications.0.Destinations.0.FileSystemId'
                 )
@@ -270,7 +323,7 @@ class SagemakerDomainDrStack(Stack):
                     lifecycle_config_arns=[jupyterlab_lifecycle_config_arn]
                 ),
             ),
-            domain_name=f"sagemaker-domain-{flag}",
+            domain_name=f"sagemaker-domain-{flag}{DEPLOYMENT_NAME_SUFFIX}",
             vpc_id=default_vpc.vpc_id,
             subnet_ids=default_vpc.select_subnets().subnet_ids,
         )
@@ -280,16 +333,41 @@ class SagemakerDomainDrStack(Stack):
         ssm.StringParameter(
             self,
             f"{flag}SagemakerDomainId",
-            parameter_name=f"/SagemakerDomain/{flag}/DomainId",
+            parameter_name=f"{SSM_PARAMETER_PREFIX}/{flag}/DomainId",
             string_value=domain.attr_domain_id
         )
         ssm.StringParameter(
             self,
             f"{flag}OriginalEFSId",
-            parameter_name=f"/SagemakerDomain/{flag}/Original/EfsId",
+            parameter_name=f"{SSM_PARAMETER_PREFIX}/{flag}/Original/EfsId",
             string_value=domain.attr_home_efs_file_system_id
         )
 
+        lambda_architecture = (
+            aws_lambda.Architecture.ARM_64 if LAMBDA_ARCHITECTURE == "arm64" else aws_lambda.Architecture.X86_64
+        )
+        # timed spans, EMF metrics and compact JSON logs shared by every Lambda
+        instrumentation_layer = aws_lambda.LayerVersion(
+            self, f"{flag}InstrumentationLayer",
+            code=aws_lambda.Code.from_asset("lambda_layers/instrumentation/"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_12],
+            description="Tracing, timing and AWS client helpers for the SageMaker domain DR Lambdas",
+        )
+        # users.yaml index at /opt/users-index.json
+        users_index_layer = aws_lambda.LayerVersion(
+            self, f"{flag}UsersIndexLayer",
+            code=aws_lambda.Code.from_asset(users_index_asset_dir()),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_12],
+            description="Index of the users and spaces defined in users.yaml",
+        )
+        # resumable re-ownership walk, shared by the create user directory Lambda and its Fargate handoff task
+        repermission_layer = aws_lambda.LayerVersion(
+            self, f"{flag}RepermissionLayer",
+            code=aws_lambda.Code.from_asset("lambda_layers/repermission/", exclude=["Dockerfile"]),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_12],
+            description="Re-owns a user's EFS tree after a POSIX identity change",
+        )
+
         # EFS User Directory
         create_user_directory_lambda = aws_lambda.Function(
             self, f"{flag}CreateUserDirectoryLambda",
@@ -298,9 +376,15 @@ class SagemakerDomainDrStack(Stack):
             ),
             handler="create_user_directory.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_12,
+            architecture=lambda_architecture,
             description="Lambda that creates user directory in SageMaker domain custom EFS",
-            function_name=f"{flag}-create-user-directory",
-            environment={'efs_id': local_region_efs_id},
+            function_name=f"{flag}-create-user-directory{DEPLOYMENT_NAME_SUFFIX}",
+            environment={
+                'efs_id': local_region_efs_id,
+                'NON_RECURSIVE_USER_DIRECTORIES': str(NON_RECURSIVE_USER_DIRECTORIES).lower(),
+                'REPERMISSION_WORKERS': str(REPERMISSION_WORKERS),
+            },
+            layers=[users_index_layer, instrumentation_layer, repermission_layer],
             timeout=Duration.seconds(900),
             vpc=default_vpc,
             allow_public_subnet=True,
@@ -309,18 +393,205 @@ class SagemakerDomainDrStack(Stack):
             ) if efs_root_access_point else None,
         )
 
-        custom_efs.grant(create_user_directory_lambda.role, "elasticfilesystem:CreateAccessPoint")
         custom_efs.grant(create_user_directory_lambda.role, "elasticfilesystem:ClientWrite")
 
+        # Fargate task finishing re-ownership jobs the Lambda checkpointed before its timeout
+        if REPERMISSION_FARGATE_HANDOFF:
+            repermission_cluster = ecs.Cluster(self, f"{flag}RepermissionCluster", vpc=default_vpc)
+            repermission_task_definition = ecs.FargateTaskDefinition(
+                self,
+                f"{flag}RepermissionTaskDef",
+                cpu=1024,
+                memory_limit_mib=2048,
+            )
+            repermission_task_definition.add_volume(
+                name="custom_efs",
+                efs_volume_configuration={
+                    "file_system_id": custom_efs.file_system_id,
+                    "transit_encryption": "ENABLED",
+                    "authorization_config": {
+                        "access_point_id": efs_root_access_point.access_point_id,
+                        "iam": "ENABLED"
+                    }
+                }
+            )
+            custom_efs.grant(
+                repermission_task_definition.task_role,
+                "elasticfilesystem:ClientMount",
+                "elasticfilesystem:ClientRootAccess",
+                "elasticfilesystem:ClientWrite",
+            )
+            repermission_container = repermission_task_definition.add_container(
+                "RepermissionContainer",
+                image=ecs.ContainerImage.from_asset("lambda_layers/repermission"),
+                logging=ecs.LogDrivers.aws_logs(
+                    stream_prefix="repermission",
+                ),
+                environment={"REPERMISSION_WORKERS": str(REPERMISSION_WORKERS * 2)},
+            )
+            repermission_container.add_mount_points(ecs.MountPoint(
+                container_path="/mnt/efs",
+                read_only=False,
+                source_volume="custom_efs"
+            ))
+            repermission_task_sg = ec2.SecurityGroup(
+                self, f"{flag}RepermissionTaskSecurityGroup",
+                vpc=default_vpc,
+                description="Re-ownership task access to the custom EFS",
+                allow_all_outbound=True,
+            )
+            custom_efs.connections.allow_default_port_from(repermission_task_sg)
+            create_user_directory_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[repermission_task_definition.task_definition_arn],
+                    actions=["ecs:RunTask"]
+                )
+            )
+            create_user_directory_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[
+                        repermission_task_definition.task_role.role_arn,
+                        repermission_task_definition.obtain_execution_role().role_arn
+                    ],
+                    actions=["iam:PassRole"]
+                )
+            )
+            for name, value in {
+                "REPERMISSION_CLUSTER_ARN": repermission_cluster.cluster_arn,
+                "REPERMISSION_TASK_DEFINITION_ARN": repermission_task_definition.task_definition_arn,
+                "REPERMISSION_SUBNETS": ",".join(subnet.subnet_id for subnet in default_vpc.public_subnets),
+                "REPERMISSION_SECURITY_GROUP": repermission_task_sg.security_group_id,
+            }.items():
+                create_user_directory_lambda.add_environment(name, value)
+
+        # EFS Inventory Index
+        if INVENTORY_INDEX_SCHEDULE and replicate_custom_efs:
+            inventory_index_lambda = aws_lambda.Function(
+                self, f"{flag}InventoryIndexLambda",
+                code=aws_lambda.Code.from_asset(
+                    "sagemaker_domain_dr/inventory_index_lambda/",
+                ),
+                handler="inventory_index.lambda_handler",
+                layers=[instrumentation_layer],
+                runtime=aws_lambda.Runtime.PYTHON_3_12,
+                architecture=lambda_architecture,
+                description="Lambda that maintains the inventory index on SageMaker domain custom EFS",
+                function_name=f"{flag}-efs-inventory-index{DEPLOYMENT_NAME_SUFFIX}",
+                environment={"INVENTORY_PER_FILE": "true"},
+                timeout=Duration.seconds(900),
+                # runs never overlap, each one resumes with the stalest shards
+                reserved_concurrent_executions=1,
+                vpc=default_vpc,
+                allow_public_subnet=True,
+                filesystem=aws_lambda.FileSystem.from_efs_access_point(
+                    ap=efs_root_access_point, mount_path="/mnt/efs"
+                ),
+            )
+            custom_efs.grant(inventory_index_lambda.role, "elasticfilesystem:ClientWrite")
+            events.Rule(
+                self,
+                f"{flag}InventoryIndexScheduleRule",
+                description="InventoryIndexScheduleRule",
+                schedule=events.Schedule.expression(INVENTORY_INDEX_SCHEDULE),
+                targets=[targets.LambdaFunction(inventory_index_lambda)],
+            )
+
+        # EFS Replication Lag Monitor
+        if REPLICATION_MONITOR_SCHEDULE and replicate_custom_efs:
+            # one datapoint per monitor run, so the alarm period follows the schedule
+            alarm_period = Duration.seconds(alarm_period_seconds(REPLICATION_MONITOR_SCHEDULE, 2))
+            replication_monitor_lambda = aws_lambda.Function(
+                self, f"{flag}ReplicationMonitorLambda",
+                code=aws_lambda.Code.from_asset(
+                    "sagemaker_domain_dr/replication_monitor_lambda/",
+                ),
+                handler="replication_monitor.lambda_handler",
+                layers=[instrumentation_layer],
+                runtime=aws_lambda.Runtime.PYTHON_3_12,
+                architecture=lambda_architecture,
+                description="Lambda that publishes the replication lag of SageMaker domain custom EFS",
+                function_name=f"{flag}-efs-replication-monitor{DEPLOYMENT_NAME_SUFFIX}",
+                environment={
+                    "EFS_ID_PARAMETER": custom_efs_id_parameter.parameter_name,
+                    "METRIC_NAMESPACE": "SagemakerDomainDR",
+                },
+                timeout=Duration.seconds(60),
+            )
+            custom_efs_id_parameter.grant_read(replication_monitor_lambda)
+            replication_monitor_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=[custom_efs.file_system_arn],
+                    actions=["elasticfilesystem:DescribeReplicationConfigurations"]
+                )
+            )
+            replication_monitor_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    effect=iam.Effect.ALLOW,
+                    resources=["*"],
+                    actions=["cloudwatch:PutMetricData"],
+                    conditions={"StringEquals": {"cloudwatch:namespace": "SagemakerDomainDR"}}
+                )
+            )
+            events.Rule(
+                self,
+                f"{flag}ReplicationMonitorScheduleRule",
+                description="ReplicationMonitorScheduleRule",
+                schedule=events.Schedule.expression(REPLICATION_MONITOR_SCHEDULE),
+                targets=[targets.LambdaFunction(replication_monitor_lambda)],
+            )
+            replication_dimensions = {"FileSystemId": local_region_efs_id, "DestinationRegion": replica_region}
+            cloudwatch.Alarm(
+                self,
+                f"{flag}ReplicationRpoAlarm",
+                alarm_name=f"{flag}-custom-efs-replication-rpo{DEPLOYMENT_NAME_SUFFIX}",
+                alarm_description=f"{flag} custom EFS replica is older than {RPO_ALARM_THRESHOLD_SECONDS}s",
+                metric=cloudwatch.Metric(
+                    namespace="SagemakerDomainDR",
+                    metric_name="ReplicationLagSeconds",
+                    dimensions_map=replication_dimensions,
+                    statistic="Maximum",
+                    period=alarm_period,
+                ),
+                threshold=RPO_ALARM_THRESHOLD_SECONDS,
+                comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+                evaluation_periods=2,
+                datapoints_to_alarm=2,
+                # a stopped monitor or a replica without a completed copy is not a met RPO
+                treat_missing_data=cloudwatch.TreatMissingData.BREACHING,
+            )
+            cloudwatch.Alarm(
+                self,
+                f"{flag}ReplicationHealthAlarm",
+                alarm_name=f"{flag}-custom-efs-replication-health{DEPLOYMENT_NAME_SUFFIX}",
+                alarm_description=f"{flag} custom EFS replication is not enabled or has not completed a copy",
+                metric=cloudwatch.Metric(
+                    namespace="SagemakerDomainDR",
+                    metric_name="ReplicationHealthy",
+                    dimensions_map=replication_dimensions,
+                    statistic="Minimum",
+                    period=alarm_period,
+                ),
+                threshold=1,
+                comparison_operator=cloudwatch.ComparisonOperator.LESS_THAN_THRESHOLD,
+                evaluation_periods=2,
+                datapoints_to_alarm=2,
+                treat_missing_data=cloudwatch.TreatMissingData.BREACHING,
+            )
+
         # EFS SG
         modify_efs_sg_lambda = aws_lambda.Function(
             self, "ModifyEfsSgLambda",
             code=aws_lambda.Code.from_asset("sagemaker_domain_dr/modify_efs_security_group/"),
             handler="modify_efs_sg.lambda_handler",
+            layers=[instrumentation_layer],
             runtime=aws_lambda.Runtime.PYTHON_3_12,
+            architecture=lambda_architecture,
             timeout=Duration.minutes(10),
             description="Lambda that add Sagemaker Domain Security Group",
-            function_name=f"{flag}-modify-efs-sg",
+            function_name=f"{flag}-modify-efs-sg{DEPLOYMENT_NAME_SUFFIX}",
             environment={
                 "EFS_ID": local_region_efs_id,
                 "DOMAIN_ID": domain.attr_domain_id,
@@ -384,72 +655,42 @@ class SagemakerDomainDrStack(Stack):
                 detail_type=["AWS API Call via CloudTrail"],
                 detail={
                     "eventSource": ["sagemaker.amazonaws.com"],
-                    "eventName": ["CreateUserProfile", "DeleteUserProfile"]
+                    "eventName": ["CreateUserProfile", "DeleteUserProfile", "UpdateUserProfile"]
                 }
             ),
-            rule_name=f"{flag}UserProfileEventRule"
+            rule_name=f"{flag}UserProfileEventRule{DEPLOYMENT_NAME_SUFFIX}"
         )
         user_profile_creation_rule.add_target(
             targets.LambdaFunction(create_user_directory_lambda)
         )
 
         # SageMaker User Profiles & Spaces
-        with open("users.yaml", "r") as f:
-            users = yaml.safe_load(f)["Users"]
-        for user_name, user_config in users.items():
-            custom_posix = user_config.get("CustomPosix", None)
-            if custom_posix:
-                uid, gid = map(int, custom_posix.split(":"))
-                user_profile = sagemaker.CfnUserProfile(
+        users = list(users_config.users.values())
+        if USER_PROVISIONING_SHARDS:
+            # nested stacks deploy in parallel and each stays below the CloudFormation resource limit
+            for shard_index, shard in enumerate(shard_users(users, USER_PROVISIONING_SHARDS)):
+                if not shard:
+                    continue
+                user_provisioning_shard = UserProvisioningShardStack(
                     self,
-                    f"UserProfile{user_name}",
+                    f"UserProvisioningShard{shard_index}",
+                    users=shard,
                     domain_id=domain.attr_domain_id,
-                    user_profile_name=user_name,
-                    user_settings=sagemaker.CfnUserProfile.UserSettingsProperty(
-                        custom_file_system_configs=[sagemaker.CfnUserProfile.CustomFileSystemConfigProperty(
-                            efs_file_system_config=sagemaker.CfnUserProfile.EFSFileSystemConfigProperty(
-                                file_system_id=local_region_efs_id,
-                                file_system_path="/"
-                            )
-                        )],
-                        custom_posix_user_config=sagemaker.CfnUserProfile.CustomPosixUserConfigProperty(
-                            uid=uid,
-                            gid=gid
-                        ),
-                        jupyter_lab_app_settings=sagemaker.CfnUserProfile.JupyterLabAppSettingsProperty(
-                            lifecycle_config_arns=[jupyterlab_lifecycle_config_arn]
-                        ),
-                        code_editor_app_settings=sagemaker.CfnUserProfile.CodeEditorAppSettingsProperty(
-                            lifecycle_config_arns=[codeeditor_lifecycle_config_arn]
-                        ),
-                    ),
+                    efs_id=local_region_efs_id,
+                    jupyterlab_lifecycle_config_arn=jupyterlab_lifecycle_config_arn,
+                    codeeditor_lifecycle_config_arn=codeeditor_lifecycle_config_arn,
                 )
-                space_config = user_config.get("Spaces", None)
-                if space_config:
-                    for space_name, space_type_dict in space_config.items():
-                        space_type = space_type_dict["type"]
-                        user_space = sagemaker.CfnSpace(
-                            self,
-                            space_name,
-                            domain_id=domain.attr_domain_id,
-                            space_name=space_name,
-                            ownership_settings=sagemaker.CfnSpace.OwnershipSettingsProperty(
-                                owner_user_profile_name=user_profile.user_profile_name
-                            ),
-                            space_settings=sagemaker.CfnSpace.SpaceSettingsProperty(
-                                app_type=space_type,
-                                custom_file_systems=[sagemaker.CfnSpace.CustomFileSystemProperty(
-                                    efs_file_system=sagemaker.CfnSpace.EFSFileSystemProperty(
-                                        file_system_id=local_region_efs_id
-                                    )
-                                )],
-                            ),
-                            space_sharing_settings=sagemaker.CfnSpace.SpaceSharingSettingsProperty(
-                                sharing_type="Private"
-                            ),
-                        )
-                        user_space.node.add_dependency(user_profile)
-            else:
-                raise ValueError("This solution requires POSIX configuration for Sagemaker UserProfile.")
-            user_profile.node.add_dependency(user_profile_creation_rule)
-            user_profile.node.add_dependency(create_user_directory_lambda)
+                user_provisioning_shard.node.add_dependency(user_profile_creation_rule)
+                user_provisioning_shard.node.add_dependency(create_user_directory_lambda)
+        else:
+            user_profiles = provision_users(
+                self,
+                users,
+                domain.attr_domain_id,
+                local_region_efs_id,
+                jupyterlab_lifecycle_config_arn,
+                codeeditor_lifecycle_config_arn,
+            )
+            for user_profile in user_profiles:
+                user_profile.node.add_dependency(user_profile_creation_rule)
+                user_profile.node.add_dependency(create_user_directory_lambda)
@@ -0,0 +1,130 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import zlib
+from typing import List
+
+from constructs import Construct
+from aws_cdk import (
+    aws_sagemaker as sagemaker,
+    NestedStack,
+)
+
+from users_config import UserConfig
+
+# CloudFormation allows 500 resources per stack, keep headroom for the nested stack's own parameters
+MAX_RESOURCES_PER_SHARD = 450
+
+
+def provision_users(
+    scope: Construct,
+    users: List[UserConfig],
+    domain_id: str,
+    efs_id: str,
+    jupyterlab_lifecycle_config_arn: str,
+    codeeditor_lifecycle_config_arn: str,
+) -> list:
+    user_profiles = []
+    for user in users:
+        user_profile = sagemaker.CfnUserProfile(
+            scope,
+            f"UserProfile{user.name}",
+            domain_id=domain_id,
+            user_profile_name=user.name,
+            user_settings=sagemaker.CfnUserProfile.UserSettingsProperty(
+                custom_file_system_configs=[sagemaker.CfnUserProfile.CustomFileSystemConfigProperty(
+                    efs_file_system_config=sagemaker.CfnUserProfile.EFSFileSystemConfigProperty(
+                        file_system_id=efs_id,
+                        file_system_path="/"
+                    )
+                )],
+                custom_posix_user_config=sagemaker.CfnUserProfile.CustomPosixUserConfigProperty(
+                    uid=user.uid,
+                    gid=user.gid
+                ),
+                jupyter_lab_app_settings=sagemaker.CfnUserProfile.JupyterLabAppSettingsProperty(
+                    lifecycle_config_arns=[jupyterlab_lifecycle_config_arn]
+                ),
+                code_editor_app_settings=sagemaker.CfnUserProfile.CodeEditorAppSettingsProperty(
+                    lifecycle_config_arns=[codeeditor_lifecycle_config_arn]
+                ),
+            ),
+        )
+        for space in user.spaces:
+            user_space = sagemaker.CfnSpace(
+                scope,
+                space.name,
+                domain_id=domain_id,
+                space_name=space.name,
+                ownership_settings=sagemaker.CfnSpace.OwnershipSettingsProperty(
+                    owner_user_profile_name=user_profile.user_profile_name
+                ),
+                space_settings=sagemaker.CfnSpace.SpaceSettingsProperty(
+                    app_type=space.app_type,
+                    custom_file_systems=[sagemaker.CfnSpace.CustomFileSystemProperty(
+                        efs_file_system=sagemaker.CfnSpace.EFSFileSystemProperty(
+                            file_system_id=efs_id
+                        )
+                    )],
+                ),
+                space_sharing_settings=sagemaker.CfnSpace.SpaceSharingSettingsProperty(
+                    sharing_type="Private"
+                ),
+            )
+            user_space.node.add_dependency(user_profile)
+        user_profiles.append(user_profile)
+    return user_profiles
+
+
+def shard_users(users: List[UserConfig], shard_count: int) -> List[List[UserConfig]]:
+    # hash the user name so adding or removing users never moves anyone else to another shard,
+    # which would replace their user profile
+    shards = [[] for _ in range(shard_count)]
+    for user in users:
+        shards[zlib.crc32(user.name.encode("utf-8")) % shard_count].append(user)
+    for shard_index, shard in enumerate(shards):
+        resource_count = sum(1 + len(user.spaces) for user in shard)
+        if resource_count > MAX_RESOURCES_PER_SHARD:
+            raise ValueError(
+                f"User provisioning shard {shard_index} has {resource_count} resources, "
+                f"increase USER_PROVISIONING_SHARDS."
+            )
+    return shards
+
+
+class UserProvisioningShardStack(NestedStack):
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        users: List[UserConfig],
+        domain_id: str,
+        efs_id: str,
+        jupyterlab_lifecycle_config_arn: str,
+        codeeditor_lifecycle_config_arn: str,
+        **kwargs
+    ) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+        provision_users(
+            self,
+            users,
+            domain_id,
+            efs_id,
+            jupyterlab_lifecycle_config_arn,
+            codeeditor_lifecycle_config_arn,
+        )
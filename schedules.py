@@ -0,0 +1,47 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import re
+
+RATE_PATTERN = re.compile(r"^rate\((\d+) (minute|minutes|hour|hours|day|days)\)$")
+UNIT_SECONDS = {"minute": 60, "hour": 60 * 60, "day": 24 * 60 * 60}
+# CloudWatch evaluates an alarm over at most one day of periods
+MAX_ALARM_WINDOW_SECONDS = 24 * 60 * 60
+
+
+def rate_interval_seconds(expression: str) -> int:
+    """
+    Interval of an EventBridge rate() expression in seconds. cron() expressions have no fixed interval,
+    so a metric published on one cannot be matched to an alarm period and is rejected.
+    """
+    match = RATE_PATTERN.match(expression.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"{expression!r} is not a rate() schedule, e.g. \"rate(5 minutes)\"")
+    return int(match.group(1)) * UNIT_SECONDS[match.group(2).rstrip("s")]
+
+
+def alarm_period_seconds(expression: str, evaluation_periods: int) -> int:
+    """
+    Alarm period for a metric published once per rate() interval. Alarms should require evaluation_periods
+    datapoints, so an invocation landing just past a period boundary does not leave a breaching gap.
+    """
+    period = rate_interval_seconds(expression)
+    if period * evaluation_periods > MAX_ALARM_WINDOW_SECONDS:
+        raise ValueError(f"{expression!r} runs less than every "
+                         f"{MAX_ALARM_WINDOW_SECONDS // evaluation_periods // 3600} hours, too slow to alarm on")
+    return period
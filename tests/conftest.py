@@ -0,0 +1,48 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+# the recovery container imports its modules from the image root, the tests import them the same way
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "ecs_image"))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "lambda_layers", "instrumentation", "python"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "lambda_layers", "repermission", "python"))
+
+
+def load_lambda(relative_path):
+    # Lambda asset directories are not packages, each handler is loaded from its file
+    spec = importlib.util.spec_from_file_location(os.path.basename(relative_path)[:-3],
+                                                  os.path.join(ROOT_DIR, relative_path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def inventory_index_lambda(tmp_path, monkeypatch):
+    module = load_lambda("sagemaker_domain_dr/inventory_index_lambda/inventory_index.py")
+    monkeypatch.setattr(module, "MOUNT_POINT", str(tmp_path))
+    monkeypatch.setattr(module, "INVENTORY_DIRECTORY", os.path.join(str(tmp_path), ".sagemaker-dr", "inventory"))
+    os.makedirs(module.INVENTORY_DIRECTORY)
+    return module
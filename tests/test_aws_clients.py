@@ -0,0 +1,56 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import boto3
+import pytest
+
+import aws_clients
+import instrumentation
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(aws_clients, "_clients", {})
+    instrumentation._counters.clear()
+    yield
+    instrumentation._counters.clear()
+
+
+def test_client_is_created_once_with_adaptive_retries():
+    efs = aws_clients.client("efs")
+    assert aws_clients.client("efs") is efs
+    assert aws_clients.client("ec2") is not efs
+    # botocore counts max_attempts as retries after the first call
+    assert efs.meta.config.retries == {"mode": "adaptive", "total_max_attempts": 9}
+    assert efs.meta.config.max_pool_connections == 10
+
+
+@pytest.mark.parametrize("code, throttles", [("ThrottlingException", 1), ("TooManyRequestsException", 1),
+                                             ("FileSystemNotFound", 0)])
+def test_count_throttle_counts_only_throttling_errors(code, throttles):
+    operation = boto3.client("efs").meta.service_model.operation_model("DescribeFileSystems")
+    response = (None, {"Error": {"Code": code}})
+    assert aws_clients.count_throttle(response, operation) is None
+    assert instrumentation._counters.get("efs.DescribeFileSystems.Throttles", 0) == throttles
+
+
+def test_count_throttle_ignores_connection_failures():
+    operation = boto3.client("efs").meta.service_model.operation_model("DescribeFileSystems")
+    assert aws_clients.count_throttle(None, operation) is None
+    assert not instrumentation._counters
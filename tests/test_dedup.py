@@ -0,0 +1,168 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import shutil
+
+import pytest
+
+import dedup
+from dedup import finish_dedup, plan_dedup
+from journal import list_stale_files
+
+
+def write(root, relative_path, content):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def copy(source_dir, target_dir, copy_paths):
+    # what rsync --files-from does with the planned paths
+    for relative_path in copy_paths:
+        source_path = os.path.join(source_dir, relative_path)
+        target_path = os.path.join(target_dir, relative_path)
+        if os.path.isdir(source_path):
+            os.makedirs(target_path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            # rsync writes a temp file and renames it, never through an existing hardlink
+            shutil.copy2(source_path, f"{target_path}.tmp")
+            os.replace(f"{target_path}.tmp", target_path)
+
+
+def sync(source_dir, target_dir, index, relative_paths):
+    copy_paths, first_copies, pending_links, bytes_saved = plan_dedup(relative_paths, source_dir, target_dir, index, 8)
+    copy(source_dir, target_dir, copy_paths)
+    return copy_paths, bytes_saved + finish_dedup(target_dir, index, first_copies, pending_links)
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    source_dir = str(tmp_path / "source")
+    target_dir = str(tmp_path / "target")
+    os.makedirs(target_dir)
+    return source_dir, target_dir
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    paths = []
+    content_key = dedup.content_key
+
+    def counting_content_key(path, stat_info):
+        paths.append(path)
+        return content_key(path, stat_info)
+
+    monkeypatch.setattr(dedup, "content_key", counting_content_key)
+    return paths
+
+
+def same_file(target_dir, *relative_paths):
+    return len({os.stat(os.path.join(target_dir, path)).st_ino for path in relative_paths}) == 1
+
+
+def test_duplicates_in_one_run_share_a_copy(dirs, hashed):
+    source_dir, target_dir = dirs
+    write(source_dir, "alice/env1/lib.so", b"x" * 64)
+    write(source_dir, "alice/env2/lib.so", b"x" * 64)
+    write(source_dir, "alice/small", b"tiny")
+
+    _, bytes_saved = sync(source_dir, target_dir, {}, ["alice/env1/lib.so", "alice/env2/lib.so", "alice/small"])
+
+    assert bytes_saved == 64
+    assert same_file(target_dir, "alice/env1/lib.so", "alice/env2/lib.so")
+    assert len(hashed) == 2
+
+
+def test_unique_sizes_are_not_hashed(dirs, hashed):
+    source_dir, target_dir = dirs
+    write(source_dir, "alice/a.bin", b"a" * 64)
+    write(source_dir, "alice/b.bin", b"b" * 65)
+
+    copy_paths, bytes_saved = sync(source_dir, target_dir, {}, ["alice/a.bin", "alice/b.bin"])
+
+    assert sorted(copy_paths) == ["alice/a.bin", "alice/b.bin"]
+    assert bytes_saved == 0
+    assert hashed == []
+
+
+def test_later_duplicate_of_an_unhashed_copy_is_linked(dirs, hashed):
+    source_dir, target_dir = dirs
+    index = {}
+    write(source_dir, "alice/env1/lib.so", b"x" * 64)
+    sync(source_dir, target_dir, index, ["alice/env1/lib.so"])
+    assert hashed == []
+    write(source_dir, "alice/env2/lib.so", b"x" * 64)
+
+    copy_paths, bytes_saved = sync(source_dir, target_dir, index, ["alice/env2/lib.so"])
+
+    assert bytes_saved == 64
+    assert "alice/env2/lib.so" not in copy_paths
+    assert same_file(target_dir, "alice/env1/lib.so", "alice/env2/lib.so")
+
+
+def test_files_of_different_owners_are_never_linked(dirs):
+    if os.geteuid() != 0:
+        pytest.skip("changing owners needs root")
+    source_dir, target_dir = dirs
+    write(source_dir, "alice/lib.so", b"x" * 64)
+    write(source_dir, "bob/lib.so", b"x" * 64)
+    os.chown(os.path.join(source_dir, "bob/lib.so"), 20002, 20002)
+
+    _, bytes_saved = sync(source_dir, target_dir, {}, ["alice/lib.so", "bob/lib.so"])
+
+    assert bytes_saved == 0
+    assert not same_file(target_dir, "alice/lib.so", "bob/lib.so")
+
+
+def test_linked_duplicates_are_not_relinked(dirs, hashed):
+    source_dir, target_dir = dirs
+    index = {}
+    write(source_dir, "alice/a.bin", b"x" * 64)
+    write(source_dir, "alice/b.bin", b"x" * 64)
+    os.utime(os.path.join(source_dir, "alice/b.bin"), (1000, 1000))
+    sync(source_dir, target_dir, index, ["alice/a.bin", "alice/b.bin"])
+    # the link carries a.bin's mtime, so the mirror sync's quick check lists b.bin as stale on every run
+    stale_paths = list(list_stale_files(source_dir, target_dir, ["alice/a.bin", "alice/b.bin"]))
+    assert stale_paths == ["alice/b.bin"]
+    hashed.clear()
+
+    copy_paths, bytes_saved = sync(source_dir, target_dir, index, stale_paths)
+
+    assert copy_paths == []
+    assert bytes_saved == 0
+    assert hashed == []
+    assert same_file(target_dir, "alice/a.bin", "alice/b.bin")
+
+
+def test_changed_linked_duplicate_is_synced_again(dirs):
+    source_dir, target_dir = dirs
+    index = {}
+    write(source_dir, "alice/a.bin", b"x" * 64)
+    write(source_dir, "alice/b.bin", b"x" * 64)
+    sync(source_dir, target_dir, index, ["alice/a.bin", "alice/b.bin"])
+    write(source_dir, "alice/b.bin", b"y" * 64)
+    os.utime(os.path.join(source_dir, "alice/b.bin"), (5000, 5000))
+
+    copy_paths, bytes_saved = sync(source_dir, target_dir, index, ["alice/b.bin"])
+
+    assert copy_paths == ["alice/b.bin"]
+    assert bytes_saved == 0
+    assert not same_file(target_dir, "alice/a.bin", "alice/b.bin")
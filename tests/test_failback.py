@@ -0,0 +1,96 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+import pytest
+
+from failback import failback_baseline, plan_failback
+from journal import save_journal
+from sync_rules import SyncRules
+
+
+def test_baseline_is_the_failover_not_the_last_incremental_sync(tmp_path):
+    save_journal(str(tmp_path), {"failover_at": 1000.0, "watermark": 5000.0, "last_sync_at": 5000.0})
+
+    assert failback_baseline(str(tmp_path), "") == 1000.0
+
+
+def test_execution_input_overrides_the_journal(tmp_path):
+    save_journal(str(tmp_path), {"failover_at": 1000.0})
+
+    assert failback_baseline(str(tmp_path), "2000") == 2000.0
+
+
+def test_journal_from_a_full_sync_without_failover_at(tmp_path):
+    save_journal(str(tmp_path), {"last_sync_at": 1000.0})
+
+    assert failback_baseline(str(tmp_path), "") == 1000.0
+
+
+@pytest.mark.parametrize("journal", [{}, {"watermark": 5000.0, "last_sync_at": 5000.0}])
+def test_no_failover_time(tmp_path, journal):
+    if journal:
+        save_journal(str(tmp_path), journal)
+
+    with pytest.raises(ValueError):
+        failback_baseline(str(tmp_path), "")
+
+
+def write(root, relative_path, content, mtime):
+    path = root / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_plan_failback_splits_copies_and_conflicts(tmp_path):
+    source_dir = tmp_path / "secondary"
+    target_dir = tmp_path / "primary"
+    # written in the secondary region only
+    write(source_dir, "alice/new.txt", b"new", 2000)
+    # changed in the secondary region, untouched in the primary since the failover
+    write(source_dir, "alice/notes.txt", b"secondary", 2000)
+    write(target_dir, "alice/notes.txt", b"primary", 500)
+    # changed in both regions after the failover
+    write(source_dir, "alice/model.py", b"secondary edit", 2000)
+    write(target_dir, "alice/model.py", b"primary edit", 1500)
+    # already identical in both regions
+    write(source_dir, "alice/same.txt", b"same", 2000)
+    write(target_dir, "alice/same.txt", b"same", 2000)
+    # older than the failover, left alone
+    write(source_dir, "alice/old.txt", b"old", 500)
+
+    copy_paths, conflicts = plan_failback(str(source_dir), str(target_dir), 1000)
+
+    assert sorted(copy_paths) == ["alice/new.txt", "alice/notes.txt"]
+    assert [conflict["path"] for conflict in conflicts] == ["alice/model.py"]
+    assert conflicts[0]["source_mtime"] == 2000
+    assert conflicts[0]["target_mtime"] == 1500
+
+
+def test_plan_failback_skips_excluded_paths(tmp_path):
+    source_dir = tmp_path / "secondary"
+    write(source_dir, "alice/__pycache__/mod.pyc", b"cache", 2000)
+    write(source_dir, "alice/mod.py", b"code", 2000)
+
+    rules = SyncRules({"default": ["__pycache__/"]})
+
+    copy_paths, _ = plan_failback(str(source_dir), str(tmp_path / "primary"), 1000, rules)
+
+    assert copy_paths == ["alice/mod.py"]
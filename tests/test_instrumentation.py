@@ -0,0 +1,104 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import instrumentation
+
+
+@pytest.fixture(autouse=True)
+def clean_invocation():
+    instrumentation._spans.clear()
+    instrumentation._counters.clear()
+    yield
+    instrumentation._spans.clear()
+    instrumentation._counters.clear()
+
+
+def emitted_metrics(capsys):
+    instrumentation.emit_metrics()
+    return json.loads(capsys.readouterr().out)
+
+
+def test_span_counts_calls_and_errors_and_reraises():
+    with instrumentation.span("step") as fields:
+        fields["files"] = 3
+    with pytest.raises(KeyError):
+        with instrumentation.span("step"):
+            raise KeyError("missing")
+    calls, total_ms, errors = instrumentation._spans["step"]
+    assert (calls, errors) == (2, 1)
+    assert total_ms >= 0
+
+
+def test_emit_metrics_writes_embedded_metric_format_and_resets(capsys):
+    instrumentation.record_span("efs.DescribeFileSystems", 12.34)
+    instrumentation.record_span("efs.DescribeFileSystems", 10.0, error="ClientError")
+    instrumentation.increment("efs.DescribeFileSystems.Throttles", 2)
+    document = emitted_metrics(capsys)
+
+    directive, = document["_aws"]["CloudWatchMetrics"]
+    assert directive["Namespace"] == instrumentation.METRIC_NAMESPACE
+    assert directive["Dimensions"] == [["FunctionName"]]
+    assert {m["Name"] for m in directive["Metrics"]} == {
+        "efs.DescribeFileSystems.Duration", "efs.DescribeFileSystems.Calls", "efs.DescribeFileSystems.Errors",
+        "efs.DescribeFileSystems.Throttles"}
+    assert document["efs.DescribeFileSystems.Duration"] == 22.3
+    assert document["efs.DescribeFileSystems.Calls"] == 2
+    assert document["efs.DescribeFileSystems.Errors"] == 1
+    assert document["efs.DescribeFileSystems.Throttles"] == 2
+    assert not instrumentation._spans and not instrumentation._counters
+
+
+def test_emit_metrics_splits_directives_and_skips_empty_invocations(capsys):
+    instrumentation.emit_metrics()
+    assert capsys.readouterr().out == ""
+    for i in range(40):
+        instrumentation.record_span(f"span{i}", 1.0)
+    document = emitted_metrics(capsys)
+    directives = document["_aws"]["CloudWatchMetrics"]
+    assert [len(d["Metrics"]) for d in directives] == [99, 21]
+
+
+def test_instrument_handler_emits_metrics_when_the_handler_fails(capsys):
+    @instrumentation.instrument_handler
+    def handler(event, context):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        handler({}, None)
+    document = json.loads(capsys.readouterr().out)
+    assert document["handler.Calls"] == 1
+    assert document["handler.Errors"] == 1
+
+
+def test_instrument_client_times_each_api_call():
+    efs = instrumentation.instrument_client(boto3.client("efs", region_name="us-east-1"))
+    stubber = Stubber(efs)
+    stubber.add_response("describe_file_systems", {"FileSystems": []})
+    stubber.add_client_error("describe_file_systems", service_error_code="FileSystemNotFound")
+    with stubber:
+        efs.describe_file_systems()
+        with pytest.raises(efs.exceptions.ClientError):
+            efs.describe_file_systems()
+    calls, _, errors = instrumentation._spans["efs.DescribeFileSystems"]
+    assert (calls, errors) == (2, 1)
@@ -0,0 +1,130 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gzip
+import os
+import time
+
+from inventory import list_inventory_files, shard_path
+
+
+def write_tree(root, paths):
+    for relative_path in paths:
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(relative_path)
+
+
+def write_index(source_dir, shard_name):
+    # the rows the inventory index Lambda writes, directories ahead of their children
+    rows = []
+    for dir_path, dir_names, file_names in os.walk(os.path.join(source_dir, shard_name)):
+        relative_dir = os.path.relpath(dir_path, source_dir)
+        rows.append(("d", os.stat(dir_path).st_mtime_ns, 0, relative_dir))
+        for file_name in file_names:
+            stat_info = os.stat(os.path.join(dir_path, file_name))
+            rows.append(("f", stat_info.st_mtime_ns, stat_info.st_size, os.path.join(relative_dir, file_name)))
+    path = shard_path(source_dir, shard_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with gzip.open(path, "wb") as f:
+        for kind, mtime_ns, size, relative_path in rows:
+            f.write(f"{kind}\t{mtime_ns}\t{size}\t".encode() + os.fsencode(relative_path) + b"\0")
+    return {"shards": {shard_name: {"per_file": True}}}
+
+
+def bump_mtime(path):
+    stat_info = os.stat(path)
+    os.utime(path, ns=(stat_info.st_atime_ns, stat_info.st_mtime_ns + 10 ** 9))
+
+
+def test_unchanged_shard_is_listed_from_the_index(tmp_path):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/b/f", "other"])
+    inventory = write_index(source_dir, "u")
+
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["other", "u/a/b/f", "u/top"]
+
+
+def test_deleted_directory_lists_none_of_its_files(tmp_path):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/b/f", "u/a/b/c/g"])
+    inventory = write_index(source_dir, "u")
+    for relative_path in ("u/a/b/c/g", "u/a/b/f"):
+        os.remove(os.path.join(source_dir, relative_path))
+    os.rmdir(os.path.join(source_dir, "u/a/b/c"))
+    os.rmdir(os.path.join(source_dir, "u/a/b"))
+    bump_mtime(os.path.join(source_dir, "u/a"))
+
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["u/top"]
+
+
+def test_renamed_directory_is_listed_under_its_new_name(tmp_path):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/b/f", "u/a/b/c/g"])
+    inventory = write_index(source_dir, "u")
+    os.rename(os.path.join(source_dir, "u/a/b"), os.path.join(source_dir, "u/a/renamed"))
+    bump_mtime(os.path.join(source_dir, "u/a"))
+
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["u/a/renamed/c/g", "u/a/renamed/f", "u/top"]
+
+
+def test_directory_replaced_by_a_file(tmp_path):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/b/f"])
+    inventory = write_index(source_dir, "u")
+    os.remove(os.path.join(source_dir, "u/a/b/f"))
+    os.rmdir(os.path.join(source_dir, "u/a/b"))
+    write_tree(source_dir, ["u/a/b"])
+    bump_mtime(os.path.join(source_dir, "u/a"))
+
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["u/a/b", "u/top"]
+
+
+def test_new_files_in_a_changed_directory(tmp_path):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/f"])
+    inventory = write_index(source_dir, "u")
+    write_tree(source_dir, ["u/a/new", "u/a/sub/deep"])
+    bump_mtime(os.path.join(source_dir, "u/a"))
+
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["u/a/f", "u/a/new", "u/a/sub/deep", "u/top"]
+
+
+def test_index_refresh_only_relists_changed_directories(tmp_path, inventory_index_lambda, monkeypatch):
+    source_dir = str(tmp_path)
+    write_tree(source_dir, ["u/top", "u/a/f", "u/b/g"])
+    deadline = time.time() + 60
+    inventory_index_lambda.scan_shard("u", deadline)
+    write_tree(source_dir, ["u/b/new"])
+    bump_mtime(os.path.join(source_dir, "u/b"))
+    listed_dirs = []
+    scandir = os.scandir
+
+    def tracking_scandir(path):
+        listed_dirs.append(os.path.relpath(path, source_dir))
+        return scandir(path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(os, "scandir", tracking_scandir)
+        summary = inventory_index_lambda.scan_shard("u", deadline)
+
+    assert listed_dirs == ["u/b"]
+    assert summary["files"] == 4
+    inventory = {"shards": {"u": {"per_file": True}}}
+    assert sorted(list_inventory_files(source_dir, inventory)) == ["u/a/f", "u/b/g", "u/b/new", "u/top"]
@@ -0,0 +1,102 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+from journal import (
+    list_changed_files,
+    list_missing_files,
+    list_stale_files,
+    load_journal,
+    save_journal,
+    walk_files,
+)
+from sync_rules import SyncRules
+
+
+def write(root, relative_path, content=b"x", mtime=None):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def test_journal_round_trip(tmp_path):
+    assert load_journal(str(tmp_path)) == {}
+
+    save_journal(str(tmp_path), {"watermark": 1000.0})
+
+    assert load_journal(str(tmp_path)) == {"watermark": 1000.0}
+    assert os.listdir(tmp_path / ".sagemaker-dr") == ["journal.json"]
+
+
+def test_walk_files_skips_dot_entries(tmp_path):
+    write(str(tmp_path), "alice/a.txt")
+    write(str(tmp_path), "alice/.cache/pip/wheel")
+    write(str(tmp_path), ".sagemaker-dr/journal.json")
+
+    assert [path for path, _ in walk_files(str(tmp_path))] == ["alice/a.txt"]
+
+
+def test_list_changed_files(tmp_path):
+    write(str(tmp_path), "alice/old.txt", mtime=500)
+    write(str(tmp_path), "alice/new.txt", mtime=2000)
+    seen = set()
+
+    changed = list(list_changed_files(str(tmp_path), 1000, use_ctime=False, seen=seen))
+
+    assert changed == ["alice/new.txt"]
+    assert seen == {"alice/old.txt", "alice/new.txt"}
+    # a file replicated after the watermark has a fresh ctime whatever its mtime
+    assert sorted(list_changed_files(str(tmp_path), 1000)) == ["alice/new.txt", "alice/old.txt"]
+
+
+def test_walk_files_skips_excluded_directories(tmp_path):
+    write(str(tmp_path), "alice/a.txt")
+    write(str(tmp_path), "alice/web/node_modules/pkg/index.js")
+
+    assert [path for path, _ in walk_files(str(tmp_path), SyncRules({"default": ["node_modules/"]}))] == ["alice/a.txt"]
+
+
+def test_list_missing_files(tmp_path):
+    source_dir = str(tmp_path / "source")
+    target_dir = str(tmp_path / "target")
+    write(source_dir, "alice/copied.txt")
+    write(target_dir, "alice/copied.txt")
+    write(source_dir, "alice/missing.txt")
+
+    assert list(list_missing_files(source_dir, target_dir)) == ["alice/missing.txt"]
+
+
+def test_list_stale_files(tmp_path):
+    source_dir = str(tmp_path / "source")
+    target_dir = str(tmp_path / "target")
+    write(source_dir, "alice/same.txt", b"same", mtime=1000)
+    write(target_dir, "alice/same.txt", b"same", mtime=1000)
+    write(source_dir, "alice/resized.txt", b"longer", mtime=1000)
+    write(target_dir, "alice/resized.txt", b"short", mtime=1000)
+    write(source_dir, "alice/touched.txt", b"same", mtime=2000)
+    write(target_dir, "alice/touched.txt", b"same", mtime=1000)
+    write(source_dir, "alice/missing.txt")
+    source_files = sorted(path for path, _ in walk_files(source_dir))
+
+    assert list(list_stale_files(source_dir, target_dir, source_files)) == [
+        "alice/missing.txt", "alice/resized.txt", "alice/touched.txt"
+    ]
@@ -0,0 +1,126 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import time
+
+import pytest
+
+import main
+from journal import acquire_lock, lock_heartbeat, refresh_lock, release_lock, wait_for_lock
+
+
+@pytest.fixture
+def locked_target(tmp_path, monkeypatch):
+    target_dir = str(tmp_path)
+    monkeypatch.setattr(main, "TARGET_DIR", target_dir)
+    monkeypatch.setattr(main, "RESTORE_SCOPE", None)
+    monkeypatch.setattr(main, "LOCK_WAIT_SECONDS", 0)
+    calls = []
+    for name in ("sync_efs", "sync_efs_incremental", "sync_efs_failback"):
+        monkeypatch.setattr(main, name, lambda *args, name=name: calls.append(name))
+    assert acquire_lock(target_dir, 3600)
+    return target_dir, calls
+
+
+def test_lock_is_exclusive_until_released(tmp_path):
+    target_dir = str(tmp_path)
+    assert acquire_lock(target_dir, 3600)
+    assert not acquire_lock(target_dir, 3600)
+    release_lock(target_dir)
+    assert acquire_lock(target_dir, 3600)
+
+
+def test_stale_lock_is_taken_over(tmp_path):
+    target_dir = str(tmp_path)
+    assert acquire_lock(target_dir, 3600)
+    assert acquire_lock(target_dir, 0)
+
+
+def test_wait_for_lock_gets_a_released_lock(tmp_path, monkeypatch):
+    target_dir = str(tmp_path)
+    assert acquire_lock(target_dir, 3600)
+    monkeypatch.setattr("journal.time.sleep", lambda seconds: release_lock(target_dir))
+    assert wait_for_lock(target_dir, 3600, 60, poll_seconds=1)
+
+
+def age_lock(target_dir, seconds):
+    lock_path = os.path.join(target_dir, ".sagemaker-dr", "sync.lock")
+    mtime = os.stat(lock_path).st_mtime - seconds
+    os.utime(lock_path, (mtime, mtime))
+
+
+def test_refreshed_lock_is_not_taken_over(tmp_path):
+    target_dir = str(tmp_path)
+    assert acquire_lock(target_dir, 3600)
+    age_lock(target_dir, 7200)
+    assert refresh_lock(target_dir)
+    assert not acquire_lock(target_dir, 3600)
+
+
+def test_lock_of_another_owner_is_not_refreshed(tmp_path):
+    target_dir = str(tmp_path)
+    assert not refresh_lock(target_dir)
+    assert acquire_lock(target_dir, 3600)
+    with open(os.path.join(target_dir, ".sagemaker-dr", "sync.lock"), "w") as f:
+        json.dump({"owner": "other-task:1"}, f)
+    age_lock(target_dir, 7200)
+    assert not refresh_lock(target_dir)
+    assert acquire_lock(target_dir, 3600)
+
+
+def test_heartbeat_keeps_a_long_sync_locked(tmp_path):
+    target_dir = str(tmp_path)
+    lock_path = os.path.join(target_dir, ".sagemaker-dr", "sync.lock")
+    assert acquire_lock(target_dir, 3600)
+    with lock_heartbeat(target_dir, 0.01):
+        # the sync outlives the TTL while the heartbeat runs
+        age_lock(target_dir, 7200)
+        time.sleep(0.2)
+        lock_age = time.time() - os.stat(lock_path).st_mtime
+    assert lock_age < 60
+    assert not acquire_lock(target_dir, 3600)
+
+
+def test_incremental_cycle_skips_a_busy_lock(locked_target, monkeypatch):
+    _, calls = locked_target
+    monkeypatch.setattr(main, "SYNC_MODE", "incremental")
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 0
+    assert calls == []
+
+
+@pytest.mark.parametrize("sync_mode", ["full", "failback"])
+def test_recovery_fails_on_a_busy_lock(locked_target, monkeypatch, sync_mode):
+    _, calls = locked_target
+    monkeypatch.setattr(main, "SYNC_MODE", sync_mode)
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 1
+    assert calls == []
+
+
+def test_full_sync_runs_and_releases_the_lock(locked_target, monkeypatch):
+    target_dir, calls = locked_target
+    release_lock(target_dir)
+    monkeypatch.setattr(main, "SYNC_MODE", "full")
+    main.main()
+    assert calls == ["sync_efs"]
+    assert acquire_lock(target_dir, 3600)
@@ -0,0 +1,111 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+import pytest
+
+import main
+from mirror import check_delete_cap, delete_paths, load_manifest, plan_deletions, save_manifest
+from sync_rules import SyncRules
+
+
+def write(root, relative_path, content=b"x"):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+def test_manifest_round_trip(tmp_path):
+    assert load_manifest(str(tmp_path)) is None
+
+    save_manifest(str(tmp_path), {"alice/a.txt", "bob/b c.txt"})
+
+    assert load_manifest(str(tmp_path)) == {"alice/a.txt", "bob/b c.txt"}
+
+
+def test_first_mirror_sync_keeps_files_written_in_the_secondary(tmp_path, monkeypatch):
+    source_dir = str(tmp_path / "source")
+    target_dir = str(tmp_path / "target")
+    write(source_dir, "alice/a.txt")
+    write(target_dir, "alice/a.txt")
+    write(target_dir, "alice/secondary-only.ipynb")
+    monkeypatch.setattr(main, "SOURCE_DIR", source_dir)
+    monkeypatch.setattr(main, "TARGET_DIR", target_dir)
+    monkeypatch.setattr(main, "MIRROR_MAX_DELETE_PERCENT", 100)
+    journal = {}
+
+    main.propagate_deletions({"alice/a.txt"}, journal)
+
+    assert os.path.exists(os.path.join(target_dir, "alice", "secondary-only.ipynb"))
+    assert load_manifest(target_dir) == {"alice/a.txt"}
+    assert journal["mirror_deleted_files"] == 0
+
+    # once listed by a sync, a path gone from the source is deleted
+    os.remove(os.path.join(source_dir, "alice", "a.txt"))
+    main.propagate_deletions(set(), journal)
+
+    assert os.listdir(os.path.join(target_dir, "alice")) == ["secondary-only.ipynb"]
+    assert journal["mirror_deleted_files"] == 1
+
+
+def test_plan_deletions_keeps_excluded_paths():
+    manifest = {"alice/a.txt", "alice/gone.txt", "alice/node_modules/pkg/index.js"}
+    rules = SyncRules({"default": ["node_modules/"]})
+
+    assert plan_deletions(manifest, {"alice/a.txt"}, rules) == ["alice/gone.txt"]
+    assert plan_deletions(manifest, {"alice/a.txt"}) == ["alice/gone.txt", "alice/node_modules/pkg/index.js"]
+
+
+@pytest.mark.parametrize("deleted_count, max_percent", [(10, 10), (0, 0), (100, 100)])
+def test_delete_cap_allows_up_to_the_limit(deleted_count, max_percent):
+    manifest = {f"f{i}" for i in range(100)}
+
+    check_delete_cap([f"f{i}" for i in range(deleted_count)], manifest, max_percent)
+
+
+def test_delete_cap_refuses_mass_deletion():
+    manifest = {f"f{i}" for i in range(100)}
+
+    with pytest.raises(RuntimeError, match="would delete 11 of 100 files"):
+        check_delete_cap([f"f{i}" for i in range(11)], manifest, 10)
+
+
+def test_delete_cap_ignores_an_empty_manifest():
+    check_delete_cap([], set(), 10)
+
+
+def test_delete_paths_removes_directories_gone_from_the_source(tmp_path):
+    source_dir = str(tmp_path / "source")
+    target_dir = str(tmp_path / "target")
+    write(source_dir, "alice/kept/other.txt")
+    write(target_dir, "alice/kept/a.txt", b"12345")
+    write(target_dir, "alice/kept/other.txt")
+    write(target_dir, "alice/gone/deep/b.txt", b"123")
+    os.makedirs(os.path.join(source_dir, "alice", "empty"))
+    write(target_dir, "alice/empty/c.txt")
+
+    deletions = ["alice/kept/a.txt", "alice/gone/deep/b.txt", "alice/empty/c.txt", "alice/missing.txt"]
+
+    deleted = delete_paths(source_dir, target_dir, deletions)
+
+    assert deleted == (3, 9)
+    # empty/ still exists in the source, gone/ and gone/deep/ don't
+    assert sorted(os.listdir(os.path.join(target_dir, "alice"))) == ["empty", "kept"]
+    assert os.listdir(os.path.join(target_dir, "alice", "kept")) == ["other.txt"]
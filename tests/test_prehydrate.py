@@ -0,0 +1,93 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import shutil
+
+import pytest
+
+from prehydrate import (
+    PREHYDRATED_DIR_NAME,
+    drop_archives,
+    invalidate_archives,
+    list_segment_state_files,
+    prehydrate_spaces,
+)
+from sync_rules import SyncRules
+
+USERS_INDEX = {
+    "users": {"alice": {"uid": os.getuid(), "gid": os.getgid(), "spaces": ["alice-space", "other-space"]}},
+    "spaces": {"alice-space": "alice", "other-space": "alice"},
+}
+
+
+@pytest.fixture
+def staged_target(tmp_path):
+    target_dir = str(tmp_path)
+    for space in USERS_INDEX["spaces"]:
+        os.makedirs(os.path.join(target_dir, "space_ebs_backup", space, "src"))
+        with open(os.path.join(target_dir, "space_ebs_backup", space, "src", "main.py"), "w") as f:
+            f.write(space)
+    staged = prehydrate_spaces(target_dir, USERS_INDEX, workers=2)
+    assert sorted(staged) == ["alice-space", "other-space"]
+    return target_dir
+
+
+def staged_spaces(target_dir):
+    names = os.listdir(os.path.join(target_dir, ".sagemaker-dr", PREHYDRATED_DIR_NAME))
+    return sorted(name.split(".tar.")[0] for name in names)
+
+
+def test_sync_drops_the_archives_of_the_spaces_it_writes(staged_target):
+    paths = ["alice/notebook.ipynb", "space_ebs_backup/alice-space/src/main.py", "space_ebs_backup/alice-space/new"]
+    assert list(invalidate_archives(staged_target, iter(paths))) == paths
+    assert staged_spaces(staged_target) == ["other-space"]
+
+
+def test_archive_is_dropped_before_the_path_is_passed_on(staged_target):
+    paths = invalidate_archives(staged_target, iter(["space_ebs_backup/other-space/src/main.py"]))
+    next(paths)
+    assert staged_spaces(staged_target) == ["alice-space"]
+
+
+def test_drop_every_archive(staged_target):
+    drop_archives(staged_target)
+    assert staged_spaces(staged_target) == []
+    # nothing staged yet is not an error
+    shutil.rmtree(os.path.join(staged_target, ".sagemaker-dr"))
+    drop_archives(staged_target)
+
+
+def test_segment_state_files_are_listed_for_every_archive_backup(tmp_path):
+    # index.tsv and last-backup change in place, a full sync with --ignore-existing would never refresh them
+    for space in ("alice-space", "bob-space"):
+        segment_dir = os.path.join(str(tmp_path), "space_ebs_backup", space, "segments")
+        os.makedirs(segment_dir)
+        for name in ("index.tsv", "last-backup", "1700000000-0000.tar.zst"):
+            open(os.path.join(segment_dir, name), "w").close()
+    os.makedirs(os.path.join(str(tmp_path), "space_ebs_backup", "files-space", "src"))
+
+    assert list(list_segment_state_files(str(tmp_path))) == [
+        "space_ebs_backup/alice-space/segments/index.tsv",
+        "space_ebs_backup/alice-space/segments/last-backup",
+        "space_ebs_backup/bob-space/segments/index.tsv",
+        "space_ebs_backup/bob-space/segments/last-backup",
+    ]
+    rules = SyncRules({"default": ["segments/"], "spaces": {}})
+    assert list(list_segment_state_files(str(tmp_path), rules)) == []
+    assert list(list_segment_state_files(os.path.join(str(tmp_path), "missing"))) == []
@@ -0,0 +1,66 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+import qos
+from qos import FileRateLimiter, rsync_bwlimit_args
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(qos.time, "sleep", calls.append)
+    return calls
+
+
+def test_rsync_bwlimit_args_converts_mibps_to_kibps():
+    assert rsync_bwlimit_args("2.5") == ["--bwlimit=2560"]
+    assert rsync_bwlimit_args(None) == []
+    assert rsync_bwlimit_args("") == []
+
+
+def test_batches_hold_ten_seconds_of_files():
+    limiter = FileRateLimiter("2", "/unused")
+    assert [len(batch) for batch in limiter.batches(str(i) for i in range(45))] == [20, 20, 5]
+
+
+def test_wait_sleeps_off_the_remaining_budget(sleeps):
+    limiter = FileRateLimiter("10", "/unused")
+    limiter.wait(100, 4)
+    limiter.wait(100, 12)
+    assert sleeps == [6]
+
+
+def test_slow_target_halves_the_rate_down_to_the_floor_and_recovers(sleeps, monkeypatch):
+    limiter = FileRateLimiter("64", "/unused", latency_limit_ms="50")
+    latencies = iter([0.2] * 6 + [0.01] * 20)
+    monkeypatch.setattr(qos, "probe_latency", lambda target_dir: next(latencies))
+    rates = []
+    for _ in range(6):
+        limiter.wait(0, 0)
+        rates.append(limiter.rate)
+    assert rates == [32, 16, 8, 4, 4, 4]
+    for _ in range(20):
+        limiter.wait(0, 0)
+    assert limiter.rate == 64
+
+
+def test_probe_latency_writes_into_the_state_directory(tmp_path):
+    assert qos.probe_latency(str(tmp_path)) >= 0
+    assert (tmp_path / ".sagemaker-dr" / "qos-probe").exists()
@@ -0,0 +1,81 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from ecs_dr_recovery.recovery_state_machine import recovery_state_machine_definition
+
+DOMAINS = [{"name": "/SagemakerDomain", "target_efs_id": "fs-0b000000000000000"}]
+
+
+@pytest.fixture
+def definition():
+    return recovery_state_machine_definition(
+        DOMAINS,
+        "arn:aws:ecs:us-east-2:111111111111:cluster/SagemakerDomainDrTaskCluster",
+        "arn:aws:lambda:us-east-2:111111111111:function:config-efs-replica-network-lambda-function",
+        "arn:aws:states:us-east-2:111111111111:stateMachine:EfsThroughputRestore",
+    )
+
+
+@pytest.fixture
+def iterator_states(definition):
+    return definition["States"]["Recover Domains"]["ItemProcessor"]["States"]
+
+
+def catch_target(state):
+    return next(catcher["Next"] for catcher in state["Catch"] if "States.ALL" in catcher["ErrorEquals"])
+
+
+@pytest.mark.parametrize("boost_state", ["Boost To Elastic Throughput", "Boost To Provisioned Throughput"])
+def test_throughput_restore_is_scheduled_right_after_the_boost(iterator_states, boost_state):
+    assert iterator_states[boost_state]["Next"] == "Schedule Throughput Restore"
+    assert iterator_states["Schedule Throughput Restore"]["Next"] == "Config EFS Mount Target"
+
+
+def test_network_config_failure_fails_only_its_domain(iterator_states):
+    network_state = iterator_states["Config EFS Mount Target"]
+    assert network_state["Catch"][0]["ResultPath"] == "$.sync_error"
+    sync_result = iterator_states[catch_target(network_state)]
+    assert sync_result["Choices"][0] == {"Variable": "$.sync_error", "IsPresent": True, "Next": "Domain Sync Failed"}
+    assert iterator_states["Domain Sync Failed"]["Type"] == "Pass"
+
+
+def test_every_task_failure_ends_in_a_domain_result(iterator_states):
+    # an uncaught error fails the Map and cancels the recoveries of the other domains
+    for name, state in iterator_states.items():
+        if state["Type"] == "Task":
+            assert any("States.ALL" in catcher["ErrorEquals"] for catcher in state.get("Catch", [])), name
+        if state.get("End"):
+            assert state["Type"] == "Pass", name
+        assert state["Type"] not in ("Fail", "Succeed"), name
+    targets = {catch_target(state) for state in iterator_states.values() if state["Type"] == "Task"}
+    assert targets <= set(iterator_states)
+
+
+def test_control_plane_retries_only_cover_throttling(iterator_states):
+    # generic service errors such as ECS.AmazonECSException are real failures and go to the Catch
+    for name, state in iterator_states.items():
+        for retrier in state.get("Retry", []):
+            ecs_errors = [error for error in retrier["ErrorEquals"] if error.startswith("ECS.")]
+            assert ecs_errors in ([], ["ECS.ThrottlingException"]), name
+
+
+def test_manual_executions_run_at_full_speed(definition):
+    # only the active-active schedule passes {"qos": "background"}
+    assert definition["States"]["Apply Default Input"]["Result"]["qos"] == "full"
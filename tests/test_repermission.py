@@ -0,0 +1,167 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import time
+import types
+
+import pytest
+
+from conftest import load_lambda
+from repermission import (
+    acquire_job_lock,
+    checkpoint_path,
+    job_lock_path,
+    load_checkpoint,
+    release_job_lock,
+    run_job,
+    start_job,
+)
+
+NEW_UID = NEW_GID = 20002
+
+
+def write_tree(root, paths):
+    for relative_path in paths:
+        path = os.path.join(root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+
+def owners(root):
+    found = set()
+    for dir_path, _, file_names in os.walk(root):
+        for path in [dir_path] + [os.path.join(dir_path, name) for name in file_names]:
+            stat_info = os.lstat(path)
+            found.add((stat_info.st_uid, stat_info.st_gid))
+    return found
+
+
+@pytest.fixture
+def efs_root(tmp_path):
+    if os.geteuid() != 0:
+        pytest.skip("changing owners needs root")
+    write_tree(str(tmp_path), ["alice/a/b/f", "alice/top", "space_ebs_backup/alice-space/src/main.py"])
+    return str(tmp_path)
+
+
+def test_job_reowns_every_root(efs_root):
+    start_job(efs_root, "alice", NEW_UID, NEW_GID, ["alice", "space_ebs_backup/alice-space", "missing"])
+    job = run_job(efs_root, "alice", workers=4)
+
+    assert job["pending"] == [] and job["errors"] == 0
+    assert owners(os.path.join(efs_root, "alice")) == {(NEW_UID, NEW_GID)}
+    assert owners(os.path.join(efs_root, "space_ebs_backup", "alice-space")) == {(NEW_UID, NEW_GID)}
+    assert not os.path.exists(checkpoint_path(efs_root, "alice"))
+
+
+def test_job_past_its_deadline_resumes_from_the_checkpoint(efs_root):
+    start_job(efs_root, "alice", NEW_UID, NEW_GID, ["alice"])
+    job = run_job(efs_root, "alice", workers=4, deadline=time.time() - 1)
+
+    assert job["pending"] == ["alice"]
+    assert load_checkpoint(efs_root, "alice")["pending"] == ["alice"]
+    job = run_job(efs_root, "alice", workers=4)
+    assert job["pending"] == []
+    assert owners(os.path.join(efs_root, "alice")) == {(NEW_UID, NEW_GID)}
+
+
+@pytest.fixture
+def user_directory_lambda(efs_root, monkeypatch):
+    module = load_lambda("sagemaker_domain_dr/create_user_directory_lambda/create_user_directory.py")
+    monkeypatch.setattr(module, "MOUNT_POINT", efs_root)
+    monkeypatch.setattr(module, "USERS_INDEX", {
+        "users": {"alice": {"uid": NEW_UID, "gid": NEW_GID, "spaces": ["alice-space"]}},
+        "uids": {str(NEW_UID): "alice"},
+        "spaces": {"alice-space": "alice"},
+    })
+    return module
+
+
+def update_event(uid, gid):
+    return {"detail": {"requestParameters": {
+        "userProfileName": "alice",
+        "userSettings": {"customPosixUserConfig": {"uid": uid, "gid": gid}},
+    }}}
+
+
+def lambda_context():
+    return types.SimpleNamespace(get_remaining_time_in_millis=lambda: 900 * 1000)
+
+
+def test_update_with_a_new_identity_reowns_the_user(user_directory_lambda, efs_root):
+    job = user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context())
+
+    assert job["changed"] > 0
+    assert owners(os.path.join(efs_root, "space_ebs_backup", "alice-space")) == {(NEW_UID, NEW_GID)}
+
+
+def test_update_with_an_unchanged_identity_does_not_walk(user_directory_lambda, efs_root, monkeypatch):
+    user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context())
+    monkeypatch.setattr(user_directory_lambda, "run_job", lambda *args: pytest.fail("walked an unchanged tree"))
+
+    assert user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context()) is None
+
+
+def test_update_resumes_a_pending_job(user_directory_lambda, efs_root):
+    start_job(efs_root, "alice", NEW_UID, NEW_GID, ["alice"])
+    run_job(efs_root, "alice", workers=1, deadline=time.time() - 1)
+
+    job = user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context())
+    assert job["pending"] == []
+    assert owners(os.path.join(efs_root, "alice")) == {(NEW_UID, NEW_GID)}
+
+
+def test_update_reowns_space_backups_behind_an_owned_user_directory(user_directory_lambda, efs_root):
+    # a job interrupted after the user directory: no checkpoint, but the space backup still has the old owner
+    os.chown(os.path.join(efs_root, "alice"), NEW_UID, NEW_GID)
+
+    job = user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context())
+
+    assert job is not None and job["pending"] == []
+    assert owners(os.path.join(efs_root, "space_ebs_backup", "alice-space")) == {(NEW_UID, NEW_GID)}
+
+
+def test_job_lock_is_exclusive_until_released_or_stale(tmp_path):
+    efs_root = str(tmp_path)
+    assert acquire_job_lock(efs_root, "alice")
+    assert not acquire_job_lock(efs_root, "alice")
+    assert acquire_job_lock(efs_root, "bob")
+    release_job_lock(efs_root, "alice")
+    assert acquire_job_lock(efs_root, "alice")
+    assert acquire_job_lock(efs_root, "alice", ttl_seconds=0)
+
+
+def test_update_leaves_a_running_job_to_its_runner(user_directory_lambda, efs_root, monkeypatch):
+    start_job(efs_root, "alice", NEW_UID, NEW_GID, ["alice"])
+    # the Fargate handoff holds the lock
+    with open(job_lock_path(efs_root, "alice"), "w") as f:
+        f.write('{"owner": "repermission-task"}')
+    monkeypatch.setattr(user_directory_lambda, "run_job", lambda *args: pytest.fail("walked a running job"))
+
+    assert user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context()) is None
+    with pytest.raises(RuntimeError, match="is running"):
+        user_directory_lambda.update_user_efs_owner(update_event(NEW_UID + 1, NEW_GID), lambda_context())
+    assert load_checkpoint(efs_root, "alice")["uid"] == NEW_UID
+    assert os.path.exists(job_lock_path(efs_root, "alice"))
+
+
+def test_update_releases_the_job_lock(user_directory_lambda, efs_root):
+    user_directory_lambda.update_user_efs_owner(update_event(NEW_UID, NEW_GID), lambda_context())
+
+    assert not os.path.exists(job_lock_path(efs_root, "alice"))
@@ -0,0 +1,86 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from conftest import load_lambda
+from schedules import alarm_period_seconds, rate_interval_seconds
+
+NOW = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def replication_monitor():
+    return load_lambda("sagemaker_domain_dr/replication_monitor_lambda/replication_monitor.py")
+
+
+def destination(file_system_id, region, status, last_replicated_at=None):
+    entry = {"FileSystemId": file_system_id, "Region": region, "Status": status}
+    if last_replicated_at:
+        entry["LastReplicatedTimestamp"] = last_replicated_at
+    return entry
+
+
+def test_lag_and_metrics_for_current_missing_and_error_replicas(replication_monitor):
+    efs = boto3.client("efs", region_name="us-east-1")
+    stubber = Stubber(efs)
+    stubber.add_response("describe_replication_configurations", {"Replications": [{
+        "SourceFileSystemId": "fs-source",
+        "SourceFileSystemRegion": "us-east-1",
+        "SourceFileSystemArn": "arn:aws:elasticfilesystem:us-east-1:111111111111:file-system/fs-source",
+        "OriginalSourceFileSystemArn": "arn:aws:elasticfilesystem:us-east-1:111111111111:file-system/fs-source",
+        "CreationTime": NOW - timedelta(days=1),
+        "Destinations": [
+            destination("fs-current", "us-west-2", "ENABLED", NOW - timedelta(minutes=10)),
+            destination("fs-missing", "eu-west-1", "ENABLED"),
+            destination("fs-error", "eu-central-1", "ERROR", NOW - timedelta(hours=2)),
+        ],
+    }]}, {"FileSystemId": "fs-source"})
+    with stubber:
+        measurements = replication_monitor.measure_replication_lag(efs, "fs-source", now=NOW)
+    assert [(m["destination_file_system_id"], m["lag_seconds"]) for m in measurements] == [
+        ("fs-current", 600), ("fs-missing", None), ("fs-error", 7200)]
+
+    data = replication_monitor.metric_data("fs-source", measurements)
+    values = {(d["MetricName"], d["Dimensions"][1]["Value"]): d["Value"] for d in data}
+    assert values == {
+        ("ReplicationHealthy", "us-west-2"): 1,
+        ("ReplicationLagSeconds", "us-west-2"): 600,
+        # no completed copy yet: unhealthy and no lag datapoint, the RPO alarm sees missing data
+        ("ReplicationHealthy", "eu-west-1"): 0,
+        ("ReplicationHealthy", "eu-central-1"): 0,
+        ("ReplicationLagSeconds", "eu-central-1"): 7200,
+    }
+    assert all(d["Dimensions"][0] == {"Name": "FileSystemId", "Value": "fs-source"} for d in data)
+
+
+def test_alarm_period_follows_the_rate_schedule():
+    assert rate_interval_seconds("rate(1 minute)") == 60
+    assert rate_interval_seconds("rate(2 hours)") == 7200
+    assert alarm_period_seconds("rate(15 minutes)", 2) == 900
+    assert alarm_period_seconds("rate(12 hours)", 2) == 12 * 3600
+
+
+@pytest.mark.parametrize("expression", ["cron(0/5 * * * ? *)", "rate(0 minutes)", "rate(5 mins)", "rate(13 hours)"])
+def test_alarm_period_rejects_schedules_it_cannot_follow(expression):
+    with pytest.raises(ValueError):
+        alarm_period_seconds(expression, 2)
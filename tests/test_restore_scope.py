@@ -0,0 +1,128 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+
+import pytest
+
+import main
+from restore_scope import (
+    list_changed_restore_files,
+    parse_restore_scope,
+    resolve_restore_roots,
+    restore_lock_name,
+    walk_restore_roots,
+)
+from sync_rules import SyncRules
+
+USERS_INDEX = {
+    "users": {"alice": {"uid": 20001, "gid": 20001, "spaces": ["alice-lab"]}, "bob": {"uid": 20002, "gid": 20002}},
+    "spaces": {"alice-lab": "alice"},
+}
+
+
+def write(root, relative_path, mtime=None):
+    path = os.path.join(root, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize("scope_json", ["", '{}', '{"users": [], "spaces": null}'])
+def test_empty_scope_restores_everything(scope_json):
+    assert parse_restore_scope(scope_json) is None
+
+
+def test_parse_restore_scope_fills_missing_keys():
+    assert parse_restore_scope('{"users": ["alice"]}') == {"users": ["alice"], "spaces": [], "paths": []}
+
+
+@pytest.mark.parametrize("scope_json", ['["alice"]', '{"user": ["alice"]}'])
+def test_parse_restore_scope_rejects_other_shapes(scope_json):
+    with pytest.raises(ValueError):
+        parse_restore_scope(scope_json)
+
+
+def test_resolve_restore_roots_drops_nested_roots():
+    scope = {"users": ["alice"], "spaces": ["alice-lab"], "paths": ["/alice/project/", "bob/data", "alice"]}
+
+    assert resolve_restore_roots(scope, USERS_INDEX) == ["alice", "bob/data", "space_ebs_backup/alice-lab"]
+
+
+def test_resolve_restore_roots_reports_every_error():
+    scope = {"users": ["carol"], "spaces": ["carol-lab"], "paths": ["../etc", ".sagemaker-dr", "shared/data"]}
+
+    with pytest.raises(ValueError) as error:
+        resolve_restore_roots(scope, USERS_INDEX)
+
+    message = str(error.value)
+    assert "user 'carol'" in message
+    assert "space 'carol-lab'" in message
+    assert "path '../etc'" in message
+    assert "path '.sagemaker-dr'" in message
+    assert "path 'shared/data'" in message
+
+
+def test_resolve_restore_roots_needs_the_users_index():
+    with pytest.raises(ValueError, match="users.yaml index"):
+        resolve_restore_roots({"users": ["alice"], "spaces": [], "paths": []}, None)
+
+
+def test_restore_lock_name_depends_on_the_roots():
+    assert restore_lock_name(["alice"]) == restore_lock_name(["alice"])
+    assert restore_lock_name(["alice"]) != restore_lock_name(["bob"])
+
+
+def test_walk_restore_roots(tmp_path):
+    source_dir = str(tmp_path)
+    write(source_dir, "alice/a.txt")
+    write(source_dir, "alice/__pycache__/a.pyc")
+    write(source_dir, "alice/.hidden")
+    write(source_dir, "bob/b.txt")
+    rules = SyncRules({"default": ["__pycache__/"]})
+
+    paths = list(walk_restore_roots(source_dir, ["alice", "carol"], rules))
+
+    assert paths == ["alice", "alice/a.txt"]
+
+
+def test_list_changed_restore_files_keeps_the_roots(tmp_path):
+    source_dir = str(tmp_path)
+    write(source_dir, "alice/old.txt", mtime=500)
+    write(source_dir, "alice/new.txt", mtime=2000)
+
+    paths = list(list_changed_restore_files(source_dir, ["alice"], 1000, use_ctime=False))
+
+    assert paths == ["alice", "alice/new.txt"]
+
+
+def test_domain_without_users_index_skips_a_targeted_restore(tmp_path, monkeypatch):
+    # only the domain deployed from this repository gets DR_USERS_INDEX_URL
+    monkeypatch.delenv("DR_USERS_INDEX_URL", raising=False)
+    monkeypatch.setattr(main, "TARGET_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "RESTORE_SCOPE", parse_restore_scope('{"users": ["alice"]}'))
+    calls = []
+    for name in ("sync_efs", "sync_efs_restore", "sync_efs_failback"):
+        monkeypatch.setattr(main, name, lambda *args, name=name: calls.append(name))
+    with pytest.raises(SystemExit) as exit_info:
+        main.main()
+    assert exit_info.value.code == 0
+    assert calls == []
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,84 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from sync_rules import RuleSet, SyncRules, load_sync_rules
+
+
+@pytest.mark.parametrize("pattern, relative_path, is_dir, excluded", [
+    # unanchored patterns match at any depth
+    ("*.pyc", "mod.pyc", False, True),
+    ("*.pyc", "pkg/sub/mod.pyc", False, True),
+    ("*.pyc", "mod.py", False, False),
+    # a leading or inner slash anchors the pattern at the root
+    ("/.cache/pip/", ".cache/pip", True, True),
+    ("/.cache/pip/", "project/.cache/pip", True, False),
+    ("data/raw", "data/raw", True, True),
+    ("data/raw", "project/data/raw", True, False),
+    # a trailing slash only matches directories
+    ("node_modules/", "web/node_modules", True, True),
+    ("node_modules/", "web/node_modules", False, False),
+    # ** spans directories, * and ? stay within one
+    ("**/logs", "a/b/logs", True, True),
+    ("logs/**", "logs/a/b.txt", False, True),
+    ("a/*/c", "a/b/c", False, True),
+    ("a/*/c", "a/b/x/c", False, False),
+    ("file?.txt", "file1.txt", False, True),
+    ("file?.txt", "file10.txt", False, False),
+    ("[!a]*.tmp", "b.tmp", False, True),
+    ("[!a]*.tmp", "a.tmp", False, False),
+])
+def test_rule_set_follows_gitignore(pattern, relative_path, is_dir, excluded):
+    assert RuleSet([pattern]).excluded(relative_path, is_dir) is excluded
+
+
+def test_last_matching_rule_wins():
+    rules = RuleSet(["*.log", "!keep.log", "keep.log"])
+
+    assert RuleSet(["*.log", "!keep.log"]).excluded("keep.log", False) is False
+    assert rules.excluded("keep.log", False) is True
+    assert rules.excluded("other.log", False) is True
+
+
+def test_no_rules_exclude_nothing():
+    assert RuleSet([]).excluded("anything", True) is False
+
+
+def test_user_rules_apply_to_their_directory_and_spaces():
+    rules = SyncRules({
+        "default": ["__pycache__/"],
+        "users": {"katherine": ["__pycache__/", "/scratch/"]},
+        "spaces": {"katherine-jupyterlab": "katherine"},
+    })
+
+    assert rules.excluded("katherine/scratch", True) is True
+    assert rules.excluded("natasha/scratch", True) is False
+    assert rules.excluded("natasha/src/__pycache__", True) is True
+    # space backups are matched relative to the space's home
+    assert rules.excluded("space_ebs_backup/katherine-jupyterlab/scratch", True) is True
+    assert rules.excluded("space_ebs_backup/natasha-jupyterlab/scratch", True) is False
+    assert rules.excluded("space_ebs_backup/natasha-jupyterlab/__pycache__", True) is True
+    # the backup and space directories themselves are never excluded
+    assert rules.excluded("space_ebs_backup", True) is False
+    assert rules.excluded("space_ebs_backup/katherine-jupyterlab", True) is False
+
+
+def test_load_sync_rules():
+    assert load_sync_rules("") is None
+    assert load_sync_rules('{"default": ["*.pyc"]}').excluded("a/b.pyc", False) is True
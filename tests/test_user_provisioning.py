@@ -0,0 +1,64 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from users_config import SpaceConfig, UserConfig
+
+# the module defines the CDK constructs next to the sharding
+pytest.importorskip("aws_cdk")
+from sagemaker_domain_dr.user_provisioning import MAX_RESOURCES_PER_SHARD, shard_users  # noqa: E402
+
+
+def make_users(count, spaces_per_user=2):
+    return [
+        UserConfig(
+            name=f"user{i}",
+            uid=20000 + i,
+            gid=20000 + i,
+            spaces=tuple(SpaceConfig(name=f"user{i}-space{j}", app_type="JupyterLab") for j in range(spaces_per_user)),
+        )
+        for i in range(count)
+    ]
+
+
+def shard_of(shards):
+    return {user.name: shard_index for shard_index, shard in enumerate(shards) for user in shard}
+
+
+def test_every_user_lands_in_one_shard():
+    users = make_users(100)
+
+    shards = shard_users(users, 4)
+
+    assert sorted(user.name for shard in shards for user in shard) == sorted(user.name for user in users)
+    assert all(shards)
+
+
+def test_adding_users_moves_nobody_else():
+    before = shard_of(shard_users(make_users(100), 4))
+    after = shard_of(shard_users(make_users(150), 4))
+
+    assert all(after[user_name] == shard_index for user_name, shard_index in before.items())
+
+
+def test_shard_over_the_resource_limit_fails():
+    users = make_users(MAX_RESOURCES_PER_SHARD // 3 + 1)
+
+    with pytest.raises(ValueError, match="increase USER_PROVISIONING_SHARDS"):
+        shard_users(users, 1)
@@ -0,0 +1,186 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from users_config import (
+    SYNC_RULES_BEGIN,
+    SYNC_RULES_END,
+    UsersConfigError,
+    compile_sync_rules,
+    lifecycle_config_content,
+    load_users_config,
+    parse_users_config,
+    render_script_settings,
+    render_sync_rules,
+    to_rsync_filter,
+)
+
+
+def users(**users_config):
+    return {"Users": users_config}
+
+
+def test_parse_users_config():
+    config = parse_users_config(users(
+        alice={"CustomPosix": "20001:20001", "Spaces": {"alice-lab": {"type": "JupyterLab"}}},
+        bob={"CustomPosix": "20002:20003", "SourcePosix": "1000:100"},
+    ))
+
+    assert config.users["alice"].spaces[0].app_type == "JupyterLab"
+    assert config.users_by_uid == {20001: "alice", 20002: "bob"}
+    assert config.space_owners == {"alice-lab": "alice"}
+    assert config.ownership_map() == {"uids": {"1000": 20002}, "gids": {"100": 20003}}
+    assert config.to_index() == {
+        "users": {
+            "alice": {"uid": 20001, "gid": 20001, "spaces": ["alice-lab"]},
+            "bob": {"uid": 20002, "gid": 20003, "spaces": []},
+        },
+        "uids": {"20001": "alice", "20002": "bob"},
+        "spaces": {"alice-lab": "alice"},
+        "ownership": {"uids": {"1000": 20002}, "gids": {"100": 20003}},
+    }
+
+
+def test_parse_users_config_reports_every_error():
+    with pytest.raises(UsersConfigError) as error:
+        parse_users_config({
+            "SyncRules": {"Exclude": "__pycache__/"},
+            "Users": {
+                "alice": {"CustomPosix": "20001:20001", "Spaces": {"lab": {"type": "RStudio"}}},
+                "bob": {"CustomPosix": "20001:20002", "Spaces": {"lab": {"type": "JupyterLab"}}},
+                "carol": {},
+                "dave_": {"CustomPosix": "1:1", "SourcePosix": "x"},
+            },
+        })
+
+    assert error.value.errors == [
+        "SyncRules: SyncRules Exclude must be a list of patterns",
+        "space lab: type must be one of JupyterLab, CodeEditor",
+        "user bob: uid 20001 is already used by alice",
+        "space lab: already defined for user alice",
+        "user carol: This solution requires POSIX configuration for Sagemaker UserProfile, "
+        "set CustomPosix to <uid>:<gid>",
+        "user dave_: not a valid SageMaker user profile name",
+        "user dave_: uid and gid must be between 10000 and 4000000",
+        "user dave_: SourcePosix must be <uid>:<gid>",
+    ]
+
+
+def test_shared_source_group_maps_to_one_group():
+    with pytest.raises(UsersConfigError, match="SourcePosix gid 100 already maps to 20001 for alice"):
+        parse_users_config(users(
+            alice={"CustomPosix": "20001:20001", "SourcePosix": "1000:100"},
+            bob={"CustomPosix": "20002:20002", "SourcePosix": "1001:100"},
+        ))
+
+
+def test_users_need_a_mapping():
+    with pytest.raises(UsersConfigError, match="Users must be a mapping"):
+        parse_users_config({"Users": []})
+
+
+def test_load_users_config(tmp_path):
+    users_path = tmp_path / "users.yaml"
+    users_path.write_text("Users:\n  alice:\n    CustomPosix: 20001:20001\n")
+
+    assert load_users_config(str(users_path)).users["alice"].uid == 20001
+
+
+def test_compile_sync_rules_extends_the_defaults_per_user():
+    config = parse_users_config({
+        "SyncRules": {"Exclude": ["__pycache__/"], "Include": ["keep/__pycache__/"]},
+        "Users": {
+            "alice": {"CustomPosix": "20001:20001"},
+            "bob": {
+                "CustomPosix": "20002:20002",
+                "SyncRules": {"Exclude": ["/scratch/"]},
+                "Spaces": {"bob-lab": {"type": "CodeEditor"}},
+            },
+        },
+    })
+
+    assert compile_sync_rules(config) == {
+        "default": ["__pycache__/", "!keep/__pycache__/"],
+        "users": {"bob": ["__pycache__/", "!keep/__pycache__/", "/scratch/"]},
+        "spaces": {"bob-lab": "bob"},
+    }
+
+
+def test_compile_sync_rules_without_rules():
+    config = parse_users_config(users(alice={"CustomPosix": "20001:20001"}))
+
+    assert compile_sync_rules(config) == {"default": [], "users": {}, "spaces": {}}
+
+
+def test_to_rsync_filter_reverses_the_order_and_anchors_inner_slashes():
+    assert to_rsync_filter(["*.pyc", "data/raw/", "/.cache/", "**/logs", "!data/raw/keep/"]) == [
+        "+ /data/raw/keep/",
+        "- **/logs",
+        "- /.cache/",
+        "- /data/raw/",
+        "- *.pyc",
+    ]
+
+
+def test_render_sync_rules_shares_an_arm_between_identical_rules():
+    script = f"before\n{SYNC_RULES_BEGIN}\n# placeholder\n{SYNC_RULES_END}\nafter\n"
+    sync_rules = {
+        "default": ["*.pyc"],
+        "users": {"bob": ["*.pyc", "/scratch/"], "carol": ["*.pyc", "/scratch/"]},
+        "spaces": {"bob-lab": "bob", "carol-lab": "carol"},
+    }
+
+    rendered = render_sync_rules(script, sync_rules)
+
+    assert rendered == (
+        "before\n"
+        'case "${SAGEMAKER_SPACE_NAME}" in\n'
+        "    bob-lab|carol-lab)\n"
+        "        cat >> ${sync_filter} <<'SYNC_RULES'\n- /scratch/\n- *.pyc\nSYNC_RULES\n"
+        "        ;;\n"
+        "    *)\n"
+        "        cat >> ${sync_filter} <<'SYNC_RULES'\n- *.pyc\nSYNC_RULES\n"
+        "        ;;\n"
+        "esac\n"
+        "after\n"
+    )
+
+
+def test_lifecycle_config_over_the_cloudformation_limit_fails_the_synth(tmp_path):
+    script_path = tmp_path / "backup.sh"
+    script_path.write_text(f"#!/bin/bash\n{SYNC_RULES_BEGIN}\n{SYNC_RULES_END}\n")
+    users_path = tmp_path / "users.yaml"
+    users_path.write_text("Users:\n" + "".join(
+        f"  user{i}:\n    CustomPosix: {20000 + i}:{20000 + i}\n"
+        f"    SyncRules:\n      Exclude: [/scratch{i}/]\n    Spaces:\n      user{i}-lab: {{type: JupyterLab}}\n"
+        for i in range(300)
+    ))
+
+    with pytest.raises(ValueError, match="lifecycle config content limit is 16384"):
+        lifecycle_config_content(str(script_path), render_rules=True, users_path=str(users_path))
+
+
+def test_render_script_settings():
+    script = "#!/bin/bash\nbackup_format=files\nmax_kbps=0\necho backup_format=files\n"
+
+    rendered = render_script_settings(script, (("backup_format", "archive"), ("max_kbps", 1024)))
+
+    assert rendered == "#!/bin/bash\nbackup_format=archive\nmax_kbps=1024\necho backup_format=files\n"
+    with pytest.raises(ValueError, match="no segment_files= setting"):
+        render_script_settings(script, (("segment_files", 10),))
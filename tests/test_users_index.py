@@ -0,0 +1,53 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import pytest
+
+from users_index import load_users_index, owner_of, rsync_ownership_args
+
+USERS_INDEX = {
+    "users": {"alice": {"uid": 20001, "gid": 20001}},
+    "spaces": {"alice-lab": "alice"},
+    "ownership": {"uids": {"1000": 20001}, "gids": {"100": 20001, "101": 20002}},
+}
+
+
+@pytest.mark.parametrize("relative_path, owner", [
+    ("alice", "alice"),
+    ("/alice/project/a.txt", "alice"),
+    ("space_ebs_backup/alice-lab/a.txt", "alice"),
+    ("space_ebs_backup/other-lab", None),
+    ("space_ebs_backup", None),
+    ("carol/a.txt", None),
+])
+def test_owner_of(relative_path, owner):
+    assert owner_of(USERS_INDEX, relative_path) == owner
+
+
+def test_owner_of_without_an_index():
+    assert owner_of(None, "alice") is None
+
+
+def test_load_users_index_is_optional():
+    assert load_users_index("") is None
+
+
+def test_rsync_ownership_args():
+    assert rsync_ownership_args(USERS_INDEX) == ["--usermap=1000:20001", "--groupmap=100:20001,101:20002"]
+    assert rsync_ownership_args({"ownership": {"uids": {}, "gids": {}}}) == []
+    assert rsync_ownership_args(None) == []
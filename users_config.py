@@ -0,0 +1,316 @@
+"""
+ Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+ SPDX-License-Identifier: MIT-0
+
+ Permission is hereby granted, free of charge, to any person obtaining a copy of this
+ software and associated documentation files (the "Software"), to deal in the Software
+ without restriction, including without limitation the rights to use, copy, modify,
+ merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+ permit persons to whom the Software is furnished to do so.
+
+ THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+ INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+ PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+ HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+ OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+ SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import base64
+import functools
+import json
+import os
+import re
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+try:
+    # libyaml parses large users.yaml files several times faster
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+USERS_FILE = os.environ.get("SAGEMAKER_DR_USERS_FILE", "users.yaml")
+USERS_INDEX_FILE_NAME = "users-index.json"
+SYNC_RULES_BEGIN = "# SYNC_RULES_BEGIN"
+SYNC_RULES_END = "# SYNC_RULES_END"
+SPACE_APP_TYPES = ("JupyterLab", "CodeEditor")
+# CloudFormation limit of StudioLifecycleConfigContent, the base64 encoded script
+MAX_LIFECYCLE_CONFIG_CONTENT = 16384
+# SageMaker user profile and space names
+NAME_PATTERN = re.compile(r"^[a-zA-Z0-9](-*[a-zA-Z0-9]){0,62}$")
+# uid/gid ranges accepted by SageMaker CustomPosixUserConfig
+MIN_POSIX_ID = 10000
+MAX_POSIX_ID = 4000000
+
+
+class UsersConfigError(ValueError):
+    def __init__(self, path: str, errors: List[str]) -> None:
+        self.errors = errors
+        super().__init__(f"{path} has {len(errors)} error(s):\n" + "\n".join(f"  - {e}" for e in errors))
+
+
+@dataclass(frozen=True)
+class SpaceConfig:
+    name: str
+    app_type: str
+
+
+@dataclass(frozen=True)
+class UserConfig:
+    name: str
+    uid: int
+    gid: int
+    spaces: Tuple[SpaceConfig, ...] = ()
+    sync_rules: Optional[dict] = None
+    # owner of the user's files in the primary EFS when it differs from uid:gid
+    source_uid: Optional[int] = None
+    source_gid: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class UsersConfig:
+    users: Dict[str, UserConfig]
+    sync_rules: Optional[dict] = None
+    users_by_uid: Dict[int, str] = field(default_factory=dict)
+    space_owners: Dict[str, str] = field(default_factory=dict)
+
+    def to_index(self) -> dict:
+        """JSON-serializable index for the Lambdas and the recovery container."""
+        return {
+            "users": {
+                user.name: {"uid": user.uid, "gid": user.gid, "spaces": [space.name for space in user.spaces]}
+                for user in self.users.values()
+            },
+            "uids": {str(uid): user_name for uid, user_name in self.users_by_uid.items()},
+            "spaces": dict(self.space_owners),
+            "ownership": self.ownership_map(),
+        }
+
+    def ownership_map(self) -> dict:
+        """Source -> users.yaml uid and gid for users whose SourcePosix differs, applied by the recovery sync."""
+        uids = {}
+        gids = {}
+        for user in self.users.values():
+            if user.source_uid is not None and user.source_uid != user.uid:
+                uids[str(user.source_uid)] = user.uid
+            if user.source_gid is not None and user.source_gid != user.gid:
+                gids[str(user.source_gid)] = user.gid
+        return {"uids": uids, "gids": gids}
+
+
+def parse_sync_rules(owner: str, raw, errors: List[str]) -> Optional[dict]:
+    if raw is None:
+        return None
+    if not isinstance(raw, dict) or set(raw) - {"Exclude", "Include"}:
+        errors.append(f"{owner}: SyncRules only takes Exclude and Include lists")
+        return None
+    for key in ("Exclude", "Include"):
+        patterns = raw.get(key) or []
+        if not isinstance(patterns, list) or not all(isinstance(p, str) and p for p in patterns):
+            errors.append(f"{owner}: SyncRules {key} must be a list of patterns")
+            return None
+    return raw
+
+
+def parse_users_config(raw, path: str = USERS_FILE) -> UsersConfig:
+    """Validate the whole users.yaml in one pass, reporting every error at once."""
+    errors = []
+    if not isinstance(raw, dict) or not isinstance(raw.get("Users"), dict) or not raw["Users"]:
+        raise UsersConfigError(path, ["Users must be a mapping of user profile names"])
+    sync_rules = parse_sync_rules("SyncRules", raw.get("SyncRules"), errors)
+    users = {}
+    users_by_uid = {}
+    space_owners = {}
+    source_uids = {}
+    source_gids = {}
+    for user_name, user_config in raw["Users"].items():
+        user_name = str(user_name)
+        if not NAME_PATTERN.match(user_name):
+            errors.append(f"user {user_name}: not a valid SageMaker user profile name")
+        user_config = user_config or {}
+        custom_posix = str(user_config.get("CustomPosix") or "")
+        match = re.fullmatch(r"(\d+):(\d+)", custom_posix)
+        if not match:
+            errors.append(
+                f"user {user_name}: This solution requires POSIX configuration for Sagemaker UserProfile, "
+                f"set CustomPosix to <uid>:<gid>"
+            )
+            continue
+        uid, gid = int(match.group(1)), int(match.group(2))
+        if not (MIN_POSIX_ID <= uid <= MAX_POSIX_ID and MIN_POSIX_ID <= gid <= MAX_POSIX_ID):
+            errors.append(f"user {user_name}: uid and gid must be between {MIN_POSIX_ID} and {MAX_POSIX_ID}")
+        if uid in users_by_uid:
+            errors.append(f"user {user_name}: uid {uid} is already used by {users_by_uid[uid]}")
+        else:
+            users_by_uid[uid] = user_name
+        source_uid = source_gid = None
+        if user_config.get("SourcePosix") is not None:
+            match = re.fullmatch(r"(\d+):(\d+)", str(user_config["SourcePosix"]))
+            if not match:
+                errors.append(f"user {user_name}: SourcePosix must be <uid>:<gid>")
+            else:
+                source_uid, source_gid = int(match.group(1)), int(match.group(2))
+                mapped_by = source_uids.setdefault(source_uid, user_name)
+                if mapped_by != user_name:
+                    errors.append(f"user {user_name}: SourcePosix uid {source_uid} is already used by {mapped_by}")
+                # a shared source group can only map to one group
+                mapped_gid, mapped_by = source_gids.setdefault(source_gid, (gid, user_name))
+                if mapped_gid != gid:
+                    errors.append(
+                        f"user {user_name}: SourcePosix gid {source_gid} already maps to {mapped_gid} for {mapped_by}"
+                    )
+        spaces = []
+        for space_name, space_config in (user_config.get("Spaces") or {}).items():
+            space_name = str(space_name)
+            app_type = (space_config or {}).get("type")
+            if not NAME_PATTERN.match(space_name):
+                errors.append(f"space {space_name}: not a valid SageMaker space name")
+            if app_type not in SPACE_APP_TYPES:
+                errors.append(f"space {space_name}: type must be one of {', '.join(SPACE_APP_TYPES)}")
+            if space_name in space_owners:
+                errors.append(f"space {space_name}: already defined for user {space_owners[space_name]}")
+                continue
+            space_owners[space_name] = user_name
+            spaces.append(SpaceConfig(name=space_name, app_type=app_type))
+        users[user_name] = UserConfig(
+            name=user_name,
+            uid=uid,
+            gid=gid,
+            spaces=tuple(spaces),
+            sync_rules=parse_sync_rules(f"user {user_name}", user_config.get("SyncRules"), errors),
+            source_uid=source_uid,
+            source_gid=source_gid,
+        )
+    if errors:
+        raise UsersConfigError(path, errors)
+    return UsersConfig(users=users, sync_rules=sync_rules, users_by_uid=users_by_uid, space_owners=space_owners)
+
+
+# every stack in app.py shares one parse of users.yaml and one copy of each script payload,
+# callers must treat the returned values as read-only
+@functools.lru_cache(maxsize=None)
+def load_users_config(path=USERS_FILE) -> UsersConfig:
+    with open(path, "r") as f:
+        return parse_users_config(yaml.load(f, Loader=SafeLoader), path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_sync_rules(path=USERS_FILE):
+    return compile_sync_rules(load_users_config(path))
+
+
+@functools.lru_cache(maxsize=None)
+def lifecycle_config_content(script_path, render_rules=False, users_path=USERS_FILE, settings=()):
+    # settings are (name, value) pairs so the call stays cacheable
+    with open(script_path) as f:
+        script = f.read()
+    if render_rules:
+        script = render_sync_rules(script, load_sync_rules(users_path))
+    if settings:
+        script = render_script_settings(script, settings)
+    content = base64.b64encode(script.encode("utf-8")).decode("utf-8")
+    if len(content) > MAX_LIFECYCLE_CONFIG_CONTENT:
+        # fail the synth instead of the deployment
+        raise ValueError(
+            f"{script_path} is {len(content)} characters after base64 encoding, the lifecycle config content limit is "
+            f"{MAX_LIFECYCLE_CONFIG_CONTENT}. Move per-user SyncRules in {users_path} to the domain-level SyncRules "
+            f"or give users the same rules, users with identical rules share one entry"
+        )
+    return content
+
+
+def write_users_index(output_path, path=USERS_FILE):
+    with open(output_path, "w") as f:
+        json.dump(load_users_config(path).to_index(), f, separators=(",", ":"))
+    return output_path
+
+
+@functools.lru_cache(maxsize=None)
+def users_index_asset_dir(path=USERS_FILE):
+    # asset directory holding only the index, the asset hash follows its content
+    asset_dir = tempfile.mkdtemp(prefix="sagemaker-dr-users-index-")
+    write_users_index(os.path.join(asset_dir, USERS_INDEX_FILE_NAME), path)
+    return asset_dir
+
+
+def sync_rule_patterns(sync_rules):
+    # includes come last so they win over excludes, gitignore evaluates the last matching rule
+    sync_rules = sync_rules or {}
+    return list(sync_rules.get("Exclude") or []) + [f"!{p}" for p in sync_rules.get("Include") or []]
+
+
+def compile_sync_rules(users_config: UsersConfig):
+    default = sync_rule_patterns(users_config.sync_rules)
+    users = {}
+    spaces = {}
+    for user in users_config.users.values():
+        if not user.sync_rules:
+            continue
+        users[user.name] = default + sync_rule_patterns(user.sync_rules)
+        for space in user.spaces:
+            spaces[space.name] = user.name
+    return {"default": default, "users": users, "spaces": spaces}
+
+
+def to_rsync_filter(patterns):
+    # rsync stops at the first matching rule, gitignore at the last one
+    lines = []
+    for pattern in reversed(patterns):
+        action = "+" if pattern.startswith("!") else "-"
+        pattern = pattern.lstrip("!")
+        # a gitignore pattern with an inner slash is anchored, rsync would match it at any depth
+        if "/" in pattern.rstrip("/") and not pattern.startswith(("/", "**/")):
+            pattern = f"/{pattern}"
+        lines.append(f"{action} {pattern}")
+    return lines
+
+
+def render_sync_rules(script, sync_rules, filter_variable="sync_filter"):
+    """Replace the SYNC_RULES block of a lifecycle script with the rsync filter rules for each space."""
+    def append_filter(patterns, indent):
+        rules = "\n".join(to_rsync_filter(patterns))
+        return f"{indent}cat >> ${{{filter_variable}}} <<'SYNC_RULES'\n{rules}\nSYNC_RULES\n"
+
+    # one case arm per distinct rule list, users sharing their rules don't grow the script by a filter each
+    spaces_by_patterns = {}
+    for space_name, user_name in sync_rules["spaces"].items():
+        spaces_by_patterns.setdefault(tuple(sync_rules["users"][user_name]), []).append(space_name)
+    block = 'case "${SAGEMAKER_SPACE_NAME}" in\n'
+    for patterns, space_names in spaces_by_patterns.items():
+        block += f"    {'|'.join(space_names)})\n"
+        block += append_filter(list(patterns), " " * 8)
+        block += "        ;;\n"
+    block += "    *)\n"
+    block += append_filter(sync_rules["default"], " " * 8)
+    block += "        ;;\n"
+    block += "esac\n"
+    begin = script.index(SYNC_RULES_BEGIN)
+    end = script.index(SYNC_RULES_END) + len(SYNC_RULES_END)
+    return script[:begin] + block.rstrip("\n") + script[end:]
+
+
+def render_script_settings(script, settings):
+    """Replace the `name=value` default of each (name, value) setting at the start of a line in a lifecycle script."""
+    for name, value in settings:
+        pattern = re.compile(rf"^{re.escape(name)}=.*$", re.MULTILINE)
+        if not pattern.search(script):
+            raise ValueError(f"Lifecycle script has no {name}= setting")
+        script = pattern.sub(lambda _: f"{name}={value}", script, count=1)
+    return script
+
+
+if __name__ == "__main__":
+    # validate users.yaml without a synth: python users_config.py [users.yaml] [index output path]
+    users_path = sys.argv[1] if len(sys.argv) > 1 else USERS_FILE
+    try:
+        users_config = load_users_config(users_path)
+    except UsersConfigError as e:
+        sys.exit(str(e))
+    if len(sys.argv) > 2:
+        write_users_index(sys.argv[2], users_path)
+    print(f"{users_path}: {len(users_config.users)} users, {len(users_config.space_owners)} spaces")